@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The benchmarks: every processor of martinize2 and martinize2 itself, on
+synthetic systems of growing size.
+
+A benchmark is a :class:`Case`. Before every round, its `setup` function
+gives the input for a size; only its `run` function on that input is timed.
+"""
+
+import collections
+import functools
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import vermouth
+from vermouth.memory import system_footprint
+from vermouth.dssp.dssp import AnnotateDSSP, AnnotateMartiniSecondaryStructures
+
+from . import synthetic
+
+# name: the name of the benchmark, as "<system>/<step>".
+# sizes, quick_sizes: the sizes to run with and without --quick.
+# unit: what the size counts.
+# max_exponent: the highest scaling exponent accepted by --check.
+# setup: callable that gives a fresh input for a size.
+# run: callable that runs the step on the input, and returns the number of
+#   atoms processed.
+# footprint: callable that gives the footprint, as given by
+#   vermouth.memory.system_footprint, of the input once run; or None if the
+#   memory of the step cannot be measured.
+# max_peak, max_footprint: the highest memory, in bytes per atom processed,
+#   accepted by --check for the peak of the allocations during the run and
+#   for the footprint; None for no budget.
+Case = collections.namedtuple(
+    'Case', 'name sizes quick_sizes unit max_exponent setup run '
+            'footprint max_peak max_footprint'
+)
+
+MARTINIZE2_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                               'bin', 'martinize2')
+
+# Each system: its generator, its sizes, its quick sizes, and its unit.
+SYSTEMS = collections.OrderedDict((
+    ('polypeptide', (synthetic.polypeptide, (10, 100, 1000, 10000),
+                     (10, 30, 100), 'residues')),
+    ('complex', (synthetic.protein_complex, (1, 4, 16, 64),
+                 (1, 2, 4), 'chains')),
+    ('bilayer', (synthetic.bilayer, (128, 512, 2048, 8192),
+                 (32, 64, 128), 'lipids')),
+))
+
+# Most steps should scale linearly with the number of atoms; the margin
+# absorbs the noise of the fit and the n log n steps.
+MAX_EXPONENT = 1.3
+# Memory budgets in bytes per atom processed. They are loose: they catch a
+# step that starts keeping or copying much more per atom, not a few percents.
+# Most of the footprint of a coarse grained system is the atomistic
+# subgraph kept on every bead.
+MAX_PEAK_PER_ATOM = 64 * 1024
+MAX_FOOTPRINT_PER_ATOM = 16 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def _force_fields():
+    directory = tempfile.mkdtemp(prefix='vermouth-benchmark-ff-')
+    ff_dir, map_dir = synthetic.write_lipid_force_field(directory)
+    force_fields, mappings = synthetic.load_force_fields(ff_dir, map_dir)
+    return directory, force_fields, mappings
+
+
+def _steps():
+    """
+    The processors of martinize2, in order, with the options of its defaults
+    and of -dssp builtin and -elastic.
+    """
+    _, force_fields, mappings = _force_fields()
+    return (
+        ('MakeBonds', vermouth.MakeBonds),
+        ('RepairGraph', functools.partial(
+            vermouth.RepairGraph, delete_unknown=True, include_graph=False)),
+        ('CanonicalizeModifications', vermouth.CanonicalizeModifications),
+        ('AttachMass', functools.partial(vermouth.AttachMass, attribute='mass')),
+        ('AnnotateDSSP', functools.partial(AnnotateDSSP, executable='builtin', savedir=None)),
+        ('AnnotateMartiniSecondaryStructures', AnnotateMartiniSecondaryStructures),
+        ('DoMapping', functools.partial(
+            vermouth.DoMapping, mappings=mappings, to_ff=force_fields['martini22'],
+            delete_unknown=True, attribute_keep=('cgsecstruct',))),
+        ('DoAverageBead', functools.partial(vermouth.DoAverageBead,
+                                            ignore_missing_graphs=True)),
+        ('ApplyBlocks', vermouth.ApplyBlocks),
+        ('DoLinks', vermouth.DoLinks),
+        ('LocateChargeDummies', vermouth.LocateChargeDummies),
+        ('ApplyRubberBand', functools.partial(
+            vermouth.ApplyRubberBand, lower_bound=0.5, upper_bound=0.9,
+            decay_factor=0, decay_power=0, base_constant=500, minimum_force=0,
+            selector=vermouth.selectors.select_backbone)),
+    )
+
+
+def _count_atoms(system):
+    return sum(len(molecule) for molecule in system.molecules)
+
+
+@functools.lru_cache(maxsize=None)
+def _input_system(system_name, size):
+    """
+    The system as read from a structure file: all the atoms in one molecule,
+    without edges.
+    """
+    generator = SYSTEMS[system_name][0]
+    built = generator(size)
+    if isinstance(built, vermouth.Molecule):
+        system = vermouth.System()
+        system.add_molecule(built)
+        built = system
+    return synthetic.merge_system(built)
+
+
+# Enough to keep the inputs of the previous step for every size.
+@functools.lru_cache(maxsize=5)
+def _prepared(system_name, size, step_index):
+    """
+    The system given to the step at `step_index` of :func:`_steps`.
+    """
+    if step_index == 0:
+        system = _input_system(system_name, size).copy()
+        system.force_field = _force_fields()[1]['universal']
+        return system
+    system = _prepared(system_name, size, step_index - 1).copy()
+    _steps()[step_index - 1][1]().run_system(system)
+    return system
+
+
+def _setup_step(system_name, step_index, size):
+    return _prepared(system_name, size, step_index).copy()
+
+
+def _run_step(step_index, system):
+    _steps()[step_index][1]().run_system(system)
+    return _count_atoms(system)
+
+
+@functools.lru_cache(maxsize=None)
+def _write_input(system_name, size):
+    """
+    Write the structure given to martinize2, and return the working
+    directory, the arguments, and the number of atoms.
+    """
+    directory, _, _ = _force_fields()
+    workdir = tempfile.mkdtemp(prefix='vermouth-benchmark-', dir=directory)
+    path = os.path.join(workdir, 'input.gro')
+    synthetic.write_structure(_input_system(system_name, size), path)
+    arguments = [
+        '-f', path, '-x', os.path.join(workdir, 'cg.pdb'),
+        '-o', os.path.join(workdir, 'topol.top'), '-ff', 'martini22',
+        '-dssp', 'builtin', '-elastic',
+        '-ff-dir', os.path.join(directory, 'force_fields'),
+        '-map-dir', os.path.join(directory, 'mappings'),
+    ]
+    return workdir, arguments, _count_atoms(_input_system(system_name, size))
+
+
+def _run_martinize2(arguments):
+    # martinize2 writes the molecule ITP files in its working directory.
+    workdir, arguments, num_atoms = arguments
+    executable = MARTINIZE2_PATH
+    if not os.path.exists(executable):
+        executable = shutil.which('martinize2')
+    subprocess.check_call([sys.executable, executable] + arguments, cwd=workdir,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return num_atoms
+
+
+def all_cases():
+    """
+    Build the list of the benchmarks.
+
+    Returns
+    -------
+    list[Case]
+    """
+    cases = []
+    for system_name, (_, sizes, quick_sizes, unit) in SYSTEMS.items():
+        for step_index, (step_name, _) in enumerate(_steps()):
+            cases.append(Case(
+                name='{}/{}'.format(system_name, step_name),
+                sizes=sizes,
+                quick_sizes=quick_sizes,
+                unit=unit,
+                max_exponent=MAX_EXPONENT,
+                setup=functools.partial(_setup_step, system_name, step_index),
+                run=functools.partial(_run_step, step_index),
+                footprint=system_footprint,
+                max_peak=MAX_PEAK_PER_ATOM,
+                max_footprint=MAX_FOOTPRINT_PER_ATOM,
+            ))
+        cases.append(Case(
+            name='{}/martinize2'.format(system_name),
+            sizes=sizes,
+            quick_sizes=quick_sizes,
+            unit=unit,
+            max_exponent=MAX_EXPONENT,
+            setup=functools.partial(_write_input, system_name),
+            run=_run_martinize2,
+            # The allocations of the subprocess cannot be traced.
+            footprint=None,
+            max_peak=None,
+            max_footprint=None,
+        ))
+    return cases
+
+
+def cleanup():
+    """
+    Remove the files written by the benchmarks.
+    """
+    if _force_fields.cache_info().currsize:
+        shutil.rmtree(_force_fields()[0], ignore_errors=True)
+        _force_fields.cache_clear()
+        _write_input.cache_clear()
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Run the benchmarks, and report their throughput and scaling.
+
+For each benchmark and size, the best time over the rounds is kept. The
+scaling exponent is the slope of the log of the time against the log of the
+size, fitted over all the sizes: 1 means the time grows linearly with the
+size, 2 quadratically.
+
+Unless --no-memory is given, each size is run once more with the
+allocations traced by :mod:`tracemalloc`, to record the peak of the memory
+allocated by the step and the footprint of the system it returns, both per
+atom processed.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import cases
+
+
+def scaling_exponent(sizes, times):
+    """
+    Fit the exponent `k` of ``time = a * size ** k``.
+
+    Parameters
+    ----------
+    sizes: list[float]
+    times: list[float]
+
+    Returns
+    -------
+    float or None
+        The exponent, or `None` if there are less than two sizes.
+    """
+    if len(sizes) < 2:
+        return None
+    slope, _ = np.polyfit(np.log(sizes), np.log(times), 1)
+    return float(slope)
+
+
+def measure_memory(case, size):
+    """
+    Measure the memory used by a benchmark.
+
+    Parameters
+    ----------
+    case: benchmarks.cases.Case
+    size: int
+
+    Returns
+    -------
+    dict
+        The 'peak_per_atom' of the traced allocations during the run, the
+        'footprint_per_atom' of the input once run, and the 'footprint' per
+        category, in bytes.
+    """
+    argument = case.setup(size)
+    tracemalloc.start()
+    try:
+        atoms = case.run(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    footprint = case.footprint(argument)
+    return {
+        'peak_per_atom': peak / atoms if atoms else None,
+        'footprint_per_atom': footprint['total'] / atoms if atoms else None,
+        'footprint': footprint,
+    }
+
+
+def run_case(case, sizes, rounds, memory=True):
+    """
+    Time a benchmark.
+
+    Parameters
+    ----------
+    case: benchmarks.cases.Case
+    sizes: list[int]
+    rounds: int
+    memory: bool
+        Whether to also measure the memory, with :func:`measure_memory`, when
+        the case allows it.
+
+    Returns
+    -------
+    dict
+        The 'name', the 'unit', the 'exponent', the memory budgets, and for
+        each size the 'size', the number of 'atoms', the best 'time' in
+        seconds, the 'throughput' in atoms per second, and the 'memory'
+        measures or `None`.
+    """
+    results = []
+    for size in sizes:
+        best = None
+        for _ in range(rounds):
+            argument = case.setup(size)
+            start = time.perf_counter()
+            atoms = case.run(argument)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        measured = None
+        if memory and case.footprint is not None:
+            measured = measure_memory(case, size)
+        results.append({
+            'size': size,
+            'atoms': atoms,
+            'time': best,
+            'throughput': atoms / best if best else None,
+            'memory': measured,
+        })
+    return {
+        'name': case.name,
+        'unit': case.unit,
+        'exponent': scaling_exponent([result['size'] for result in results],
+                                     [result['time'] for result in results]),
+        'max_exponent': case.max_exponent,
+        'max_peak': case.max_peak,
+        'max_footprint': case.max_footprint,
+        'sizes': results,
+    }
+
+
+def regressions(report, baseline=None, tolerance=0.2):
+    """
+    Find the benchmarks that scale worse, or use more memory per atom, than
+    allowed.
+
+    Parameters
+    ----------
+    report: list[dict]
+        As made by :func:`run_case`.
+    baseline: list[dict] or None
+        A previous report. If given, an exponent may not exceed the one of
+        the baseline by more than `tolerance`.
+    tolerance: float
+
+    Returns
+    -------
+    list[str]
+        A message for each regression.
+    """
+    previous = {result['name']: result['exponent'] for result in baseline or []}
+    messages = []
+    for result in report:
+        messages.extend(_memory_regressions(result))
+        exponent = result['exponent']
+        if exponent is None:
+            continue
+        if exponent > result['max_exponent']:
+            messages.append('{} scales as size^{:.2f}, above the maximum of {:.2f}.'
+                            .format(result['name'], exponent, result['max_exponent']))
+        reference = previous.get(result['name'])
+        if reference is not None and exponent > reference + tolerance:
+            messages.append('{} scales as size^{:.2f}, up from size^{:.2f}.'
+                            .format(result['name'], exponent, reference))
+    return messages
+
+
+def _memory_regressions(result):
+    """
+    Find the sizes of a benchmark that exceed its memory budgets.
+    """
+    messages = []
+    for size in result['sizes']:
+        measured = size.get('memory')
+        if not measured:
+            continue
+        for key, budget_key, what in (
+                ('peak_per_atom', 'max_peak', 'allocates at peak'),
+                ('footprint_per_atom', 'max_footprint', 'keeps')):
+            value = measured[key]
+            budget = result.get(budget_key)
+            if value is not None and budget is not None and value > budget:
+                messages.append('{} {} {:.0f} bytes per atom at size {}, '
+                                'above the budget of {:.0f}.'
+                                .format(result['name'], what, value,
+                                        size['size'], budget))
+    return messages
+
+
+HEADER = '{:<48} {:>8} {:>9} {:>10} {:>13} {:>8} {:>11} {:>11}'.format(
+    'benchmark', 'size', 'atoms', 'time (s)', 'atoms/s', 'exponent',
+    'peak B/at', 'kept B/at',
+)
+
+
+def _format_bytes(value):
+    return '' if value is None else '{:.0f}'.format(value)
+
+
+def format_rows(result):
+    """
+    Format the result of a benchmark as rows of the report table.
+    """
+    exponent = result['exponent']
+    lines = []
+    for idx, size in enumerate(result['sizes']):
+        first = idx == 0
+        measured = size.get('memory') or {}
+        lines.append('{:<48} {:>8} {:>9} {:>10.4f} {:>13.0f} {:>8} {:>11} {:>11}'.format(
+            result['name'] if first else '',
+            size['size'], size['atoms'], size['time'], size['throughput'] or 0,
+            '{:.2f}'.format(exponent) if first and exponent is not None else '',
+            _format_bytes(measured.get('peak_per_atom')),
+            _format_bytes(measured.get('footprint_per_atom')),
+        ))
+    return lines
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Time the processors of vermouth and martinize2 on '
+                    'synthetic systems of growing size.',
+    )
+    parser.add_argument('-k', dest='select', action='append', default=[],
+                        help='Only run the benchmarks whose name contains '
+                             'this string. Can be given more than once.')
+    parser.add_argument('--quick', action='store_true', default=False,
+                        help='Use the small sizes, suited for CI.')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Number of rounds per size; the best is kept.')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        default=True,
+                        help='Do not measure the memory of the benchmarks.')
+    parser.add_argument('--output', default=None,
+                        help='Write the report in this JSON file.')
+    parser.add_argument('--check', action='store_true', default=False,
+                        help='Exit with an error if a benchmark scales worse '
+                             'than its maximum exponent, or than the baseline, '
+                             'or exceeds its memory budgets.')
+    parser.add_argument('--baseline', default=None,
+                        help='A JSON report to compare the scaling exponents with.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='How much an exponent may exceed the one of '
+                             'the baseline.')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    selected = [
+        case for case in cases.all_cases()
+        if not args.select or any(select in case.name for select in args.select)
+    ]
+    report = []
+    try:
+        for case in selected:
+            sizes = case.quick_sizes if args.quick else case.sizes
+            result = run_case(case, sizes, args.rounds, args.memory)
+            report.append(result)
+            if len(report) == 1:
+                print(HEADER)
+            print('\n'.join(format_rows(result)), flush=True)
+    finally:
+        cases.cleanup()
+    if args.output is not None:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+    messages = regressions(report, baseline, args.tolerance)
+    for message in messages:
+        print(message, file=sys.stderr)
+    return 1 if args.check and messages else 0
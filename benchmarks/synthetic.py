@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Generate synthetic atomistic systems of any size.
+
+The polypeptides are ideal beta strands. Their residues are copied from the
+residues of the 1BTA structure in the test data, and superimposed on an ideal
+backbone; the backbone oxygen and amide hydrogen are placed on the ideal
+peptide plane. The first and last residues carry the termini of 1BTA. The
+histidine of 1BTA is left out: it only matches its reference through the
+maximum common subgraph fallback of RepairGraph, which takes seconds per
+residue and would hide how the rest scales.
+
+The lipids are a small two-tailed lipid, BLP, that is not part of the
+shipped force fields. :func:`write_lipid_force_field` writes its atomistic
+and Martini blocks, and its mapping, so they can be given to martinize2 with
+the -ff-dir and -map-dir options.
+
+All the positions are in nm.
+"""
+
+import collections
+import itertools
+import os
+
+import numpy as np
+
+import vermouth
+from vermouth.forcefield import find_force_fields
+from vermouth.gmx.gro import write_gro
+from vermouth.map_input import (
+    read_mapping_directory, combine_mappings, generate_all_self_mappings,
+)
+from vermouth.pdb import read_pdb
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(vermouth.__file__),
+                             'tests', 'data', '1bta.pdb')
+# Residues of the template that are not used in the polypeptides.
+EXCLUDED_RESIDUES = ('HIS',)
+
+# Ideal backbone geometry: bond lengths in nm, angles and torsions in degrees.
+N_CA = 0.1458
+CA_C = 0.1525
+C_N = 0.1329
+C_O = 0.1231
+N_H = 0.1010
+ANGLE_N_CA_C = 111.2
+ANGLE_CA_C_N = 116.2
+ANGLE_C_N_CA = 121.7
+ANGLE_CA_C_O = 120.5
+ANGLE_CA_N_H = 119.5
+# Beta strand. Unlike in a helix, the side chains of the templates do not
+# come close enough to the other residues to make bonds.
+PHI = -120.0
+PSI = 130.0
+OMEGA = 180.0
+
+# Distance between the axes of the strands of a complex, in nm.
+CHAIN_SPACING = 4.0
+# Distance between the lipids in a leaflet, in nm.
+LIPID_SPACING = 0.8
+# Margin around the atoms in the box of the written structures, in nm.
+BOX_MARGIN = 2.0
+
+LIPID_NAME = 'BLP'
+# Name, and position in the upper leaflet, of the atoms of a lipid.
+LIPID_ATOMS = (
+    ('N', (0.00, 0.00, 1.05)),
+    ('C1', (0.00, 0.00, 0.90)),
+    ('C2', (0.00, 0.00, 0.75)),
+    ('O1', (0.00, 0.00, 0.60)),
+    ('P', (0.00, 0.00, 0.45)),
+    ('O2', (0.15, 0.00, 0.45)),
+    ('O3', (-0.15, 0.00, 0.45)),
+    ('O4', (0.00, 0.00, 0.30)),
+    ('C3', (0.00, 0.00, 0.15)),
+    ('C4', (0.16, 0.00, 0.20)),
+    ('C5', (0.31, 0.00, 0.20)),
+    ('C6', (0.46, 0.00, 0.20)),
+) + tuple(
+    ('C{}A'.format(idx + 1), (0.00, 0.00, -0.15 * idx)) for idx in range(5)
+) + tuple(
+    ('C{}B'.format(idx + 1), (0.46, 0.00, 0.05 - 0.15 * idx)) for idx in range(5)
+)
+LIPID_BONDS = (
+    ('N', 'C1'), ('C1', 'C2'), ('C2', 'O1'), ('O1', 'P'), ('P', 'O2'),
+    ('P', 'O3'), ('P', 'O4'), ('O4', 'C3'), ('C3', 'C4'), ('C4', 'C5'),
+    ('C5', 'C6'), ('C3', 'C1A'), ('C6', 'C1B'),
+) + tuple(
+    ('C{}{}'.format(idx, tail), 'C{}{}'.format(idx + 1, tail))
+    for tail in 'AB' for idx in range(1, 5)
+)
+# Bead name, bead type, and atoms of each bead of a coarse grained lipid.
+LIPID_BEADS = (
+    ('NC3', 'Q0', ('N', 'C1', 'C2')),
+    ('PO4', 'Qa', ('O1', 'P', 'O2', 'O3', 'O4')),
+    ('GL1', 'Na', ('C3', 'C4')),
+    ('GL2', 'Na', ('C5', 'C6')),
+    ('C1A', 'C1', ('C1A', 'C2A')),
+    ('C2A', 'C1', ('C3A', 'C4A', 'C5A')),
+    ('C1B', 'C1', ('C1B', 'C2B')),
+    ('C2B', 'C1', ('C3B', 'C4B', 'C5B')),
+)
+LIPID_BEAD_BONDS = (
+    ('NC3', 'PO4'), ('PO4', 'GL1'), ('GL1', 'GL2'), ('GL1', 'C1A'),
+    ('C1A', 'C2A'), ('GL2', 'C1B'), ('C1B', 'C2B'),
+)
+
+
+def _place(atom1, atom2, atom3, bond, angle, torsion):
+    """
+    Position of the atom bonded to `atom3` with the given bond length, angle
+    with `atom2`, and torsion with `atom1`.
+    """
+    angle = np.radians(angle)
+    torsion = np.radians(torsion)
+    bc = atom3 - atom2
+    bc /= np.linalg.norm(bc)
+    normal = np.cross(atom2 - atom1, bc)
+    normal /= np.linalg.norm(normal)
+    return atom3 + bond * (
+        -np.cos(angle) * bc
+        + np.sin(angle) * np.cos(torsion) * np.cross(normal, bc)
+        + np.sin(angle) * np.sin(torsion) * normal
+    )
+
+
+def ideal_backbone(length):
+    """
+    Positions of the N, CA, and C atoms of an ideal beta strand.
+
+    Parameters
+    ----------
+    length: int
+        The number of residues.
+
+    Returns
+    -------
+    numpy.ndarray
+        The positions as an array of shape (length, 3, 3).
+    """
+    backbone = np.zeros((length, 3, 3))
+    backbone[0, 1] = (N_CA, 0, 0)
+    angle = np.radians(180 - ANGLE_N_CA_C)
+    backbone[0, 2] = backbone[0, 1] + CA_C * np.array([np.cos(angle), np.sin(angle), 0])
+    for idx in range(1, length):
+        n_prev, ca_prev, c_prev = backbone[idx - 1]
+        n_atom = _place(n_prev, ca_prev, c_prev, C_N, ANGLE_CA_C_N, PSI)
+        ca_atom = _place(ca_prev, c_prev, n_atom, N_CA, ANGLE_C_N_CA, OMEGA)
+        c_atom = _place(c_prev, n_atom, ca_atom, CA_C, ANGLE_N_CA_C, PHI)
+        backbone[idx] = (n_atom, ca_atom, c_atom)
+    return backbone
+
+
+def _superpose(mobile, target):
+    """
+    Rotation and translation that superimpose the `mobile` points on the
+    `target` ones.
+    """
+    mobile_center = mobile.mean(axis=0)
+    target_center = target.mean(axis=0)
+    covariance = (mobile - mobile_center).T @ (target - target_center)
+    left, _, right = np.linalg.svd(covariance)
+    sign = np.sign(np.linalg.det(right.T @ left.T))
+    rotation = right.T @ np.diag([1, 1, sign]) @ left.T
+    return rotation, target_center - mobile_center @ rotation.T
+
+
+def residue_templates(path=TEMPLATE_PATH, exclude=EXCLUDED_RESIDUES):
+    """
+    Read the residues to build the polypeptides from.
+
+    Parameters
+    ----------
+    path: str
+        A PDB file with a single chain, with its hydrogens.
+    exclude: collections.abc.Container[str]
+        Residue names to leave out of the middle residues.
+
+    Returns
+    -------
+    n_terminus: list[dict]
+        The atoms of the first residue.
+    c_terminus: list[dict]
+        The atoms of the last residue.
+    residues: dict[str, list[dict]]
+        The atoms of the first occurrence of each residue name among the other
+        residues.
+    """
+    molecule = read_pdb(path)
+    residues = collections.OrderedDict()
+    for node_key in sorted(molecule, key=lambda key: molecule.nodes[key]['atomid']):
+        atom = molecule.nodes[node_key]
+        residues.setdefault(atom['resid'], []).append(atom)
+    residues = list(residues.values())
+    middle = collections.OrderedDict()
+    for atoms in residues[1:-1]:
+        if atoms[0]['resname'] in exclude:
+            continue
+        middle.setdefault(atoms[0]['resname'], atoms)
+    return residues[0], residues[-1], middle
+
+
+def polypeptide(length, templates=None, offset=(0, 0, 0), chain='A'):
+    """
+    Build a polypeptide as an ideal beta strand.
+
+    Parameters
+    ----------
+    length: int
+        The number of residues; at least 2.
+    templates: tuple or None
+        The residues, as returned by :func:`residue_templates`. Read from the
+        test data by default.
+    offset: numpy.ndarray
+        Translation applied to the strand, in nm.
+    chain: str
+
+    Returns
+    -------
+    vermouth.molecule.Molecule
+        The atoms of the polypeptide, without edges.
+    """
+    if length < 2:
+        raise ValueError('A polypeptide needs at least 2 residues.')
+    if templates is None:
+        templates = residue_templates()
+    n_terminus, c_terminus, middle = templates
+    sequence = itertools.cycle(middle.values())
+    residues = [n_terminus] + [next(sequence) for _ in range(length - 2)] + [c_terminus]
+    backbone = ideal_backbone(length) + np.asarray(offset, dtype=float)
+
+    molecule = vermouth.Molecule()
+    atomid = 1
+    for resid, (atoms, frame) in enumerate(zip(residues, backbone), start=1):
+        names = [atom['atomname'] for atom in atoms]
+        positions = np.array([atom['position'] for atom in atoms])
+        template_frame = positions[[names.index(name) for name in ('N', 'CA', 'C')]]
+        rotation, translation = _superpose(template_frame, frame)
+        positions = positions @ rotation.T + translation
+        for name, position in zip(names, positions):
+            if name == 'O' and resid < length:
+                position = _place(backbone[resid, 0], frame[1], frame[2],
+                                  C_O, ANGLE_CA_C_O, 180)
+            elif name == 'H' and resid > 1:
+                position = _place(backbone[resid - 2, 2], frame[1], frame[0],
+                                  N_H, ANGLE_CA_N_H, 180)
+            molecule.add_node(
+                atomid - 1, atomid=atomid, atomname=name, resname=atoms[0]['resname'],
+                resid=resid, chain=chain, element=name[0], position=position,
+            )
+            atomid += 1
+    return molecule
+
+
+def protein_complex(num_chains, length=50, templates=None):
+    """
+    Build a system of parallel strands on a square grid.
+
+    Parameters
+    ----------
+    num_chains: int
+    length: int
+        The number of residues of each chain.
+    templates: tuple or None
+        See :func:`polypeptide`.
+
+    Returns
+    -------
+    vermouth.system.System
+    """
+    if templates is None:
+        templates = residue_templates()
+    side = int(np.ceil(np.sqrt(num_chains)))
+    # The chains are placed in the plane perpendicular to the strand.
+    backbone = ideal_backbone(length)
+    axis = backbone[-1, 1] - backbone[0, 1]
+    axis /= np.linalg.norm(axis)
+    first = np.cross(axis, (0, 0, 1) if abs(axis[2]) < 0.9 else (1, 0, 0))
+    first /= np.linalg.norm(first)
+    second = np.cross(axis, first)
+    chain_names = itertools.cycle('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+    system = vermouth.System()
+    for idx in range(num_chains):
+        offset = CHAIN_SPACING * ((idx % side) * first + (idx // side) * second)
+        system.add_molecule(polypeptide(length, templates, offset, next(chain_names)))
+    return system
+
+
+def bilayer(num_lipids):
+    """
+    Build a flat bilayer of BLP lipids.
+
+    Half of the lipids, rounded up, are in the upper leaflet.
+
+    Parameters
+    ----------
+    num_lipids: int
+
+    Returns
+    -------
+    vermouth.system.System
+    """
+    names = [name for name, _ in LIPID_ATOMS]
+    upper = np.array([position for _, position in LIPID_ATOMS])
+    # The lower leaflet is the mirror of the upper one, with the tails of the
+    # two leaflets 0.3 nm apart.
+    lower = upper * (1, 1, -1) - (0, 0, 1.5)
+    per_leaflet = (num_lipids + 1) // 2
+    side = int(np.ceil(np.sqrt(per_leaflet)))
+    system = vermouth.System()
+    for idx in range(num_lipids):
+        leaflet, site = divmod(idx, per_leaflet)
+        offset = (LIPID_SPACING * (site % side), LIPID_SPACING * (site // side), 0)
+        positions = (lower if leaflet else upper) + offset
+        molecule = vermouth.Molecule()
+        for node_key, (name, position) in enumerate(zip(names, positions)):
+            molecule.add_node(
+                node_key, atomid=node_key + 1, atomname=name, resname=LIPID_NAME,
+                resid=idx + 1, chain='', element=name[0], position=position,
+            )
+        system.add_molecule(molecule)
+    return system
+
+
+def merge_system(system):
+    """
+    Gather the atoms of a system in a single molecule, as the readers do.
+    """
+    merged = vermouth.System()
+    molecule = vermouth.Molecule()
+    for other in system.molecules:
+        molecule.add_nodes_from(
+            (len(molecule) + idx, attributes)
+            for idx, attributes in enumerate(other.nodes.values())
+        )
+    merged.add_molecule(molecule)
+    return merged
+
+
+def write_structure(system, path):
+    """
+    Write a system as a GRO file, in a box that leaves a margin around it.
+
+    The atoms are translated so the box starts at the origin. The GRO format
+    is used because it can hold strands longer than 1000 nm.
+    """
+    positions = np.array([
+        atom['position'] for molecule in system.molecules
+        for atom in molecule.nodes.values()
+    ])
+    low = positions.min(axis=0) - BOX_MARGIN
+    box = positions.max(axis=0) + BOX_MARGIN - low
+    moved = vermouth.System()
+    for molecule in system.molecules:
+        molecule = molecule.copy()
+        for atom in molecule.nodes.values():
+            atom['position'] = atom['position'] - low
+        moved.add_molecule(molecule)
+    write_gro(moved, str(path), box=tuple(np.round(box, 3)))
+
+
+def write_lipid_force_field(directory):
+    """
+    Write the atomistic and Martini blocks, and the mapping, of the BLP
+    lipid.
+
+    Parameters
+    ----------
+    directory: str
+        The force fields are written in ``<directory>/force_fields``, and the
+        mapping in ``<directory>/mappings``.
+
+    Returns
+    -------
+    tuple[str, str]
+        The force field and the mapping directories.
+    """
+    ff_dir = os.path.join(directory, 'force_fields')
+    map_dir = os.path.join(directory, 'mappings')
+    index = {name: idx for idx, (name, _) in enumerate(LIPID_ATOMS, start=1)}
+    bead_index = {name: idx for idx, (name, _, _) in enumerate(LIPID_BEADS, start=1)}
+    universal = ['[ moleculetype ]', '{} 3'.format(LIPID_NAME), '', '[ atoms ]']
+    universal += ['{0} {1} 1 {2} {3} {0} 0'.format(idx, name[0], LIPID_NAME, name)
+                  for name, idx in index.items()]
+    universal += ['', '[ bonds ]']
+    universal += ['{} {}'.format(index[first], index[second])
+                  for first, second in LIPID_BONDS]
+    martini = ['[ moleculetype ]', '{} 1'.format(LIPID_NAME), '', '[ atoms ]']
+    martini += ['{0} {1} 1 {2} {3} {0} 0'.format(bead_index[name], bead_type, LIPID_NAME, name)
+                for name, bead_type, _ in LIPID_BEADS]
+    martini += ['', '[ bonds ]']
+    martini += ['{} {} 1 0.47 1250'.format(bead_index[first], bead_index[second])
+                for first, second in LIPID_BEAD_BONDS]
+    mapping = ['[ molecule ]', LIPID_NAME, '', '[ from ]', 'universal', '',
+               '[ to ]', 'martini22', '', '[ atoms ]']
+    mapping += ['{} {} {}'.format(index[atom], atom, bead)
+                for bead, _, atoms in LIPID_BEADS for atom in atoms]
+    for name, lines in (('universal', universal), ('martini22', martini)):
+        os.makedirs(os.path.join(ff_dir, name), exist_ok=True)
+        with open(os.path.join(ff_dir, name, 'benchmark_lipid.ff'), 'w') as outfile:
+            outfile.write('\n'.join(lines) + '\n')
+    os.makedirs(map_dir, exist_ok=True)
+    with open(os.path.join(map_dir, 'benchmark_lipid.map'), 'w') as outfile:
+        outfile.write('\n'.join(mapping) + '\n')
+    return ff_dir, map_dir
+
+
+def load_force_fields(extra_ff_dir=None, extra_map_dir=None):
+    """
+    Read the shipped force fields and mappings, as martinize2 does.
+
+    Parameters
+    ----------
+    extra_ff_dir: str or None
+    extra_map_dir: str or None
+        As written by :func:`write_lipid_force_field`.
+
+    Returns
+    -------
+    tuple[dict, dict]
+        The force fields and the mappings.
+    """
+    force_fields = find_force_fields(os.path.join(vermouth.DATA_PATH, 'force_fields'))
+    mappings = read_mapping_directory(os.path.join(vermouth.DATA_PATH, 'mappings'))
+    if extra_ff_dir is not None:
+        find_force_fields(extra_ff_dir, force_fields)
+    if extra_map_dir is not None:
+        combine_mappings(mappings, read_mapping_directory(extra_map_dir))
+    combine_mappings(mappings, generate_all_self_mappings(force_fields.values()))
+    return force_fields, mappings
@@ -19,11 +19,8 @@ Provides functionality for creating MD topologies from coordinate files. Powers
 the CLI tool martinize2.
 """
 import logging
-from .log_helpers import StyleAdapter, get_logger
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
-LOGGER = StyleAdapter(get_logger(__name__))
-
 
 # Find the data directory once.
 try:
@@ -40,15 +37,13 @@ import pbr.version
 __version__ = pbr.version.VersionInfo('vermouth').release_string()
 del pbr
 
+# Distance queries within vermouth go through `vermouth.neighbor_search`, which
+# only requires numpy. The KDTree is still exposed for backward compatibility.
 try:
     from scipy.spatial import cKDTree as KDTree
 except ImportError:
-    LOGGER.info('Using redistributed KDTree. Some functionality might be slow.'
-                ' Install scipy for better performance.', type='performance')
     from .redistributed.kdtree import KDTree
 
-del LOGGER
-
 from .molecule import Molecule
 from .processors import *
 from .system import System
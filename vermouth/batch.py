@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Process many inputs in one process, and report the failures at the end
+instead of stopping at the first one.
+
+A batch is a list of named inputs. They are listed either in a manifest file,
+with one line of command line arguments per input, or by a glob pattern.
+"""
+
+import collections
+import functools
+import glob
+import os
+import shlex
+import time
+
+from .executors import SerialExecutor
+
+BatchResult = collections.namedtuple('BatchResult', 'name error duration')
+BatchResult.__doc__ = """
+The outcome of one input of a batch.
+
+`error` is `None` if the input was processed successfully, and describes the
+exception otherwise. `duration` is the wall time in seconds.
+"""
+
+
+def read_manifest(path):
+    """
+    Read the arguments of each input from a manifest file.
+
+    Each line holds the arguments for one input, quoted as in a shell. Empty
+    lines and lines starting with '#' are ignored.
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    list[list[str]]
+        The arguments of each input, in order.
+    """
+    arguments = []
+    with open(str(path)) as infile:
+        for line in infile:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                arguments.append(shlex.split(line))
+    return arguments
+
+
+def glob_inputs(pattern):
+    """
+    List the files that match a glob pattern, in alphabetical order.
+
+    Parameters
+    ----------
+    pattern: str
+        The pattern, where '**' matches any number of directories.
+
+    Returns
+    -------
+    list[str]
+    """
+    return sorted(glob.glob(str(pattern), recursive=True))
+
+
+def unique_names(paths):
+    """
+    Name inputs after the stem of their file name.
+
+    Inputs that would get the same name are numbered, in order, starting
+    from the second one.
+
+    Parameters
+    ----------
+    paths: collections.abc.Iterable[str]
+
+    Returns
+    -------
+    list[str]
+    """
+    names = []
+    seen = collections.Counter()
+    used = set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(str(path)))[0]
+        name = stem
+        while name in used:
+            seen[stem] += 1
+            name = '{}_{}'.format(stem, seen[stem])
+        used.add(name)
+        names.append(name)
+    return names
+
+
+def _run_input(function, item):
+    """
+    Run `function` on the payload of a named input, and describe the
+    exception it raises instead of propagating it.
+    """
+    name, payload = item
+    start = time.monotonic()
+    try:
+        function(payload)
+    except Exception as error:  # pylint: disable=broad-except
+        message = '{}: {}'.format(type(error).__name__, error)
+        return BatchResult(name, message, time.monotonic() - start)
+    return BatchResult(name, None, time.monotonic() - start)
+
+
+def run_batch(function, items, executor=None):
+    """
+    Run a function on each input of a batch.
+
+    An exception raised for one input is recorded in its result, and the
+    other inputs are processed anyway.
+
+    Parameters
+    ----------
+    function: collections.abc.Callable
+        Takes the payload of an input. Its return value is ignored. It must
+        be picklable if `executor` runs it in other processes.
+    items: collections.abc.Iterable[tuple[str, object]]
+        The name and payload of each input.
+    executor: vermouth.executors.SerialExecutor or None
+        Distributes the inputs, see :mod:`vermouth.executors`. By default,
+        the inputs are processed one after the other.
+
+    Returns
+    -------
+    list[BatchResult]
+        The result for each input, in order.
+    """
+    if executor is None:
+        executor = SerialExecutor()
+    return list(executor.map(functools.partial(_run_input, function), list(items)))
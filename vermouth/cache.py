@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Store processed molecules on disk, keyed by a hash of the molecule they were
+built from.
+
+The cache is a directory with one file per molecule. The file name is the
+hash of the input molecule and of the options of the processing, so a
+molecule processed again with the same options is read back instead of being
+processed. The least recently used files are deleted when the directory grows
+beyond its maximum size.
+
+The same mechanism is available for text, such as the output of an external
+program, with :class:`TextCache`.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import zlib
+
+import networkx as nx
+import numpy as np
+
+from . import __version__
+from .coordinates import ROW_ATTRIBUTE
+from .molecule import LazySubgraph
+from .pipeline import load_checkpoint, save_checkpoint
+from .system import System
+
+#: Molecule meta key used to follow the molecules through a pipeline.
+CACHE_KEY = 'cache_key'
+#: Molecule meta key that stores the hash of the molecule as it was read.
+INPUT_HASH = 'input_hash'
+
+
+def _update_digest(digest, value):
+    """
+    Feed a node attribute, or any nested value, to a hash.
+    """
+    if isinstance(value, np.ndarray):
+        digest.update(repr((value.dtype.str, value.shape)).encode('utf8'))
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, nx.Graph):
+        digest.update(b'graph')
+        _hash_graph(digest, value)
+    elif isinstance(value, LazySubgraph):
+        digest.update(b'graph')
+        _hash_graph(digest, value.materialize())
+    elif isinstance(value, dict):
+        digest.update(b'dict')
+        for key in sorted(value, key=repr):
+            digest.update(repr(key).encode('utf8'))
+            _update_digest(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update('{}{}'.format(type(value).__name__, len(value)).encode('utf8'))
+        for item in value:
+            _update_digest(digest, item)
+    else:
+        digest.update(repr(value).encode('utf8'))
+
+
+def _hash_graph(digest, graph):
+    """
+    Feed the nodes, edges, and meta of a graph to a hash.
+    """
+    for key, node in graph.nodes.items():
+        _update_digest(digest, key)
+        # The row in the coordinate store depends on the rest of the system.
+        _update_digest(digest, {name: value for name, value in node.items()
+                                if name != ROW_ATTRIBUTE})
+    _update_digest(digest, sorted(sorted(edge, key=repr) for edge in graph.edges))
+    _update_digest(digest, {key: value
+                            for key, value in getattr(graph, 'meta', {}).items()
+                            if key != CACHE_KEY})
+
+
+def molecule_hash(molecule, options=None):
+    """
+    Compute a hash of a molecule and of the options used to process it.
+
+    The hash covers the node keys and all the node attributes, including the
+    positions and the nested 'graph' attributes but not the row of the atoms
+    in the coordinate store, the edges, the meta of the molecule, the name of
+    its force field, and the package version. A molecule therefore gets the
+    same hash only if it is identical, down to its atom numbering.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule to describe.
+    options: dict or None
+        The options that change how the molecule is processed, such as the
+        target force field.
+
+    Returns
+    -------
+    str
+        The hash as an hexadecimal string.
+    """
+    digest = hashlib.sha256(__version__.encode('utf8'))
+    force_field = molecule.force_field
+    _update_digest(digest, force_field.name if force_field is not None else None)
+    _update_digest(digest, options or {})
+    _hash_graph(digest, molecule)
+    return digest.hexdigest()
+
+
+def set_input_hashes(system):
+    """
+    Record the hash of each molecule of a system in its meta.
+
+    Repairing a molecule can give different, equivalent, names to symmetric
+    atoms from one run to the next, so the molecules should be hashed as
+    they are read, before they are repaired. See :func:`processing_hash`.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+    """
+    for molecule in system.molecules:
+        molecule.meta[INPUT_HASH] = molecule_hash(molecule)
+
+
+def processing_hash(molecule, options=None, attributes=('secstruct', 'cgsecstruct')):
+    """
+    Compute the hash under which the processed molecule is cached.
+
+    If the molecule has a hash recorded by :func:`set_input_hashes`, the hash
+    covers it, the meta of the molecule, the name of its force field, the
+    options, and the value of the `attributes` per residue. Otherwise, it is
+    the :func:`molecule_hash` of the molecule.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule to describe.
+    options: dict or None
+        The options that change how the molecule is processed.
+    attributes: collections.abc.Iterable[str]
+        The node attributes set since the molecule was read that change how
+        it is processed, such as the secondary structure.
+
+    Returns
+    -------
+    str
+        The hash as an hexadecimal string.
+    """
+    if INPUT_HASH not in molecule.meta:
+        return molecule_hash(molecule, options)
+    digest = hashlib.sha256(__version__.encode('utf8'))
+    force_field = molecule.force_field
+    _update_digest(digest, force_field.name if force_field is not None else None)
+    _update_digest(digest, options or {})
+    _update_digest(digest, {key: value for key, value in molecule.meta.items()
+                            if key != CACHE_KEY})
+    residues = {
+        (node.get('chain'), node.get('resid'), node.get('insertion_code'),
+         node.get('resname')) + tuple(node.get(name) for name in attributes)
+        for node in molecule.nodes.values()
+    }
+    _update_digest(digest, sorted(residues, key=repr))
+    return digest.hexdigest()
+
+
+def _evict_least_recently_used(directory, suffix, max_size):
+    """
+    Delete the least recently used files of a directory until the files
+    with a given suffix fit in a maximum size.
+
+    Returns
+    -------
+    int
+        The number of deleted files.
+    """
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith(suffix):
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Another process evicted the file already.
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        else:
+            evicted += 1
+        total -= size
+    return evicted
+
+
+class MoleculeCache:
+    """
+    A directory of processed molecules, with a least recently used eviction.
+
+    Parameters
+    ----------
+    directory: str
+        The directory of the cache. It is created if needed.
+    force_fields: dict[str, vermouth.forcefield.ForceField]
+        The force fields the cached molecules may refer to, keyed by name.
+    max_size: int or None
+        The maximum size of the cache in bytes. The least recently used
+        molecules are deleted when it is exceeded. `None` means no limit.
+
+    Attributes
+    ----------
+    stats: dict[str, int]
+        The number of 'hits', 'misses', 'stored', and 'evicted' molecules
+        since the cache was opened.
+    """
+    suffix = '.mol'
+
+    def __init__(self, directory, force_fields, max_size=None):
+        self.directory = str(directory)
+        self.force_fields = force_fields
+        self.max_size = max_size
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """
+        Read a molecule from the cache.
+
+        Parameters
+        ----------
+        key: str
+            The hash of the molecule, as given by :func:`processing_hash`.
+
+        Returns
+        -------
+        vermouth.molecule.Molecule or None
+            The cached molecule, or `None` if the cache does not have it. A
+            corrupt or truncated entry is deleted, and counts as a miss.
+        """
+        path = self._path(key)
+        try:
+            system, _ = load_checkpoint(path, self.force_fields)
+        except (FileNotFoundError, KeyError):
+            self.stats['misses'] += 1
+            return None
+        except (zlib.error, pickle.UnpicklingError, EOFError):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.stats['misses'] += 1
+            return None
+        # The modification time records the last use of the molecule.
+        os.utime(path)
+        self.stats['hits'] += 1
+        return system.molecules[0]
+
+    def put(self, key, molecule):
+        """
+        Store a molecule in the cache, and evict the least recently used
+        molecules if the cache grows too large.
+
+        Parameters
+        ----------
+        key: str
+            The hash of the molecule, as given by :func:`processing_hash`.
+        molecule: vermouth.molecule.Molecule
+            The processed molecule to store.
+        """
+        system = System()
+        system.add_molecule(molecule)
+        save_checkpoint(self._path(key), system)
+        self.stats['stored'] += 1
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used molecules until the cache fits in its
+        maximum size.
+        """
+        if self.max_size is None:
+            return
+        self.stats['evicted'] += _evict_least_recently_used(
+            self.directory, self.suffix, self.max_size
+        )
+
+
+class TextCache:
+    """
+    A directory of texts keyed by a hash, with a least recently used
+    eviction.
+
+    The cache can be used from several threads, and by several processes at
+    the same time.
+
+    Parameters
+    ----------
+    directory: str
+        The directory of the cache. It is created if needed.
+    max_size: int or None
+        The maximum size of the cache in bytes. The least recently used texts
+        are deleted when it is exceeded. `None` means no limit.
+    suffix: str
+        The extension of the files in the directory.
+
+    Attributes
+    ----------
+    stats: dict[str, int]
+        The number of 'hits', 'misses', 'stored', and 'evicted' texts since
+        the cache was opened.
+    """
+    def __init__(self, directory, max_size=None, suffix='.txt'):
+        self.directory = str(directory)
+        self.max_size = max_size
+        self.suffix = suffix
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _count(self, stat, number=1):
+        with self._lock:
+            self.stats[stat] += number
+
+    def get(self, key):
+        """
+        Read a text from the cache.
+
+        Parameters
+        ----------
+        key: str
+            The hash of the text.
+
+        Returns
+        -------
+        str or None
+            The cached text, or `None` if the cache does not have it.
+        """
+        path = self._path(key)
+        try:
+            with open(path) as infile:
+                text = infile.read()
+            # The modification time records the last use of the text.
+            os.utime(path)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return text
+
+    def put(self, key, text):
+        """
+        Store a text in the cache, and evict the least recently used texts if
+        the cache grows too large.
+
+        Parameters
+        ----------
+        key: str
+            The hash of the text.
+        text: str
+            The text to store.
+        """
+        # The text is written under a temporary name, so that nobody reads a
+        # partial file.
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as outfile:
+            outfile.write(text)
+        os.replace(temporary, self._path(key))
+        self._count('stored')
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used texts until the cache fits in its
+        maximum size.
+        """
+        if self.max_size is None:
+            return
+        self._count('evicted', _evict_least_recently_used(
+            self.directory, self.suffix, self.max_size
+        ))
+
+
+def _independent_copy(molecule):
+    """
+    Copy a molecule so that none of its arrays are shared with the original.
+
+    The copy is not attached to the coordinate store of the original, as a
+    molecule read from the cache is not.
+    """
+    copied = molecule.copy()
+    copied.coordinates = None
+    for node in copied.nodes.values():
+        node.pop(ROW_ATTRIBUTE, None)
+        for name, value in node.items():
+            if isinstance(value, np.ndarray):
+                node[name] = value.copy()
+    return copied
+
+
+def run_with_cache(system, pipeline, cache, options=None):
+    """
+    Run a pipeline only on the molecules that are not in the cache.
+
+    The pipeline must process the molecules independently, and keep the meta
+    of the molecules as :class:`~vermouth.processors.do_mapping.DoMapping`
+    does. The molecules the pipeline deletes are not cached. Identical
+    molecules are processed once, and each further occurrence gets a copy of
+    the result.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+        The system to process. Is modified in-place.
+    pipeline: collections.abc.Callable
+        Takes a system and returns the processed system.
+    cache: MoleculeCache
+        The cache to read from and write to.
+    options: dict or None
+        The options that change how the molecules are processed. See
+        :func:`processing_hash`.
+
+    Returns
+    -------
+    vermouth.system.System
+        The processed system.
+
+    Raises
+    ------
+    ValueError
+        The pipeline did not keep the meta of the molecules.
+    """
+    keys = [processing_hash(molecule, options) for molecule in system.molecules]
+    results = [cache.get(key) for key in keys]
+
+    misses = System()
+    misses.force_field = system.force_field
+    misses.box = system.box
+    missing_keys = set()
+    for key, molecule, result in zip(keys, system.molecules, results):
+        # Identical molecules are only processed once.
+        if result is None and key not in missing_keys:
+            missing_keys.add(key)
+            molecule.meta[CACHE_KEY] = key
+            misses.add_molecule(molecule)
+    if misses.molecules:
+        misses = pipeline(misses)
+        processed = {}
+        for molecule in misses.molecules:
+            if CACHE_KEY not in molecule.meta:
+                raise ValueError('The pipeline did not keep the meta of the molecules.')
+            key = molecule.meta.pop(CACHE_KEY)
+            processed[key] = molecule
+            cache.put(key, molecule)
+        used = set()
+        for idx, (key, result) in enumerate(zip(keys, results)):
+            if result is not None or key not in processed:
+                continue
+            if key in used:
+                results[idx] = _independent_copy(processed[key])
+            else:
+                results[idx] = processed[key]
+                used.add(key)
+    for molecule in system.molecules:
+        molecule.meta.pop(CACHE_KEY, None)
+
+    system.molecules = [molecule for molecule in results if molecule is not None]
+    if system.molecules:
+        system.force_field = system.molecules[0].force_field
+    return system
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Store the coordinates of many atoms in contiguous arrays.
+
+A :class:`CoordinateStore` holds the positions, and optionally the
+velocities, of the atoms as (N, 3) arrays. The nodes attached to the store
+keep their row under the :data:`ROW_ATTRIBUTE` attribute, and a view of that
+row under the 'position' and 'velocity' attributes, so the code that reads or
+modifies ``node['position']`` keeps working, and modifies the store. The
+store is kept alive by the molecules and the system it belongs to, as their
+`coordinates` attribute.
+
+:func:`gather_positions` collects the coordinates of nodes as a single array.
+When all the nodes are attached to the same store, it indexes the array of
+the store instead of stacking the coordinates of each node. A node whose
+coordinate got replaced by another array is not attached anymore, and its
+coordinates are read from the node.
+
+The store does not make the atoms smaller: each attached node still holds a
+view of its row, which takes about as much memory as a small array of its
+own, and its row besides. What the store buys is speed, as the coordinates
+of many atoms can be used as one array without stacking them; and the
+readers avoid holding the coordinates as Python floats until the store is
+built.
+"""
+
+import weakref
+
+import numpy as np
+
+ROW_ATTRIBUTE = 'coordinate_row'
+
+# The stores, by the id of their arrays, to find the store a view comes from.
+_STORES = weakref.WeakValueDictionary()
+
+
+def _as_rows(values, dtype):
+    """
+    Build an (N, 3) array that owns its data.
+
+    The views of the rows refer to the array that owns the data as their
+    base, which is how :meth:`CoordinateStore.of_node` finds the store.
+    """
+    array = np.array(values, dtype=dtype)
+    if array.ndim != 2 or array.shape[1] != 3:
+        array = array.reshape(-1, 3).copy()
+    return array
+
+
+class CoordinateStore:
+    """
+    Contiguous coordinates for a set of atoms.
+
+    Parameters
+    ----------
+    positions: numpy.ndarray
+        The positions as an (N, 3) array, or anything that can be converted
+        to one.
+    velocities: numpy.ndarray or None
+        The velocities, with the same shape as `positions`, if any.
+    dtype: numpy.dtype
+        The type of the coordinates. With ``numpy.float32``, the arrays take
+        half the memory, but the views given to the nodes do not get smaller.
+
+    Attributes
+    ----------
+    arrays: dict[str, numpy.ndarray]
+        The (N, 3) array for each stored attribute.
+    """
+    def __init__(self, positions, velocities=None, dtype=float):
+        self.arrays = {
+            'position': _as_rows(positions, dtype),
+        }
+        if velocities is not None:
+            self.arrays['velocity'] = _as_rows(velocities, dtype)
+            if len(self.arrays['velocity']) != len(self):
+                raise ValueError('There must be as many velocities as positions.')
+        self._register()
+
+    def _register(self):
+        # The views given to the nodes. A node is attached to the store only
+        # as long as its attribute is the view of its row.
+        self._views = {
+            attribute: list(array) for attribute, array in self.arrays.items()
+        }
+        for array in self.arrays.values():
+            _STORES[id(array)] = self
+
+    def __getstate__(self):
+        # Once pickled, the coordinates of the nodes are independent arrays
+        # rather than views, so they cannot be attached anymore.
+        return {'arrays': self.arrays}
+
+    def __setstate__(self, state):
+        self.arrays = state['arrays']
+        self._register()
+
+    def __len__(self):
+        return len(self.arrays['position'])
+
+    @property
+    def positions(self):
+        """
+        The positions as an (N, 3) array.
+        """
+        return self.arrays['position']
+
+    @property
+    def dtype(self):
+        """
+        The type of the coordinates.
+        """
+        return self.positions.dtype
+
+    def attach(self, node, row):
+        """
+        Attach a node to a row of the store.
+
+        The stored attributes of the node are set to views of the row.
+
+        Parameters
+        ----------
+        node: dict
+            The node attributes.
+        row: int
+        """
+        node[ROW_ATTRIBUTE] = row
+        for attribute, views in self._views.items():
+            node[attribute] = views[row]
+
+    def is_attached(self, node, attribute='position'):
+        """
+        Whether the `attribute` of a node is the view of its row in the store.
+        """
+        row = node.get(ROW_ATTRIBUTE)
+        views = self._views.get(attribute)
+        return (row is not None and views is not None and 0 <= row < len(views)
+                and node.get(attribute) is views[row])
+
+    @classmethod
+    def for_nodes(cls, nodes, positions, velocities=None, dtype=float):
+        """
+        Build a store from coordinates, and attach the nodes in order.
+
+        Parameters
+        ----------
+        nodes: collections.abc.Iterable[dict]
+            The node attributes; one per row.
+        positions: numpy.ndarray
+        velocities: numpy.ndarray or None
+        dtype: numpy.dtype
+
+        Returns
+        -------
+        CoordinateStore
+        """
+        store = cls(positions, velocities, dtype=dtype)
+        for row, node in enumerate(nodes):
+            store.attach(node, row)
+        return store
+
+    @classmethod
+    def from_nodes(cls, nodes, dtype=float):
+        """
+        Move the coordinates of nodes to a new store, and attach the nodes.
+
+        Nodes without a position are not attached. The velocities are stored
+        if all the nodes with a position have one.
+
+        Parameters
+        ----------
+        nodes: collections.abc.Iterable[dict]
+            The node attributes.
+        dtype: numpy.dtype
+
+        Returns
+        -------
+        CoordinateStore
+        """
+        nodes = [node for node in nodes if node.get('position') is not None]
+        velocities = None
+        if nodes and all(node.get('velocity') is not None for node in nodes):
+            velocities = [node['velocity'] for node in nodes]
+        return cls.for_nodes(nodes, [node['position'] for node in nodes],
+                             velocities, dtype=dtype)
+
+    @classmethod
+    def of_node(cls, node, attribute='position'):
+        """
+        Find the store a node is attached to.
+
+        Parameters
+        ----------
+        node: dict
+        attribute: str
+
+        Returns
+        -------
+        CoordinateStore or None
+        """
+        value = node.get(attribute)
+        base = getattr(value, 'base', None)
+        if base is None:
+            return None
+        store = _STORES.get(id(base))
+        if store is None or store.arrays.get(attribute) is not base:
+            return None
+        if not store.is_attached(node, attribute):
+            return None
+        return store
+
+
+def gather_positions(nodes, attribute='position', default=None):
+    """
+    Collect the coordinates of nodes in an (n_nodes, 3) array.
+
+    If all the nodes are attached to the same :class:`CoordinateStore`, the
+    array is taken from the store without going through every coordinate.
+    If they are attached to all its rows, in order, and the store holds
+    double precision coordinates, the array of the store itself is returned
+    and must not be modified.
+
+    Parameters
+    ----------
+    nodes: collections.abc.Iterable[dict]
+        The node attributes.
+    attribute: str
+        The attribute under which the coordinates are stored.
+    default: float or None
+        The value to use for the nodes without coordinates. If `None`, such
+        nodes raise a :exc:`KeyError`.
+
+    Returns
+    -------
+    numpy.ndarray
+        The coordinates in double precision, whatever the type of the store.
+
+    Raises
+    ------
+    KeyError
+        A node does not have coordinates, and there is no `default`.
+    """
+    nodes = list(nodes)
+    if not nodes:
+        return np.zeros((0, 3))
+    store = CoordinateStore.of_node(nodes[0], attribute)
+    if store is not None:
+        # pylint: disable=protected-access
+        views = store._views[attribute]
+        rows = []
+        for node in nodes:
+            row = node.get(ROW_ATTRIBUTE)
+            if row is None or not 0 <= row < len(views) or node.get(attribute) is not views[row]:
+                break
+            rows.append(row)
+        else:
+            array = store.arrays[attribute]
+            if len(rows) == len(array) and rows == list(range(len(array))):
+                return array.astype(float, copy=False)
+            return array[rows].astype(float, copy=False)
+    coordinates = np.empty((len(nodes), 3))
+    for idx, node in enumerate(nodes):
+        value = node.get(attribute)
+        if value is None:
+            if default is None:
+                raise KeyError('A node does not have a "{}" attribute.'
+                               .format(attribute))
+            value = default
+        coordinates[idx] = value
+    return coordinates
@@ -0,0 +1,508 @@
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Assign protein secondary structures without the external DSSP program.
+
+This is a reimplementation of the algorithm of DSSP version 2 [KS83]_, as
+implemented by M.L. Hekkelman, using numpy. The backbone hydrogen bonds are
+found from the electrostatic energy between the N-H and C=O groups of
+residues whose alpha carbons are closer than 9 Å. The hydrogen bond patterns
+then define turns, helices, and β bridges, while the geometry of the alpha
+carbons defines bends. The assignment uses the same one-letter codes as
+:func:`vermouth.dssp.dssp.read_dssp2`.
+
+Like DSSP, the positions of the backbone hydrogens are not read but built
+from the direction of the C=O group of the previous residue, and residues
+without all of the N, CA, C, and O atoms are ignored. Such residues are
+assigned a coil.
+
+.. [KS83] W. Kabsch and C. Sander, Biopolymers 22 (1983) 2577-2637.
+"""
+
+import numpy as np
+
+from ..neighbor_search import pairs_within
+
+BACKBONE_ATOMS = ('N', 'CA', 'C', 'O')
+
+# The constants used by DSSP. The distances are in Å, and the energies in
+# kcal/mol.
+COUPLING_CONSTANT = -27.888  # -332 * 0.42 * 0.20
+MIN_HBOND_ENERGY = -9.9
+MAX_HBOND_ENERGY = -0.5
+MIN_DISTANCE = 0.5
+MAX_CA_DISTANCE = 9.0
+MAX_PEPTIDE_BOND_LENGTH = 2.5
+MIN_BEND_ANGLE = 70
+
+# Index of each atom along the second axis of the backbone arrays.
+_N, _CA, _C, _O = range(4)
+
+
+def read_backbone(molecule):
+    """
+    Gather the backbone of the residues of a molecule.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule to read. The atoms need an 'atomname' and a 'position',
+        the residues are described by the 'resname' and 'chain' atom
+        attributes.
+
+    Returns
+    -------
+    complete: numpy.ndarray
+        For each residue, in the order of
+        :meth:`~vermouth.molecule.Molecule.iter_residues`, whether all the
+        backbone atoms are found.
+    backbone: numpy.ndarray
+        The positions of the N, CA, C, and O atoms of the complete residues,
+        in Å, as an array of shape (n_complete, 4, 3).
+    proline: numpy.ndarray
+        Whether each complete residue is a proline.
+    chains: list
+        The chain of each complete residue.
+    """
+    complete = []
+    backbone = []
+    proline = []
+    chains = []
+    for residue in molecule.iter_residues():
+        atoms = {}
+        for key in residue:
+            node = molecule.nodes[key]
+            atomname = node.get('atomname')
+            if atomname in BACKBONE_ATOMS and atomname not in atoms \
+                    and node.get('position') is not None:
+                atoms[atomname] = node
+        is_complete = len(atoms) == len(BACKBONE_ATOMS)
+        complete.append(is_complete)
+        if is_complete:
+            backbone.append([atoms[name]['position'] for name in BACKBONE_ATOMS])
+            proline.append(atoms['CA'].get('resname') == 'PRO')
+            chains.append(atoms['CA'].get('chain'))
+    # Vermouth positions are in nm, DSSP works in Å.
+    backbone = np.array(backbone, dtype=float).reshape((-1, 4, 3)) * 10
+    return np.array(complete, dtype=bool), backbone, np.array(proline, dtype=bool), chains
+
+
+def chain_segments(backbone, chains):
+    """
+    Number the continuous segments of a backbone.
+
+    A new segment starts when the chain changes, or when the peptide bond
+    with the previous residue is longer than 2.5 Å.
+
+    Parameters
+    ----------
+    backbone: numpy.ndarray
+        The backbone positions as returned by :func:`read_backbone`.
+    chains: list
+        The chain of each residue.
+
+    Returns
+    -------
+    numpy.ndarray
+        The segment of each residue. There is no chain break between two
+        residues if they are in the same segment.
+    """
+    breaks = np.zeros(len(backbone), dtype=bool)
+    if len(backbone) > 1:
+        peptide_bonds = np.linalg.norm(backbone[1:, _N] - backbone[:-1, _C], axis=1)
+        changes = np.array([previous != current
+                            for previous, current in zip(chains[:-1], chains[1:])],
+                           dtype=bool)
+        breaks[1:] = (peptide_bonds > MAX_PEPTIDE_BOND_LENGTH) | changes
+    return np.cumsum(breaks)
+
+
+def _hydrogen_positions(backbone, segments):
+    """
+    Place the hydrogen of each N-H group 1 Å from the nitrogen, in the
+    direction of the C=O group of the previous residue. The first residue of
+    a segment has its hydrogen on the nitrogen, so it cannot be a donor.
+    """
+    hydrogens = backbone[:, _N].copy()
+    if len(backbone) > 1:
+        carbonyls = backbone[:-1, _C] - backbone[:-1, _O]
+        carbonyls /= np.linalg.norm(carbonyls, axis=1)[:, np.newaxis]
+        continuous = segments[1:] == segments[:-1]
+        hydrogens[1:][continuous] += carbonyls[continuous]
+    return hydrogens
+
+
+def hbond_energies(backbone, proline, segments):
+    """
+    Compute the energy of the potential backbone hydrogen bonds.
+
+    Only the pairs of residues with alpha carbons closer than 9 Å are
+    considered. Like in DSSP, a residue cannot donate a hydrogen bond to the
+    residue before it.
+
+    Parameters
+    ----------
+    backbone: numpy.ndarray
+        The backbone positions as returned by :func:`read_backbone`.
+    proline: numpy.ndarray
+        Whether each residue is a proline. Prolines have no N-H group.
+    segments: numpy.ndarray
+        The continuous segments, as returned by :func:`chain_segments`.
+
+    Returns
+    -------
+    donors: numpy.ndarray
+        The residues with the N-H group.
+    acceptors: numpy.ndarray
+        The residues with the C=O group.
+    energies: numpy.ndarray
+        The energies of the hydrogen bonds, in kcal/mol.
+    """
+    first, second, distances = pairs_within(backbone[:, _CA], MAX_CA_DISTANCE)
+    close = distances < MAX_CA_DISTANCE
+    first = first[close]
+    second = second[close]
+    # Every pair is considered in both directions, except for a residue
+    # donating to the previous one.
+    reverse = second != first + 1
+    donors = np.concatenate([first, second[reverse]])
+    acceptors = np.concatenate([second, first[reverse]])
+    keep = ~proline[donors]
+    donors = donors[keep]
+    acceptors = acceptors[keep]
+
+    hydrogens = _hydrogen_positions(backbone, segments)
+    dist_ho = np.linalg.norm(hydrogens[donors] - backbone[acceptors, _O], axis=1)
+    dist_hc = np.linalg.norm(hydrogens[donors] - backbone[acceptors, _C], axis=1)
+    dist_nc = np.linalg.norm(backbone[donors, _N] - backbone[acceptors, _C], axis=1)
+    dist_no = np.linalg.norm(backbone[donors, _N] - backbone[acceptors, _O], axis=1)
+    distances = np.stack([dist_ho, dist_hc, dist_nc, dist_no])
+    with np.errstate(divide='ignore'):
+        energies = COUPLING_CONSTANT * (
+            1 / dist_ho - 1 / dist_hc + 1 / dist_nc - 1 / dist_no
+        )
+    energies[np.any(distances < MIN_DISTANCE, axis=0)] = MIN_HBOND_ENERGY
+    # DSSP rounds the energies to 3 decimals, away from zero.
+    energies = np.sign(energies) * np.floor(np.abs(energies) * 1000 + 0.5) / 1000
+    energies = np.maximum(energies, MIN_HBOND_ENERGY)
+    return donors, acceptors, energies
+
+
+def best_hbonds(n_residues, donors, acceptors, energies):
+    """
+    Select the two most favorable hydrogen bonds of each N-H group.
+
+    DSSP only keeps the two hydrogen bonds with the lowest energy for each
+    donor; on ties, the acceptor that comes first is kept.
+
+    Parameters
+    ----------
+    n_residues: int
+        The number of residues.
+    donors: numpy.ndarray
+    acceptors: numpy.ndarray
+    energies: numpy.ndarray
+        The potential hydrogen bonds, as returned by :func:`hbond_energies`.
+
+    Returns
+    -------
+    best_acceptors: numpy.ndarray
+        An array of shape (n_residues, 2) with the index of the acceptors, or
+        -1 where there is no hydrogen bond with a negative energy.
+    best_energies: numpy.ndarray
+        An array of shape (n_residues, 2) with the energies of the bonds, or 0.
+    """
+    best_acceptors = np.full((n_residues, 2), -1, dtype=int)
+    best_energies = np.zeros((n_residues, 2))
+    favorable = energies < 0
+    donors = donors[favorable]
+    acceptors = acceptors[favorable]
+    energies = energies[favorable]
+    order = np.lexsort((acceptors, energies, donors))
+    donors = donors[order]
+    # Rank of each bond among the bonds of its donor.
+    group_starts = np.searchsorted(donors, donors)
+    rank = np.arange(len(donors)) - group_starts
+    best = rank < 2
+    best_acceptors[donors[best], rank[best]] = acceptors[order][best]
+    best_energies[donors[best], rank[best]] = energies[order][best]
+    return best_acceptors, best_energies
+
+
+class _HBonds:
+    """
+    Test if residues are hydrogen bonded, for arrays of residues.
+    """
+    def __init__(self, best_acceptors, best_energies):
+        n_residues = len(best_acceptors)
+        bonded = best_energies < MAX_HBOND_ENERGY
+        donors = np.repeat(np.arange(n_residues), 2).reshape((-1, 2))
+        self.n_residues = n_residues
+        self.keys = np.unique(donors[bonded] * n_residues + best_acceptors[bonded])
+
+    def __call__(self, donors, acceptors):
+        """
+        Whether the N-H group of the donors binds the C=O group of the
+        acceptors. Indices out of range are never bonded.
+        """
+        donors = np.asarray(donors)
+        acceptors = np.asarray(acceptors)
+        valid = ((donors >= 0) & (donors < self.n_residues)
+                 & (acceptors >= 0) & (acceptors < self.n_residues))
+        keys = np.where(valid, donors * self.n_residues + acceptors, -1)
+        return valid & np.isin(keys, self.keys)
+
+
+def _no_break(segments, start, stop):
+    """
+    Whether there is no chain break between the residues `start` and `stop`.
+    The indices must be valid.
+    """
+    return segments[start] == segments[stop]
+
+
+def _spread(starts, length):
+    """
+    Mark `length` residues from each start.
+    """
+    result = starts.copy()
+    for shift in range(1, length):
+        result[shift:] |= starts[:-shift]
+    return result
+
+
+def _windows_all(mask, length):
+    """
+    Whether `length` residues are all set in `mask`, from each residue.
+    """
+    result = mask.copy()
+    for shift in range(1, length):
+        result[:-shift] &= mask[shift:]
+        result[-shift:] = False
+    return result
+
+
+def _helix_starts(hbonds, segments, n_residues):
+    """
+    Find the residues that start an n-turn, for n in 3, 4, and 5.
+    """
+    starts = {}
+    for stride in (3, 4, 5):
+        start = np.zeros(n_residues, dtype=bool)
+        if n_residues > stride:
+            first = np.arange(n_residues - stride)
+            last = first + stride
+            start[first] = _no_break(segments, first, last) & hbonds(last, first)
+        starts[stride] = start
+    return starts
+
+
+def _bends(backbone, segments):
+    """
+    Find the residues where the chain bends by more than 70°.
+    """
+    n_residues = len(backbone)
+    bends = np.zeros(n_residues, dtype=bool)
+    if n_residues < 5:
+        return bends
+    alpha = backbone[:, _CA]
+    middle = np.arange(2, n_residues - 2)
+    before = alpha[middle] - alpha[middle - 2]
+    after = alpha[middle + 2] - alpha[middle]
+    norms = np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosines = np.sum(before * after, axis=1) / norms
+    kappa = np.degrees(np.arccos(np.clip(cosines, -1, 1)))
+    with np.errstate(invalid='ignore'):
+        bends[middle] = (kappa > MIN_BEND_ANGLE) \
+            & _no_break(segments, middle - 2, middle + 2)
+    return bends
+
+
+def _bridges(hbonds, segments, n_residues):
+    """
+    Find the β bridges, as (i, j, parallel) tuples sorted by i then j.
+    """
+    keys = hbonds.keys
+    donors = keys // n_residues
+    acceptors = keys % n_residues
+    # The residues that can form a bridge because of each hydrogen bond.
+    first = np.concatenate([acceptors + 1, donors, acceptors + 1, donors, acceptors])
+    second = np.concatenate([donors, acceptors + 1, donors - 1, acceptors, donors])
+    candidates = np.stack([np.minimum(first, second), np.maximum(first, second)])
+    candidates = np.unique(candidates, axis=1)
+    i, j = candidates
+    keep = (i >= 1) & (i + 4 < n_residues) & (j >= i + 3) & (j + 1 < n_residues)
+    i = i[keep]
+    j = j[keep]
+    continuous = _no_break(segments, i - 1, i + 1) & _no_break(segments, j - 1, j + 1)
+    parallel = ((hbonds(i + 1, j) & hbonds(j, i - 1))
+                | (hbonds(j + 1, i) & hbonds(i, j - 1)))
+    antiparallel = ((hbonds(i + 1, j - 1) & hbonds(j + 1, i - 1))
+                    | (hbonds(j, i) & hbonds(i, j)))
+    parallel &= continuous
+    antiparallel &= continuous & ~parallel
+    bridged = parallel | antiparallel
+    # np.unique sorts the candidates by i, then by j.
+    return list(zip(i[bridged].tolist(), j[bridged].tolist(),
+                    parallel[bridged].tolist()))
+
+
+def _ladders(bridges, chains):
+    """
+    Group consecutive bridges in ladders, and join the ladders separated by a
+    β bulge.
+    """
+    ladders = []
+    for i, j, parallel in bridges:
+        for ladder in ladders:
+            if ladder['parallel'] != parallel or i != ladder['i'][-1] + 1:
+                continue
+            if parallel and ladder['j'][-1] + 1 == j:
+                ladder['i'].append(i)
+                ladder['j'].append(j)
+                break
+            if not parallel and ladder['j'][0] - 1 == j:
+                ladder['i'].append(i)
+                ladder['j'].insert(0, j)
+                break
+        else:  # no break
+            ladders.append({'i': [i], 'j': [j], 'parallel': parallel})
+
+    ladders.sort(key=lambda ladder: (str(chains[ladder['i'][0]]), ladder['i'][0]))
+
+    def difference(high, low):
+        # DSSP computes these differences with unsigned integers, a negative
+        # difference is therefore very large.
+        return high - low if high >= low else np.inf
+
+    idx = 0
+    while idx < len(ladders):
+        ladder = ladders[idx]
+        jdx = idx + 1
+        while jdx < len(ladders):
+            other = ladders[jdx]
+            ibi, iei = ladder['i'][0], ladder['i'][-1]
+            jbi, jei = ladder['j'][0], ladder['j'][-1]
+            ibj, iej = other['i'][0], other['i'][-1]
+            jbj, jej = other['j'][0], other['j'][-1]
+            if (ladder['parallel'] != other['parallel']
+                    or chains[min(ibi, ibj)] != chains[max(iei, iej)]
+                    or chains[min(jbi, jbj)] != chains[max(jei, jej)]
+                    or difference(ibj, iei) >= 6
+                    or (iei >= ibj and ibi <= iej)):
+                jdx += 1
+                continue
+            if ladder['parallel']:
+                bulge = ((difference(jbj, jei) < 6 and difference(ibj, iei) < 3)
+                         or difference(jbj, jei) < 3)
+            else:
+                bulge = ((difference(jbi, jej) < 6 and difference(ibj, iei) < 3)
+                         or difference(jbi, jej) < 3)
+            if bulge:
+                ladder['i'].extend(other['i'])
+                if ladder['parallel']:
+                    ladder['j'].extend(other['j'])
+                else:
+                    ladder['j'][:0] = other['j']
+                del ladders[jdx]
+            else:
+                jdx += 1
+        idx += 1
+    return ladders
+
+
+def secondary_structure(backbone, proline, chains):
+    """
+    Assign the secondary structure of residues from their backbone.
+
+    Parameters
+    ----------
+    backbone: numpy.ndarray
+        The positions of the N, CA, C, and O atoms of each residue, in Å, as
+        an array of shape (n_residues, 4, 3).
+    proline: numpy.ndarray
+        Whether each residue is a proline.
+    chains: list
+        The chain of each residue.
+
+    Returns
+    -------
+    list[str]
+        The secondary structure of each residue, as one-letter codes. See
+        :func:`vermouth.dssp.dssp.read_dssp2`.
+    """
+    n_residues = len(backbone)
+    structure = np.full(n_residues, 'C')
+    if not n_residues:
+        return []
+    segments = chain_segments(backbone, chains)
+    best_acceptors, best_energies = best_hbonds(
+        n_residues, *hbond_energies(backbone, proline, segments)
+    )
+    hbonds = _HBonds(best_acceptors, best_energies)
+
+    # β bridges and strands.
+    for ladder in _ladders(_bridges(hbonds, segments, n_residues), chains):
+        code = 'E' if len(ladder['i']) > 1 else 'B'
+        for strand in (ladder['i'], ladder['j']):
+            section = structure[strand[0]:strand[-1] + 1]
+            section[section != 'E'] = code
+
+    # Helices. The α-helices take precedence over anything else, the other
+    # helices only replace coils.
+    starts = _helix_starts(hbonds, segments, n_residues)
+    for stride, code, replaceable in ((4, 'H', None), (3, 'G', 'CG'), (5, 'I', 'CI')):
+        consecutive = np.zeros(n_residues, dtype=bool)
+        consecutive[1:] = starts[stride][1:] & starts[stride][:-1]
+        if replaceable is not None:
+            empty = np.isin(structure, list(replaceable))
+            consecutive &= _windows_all(empty, stride)
+        structure[_spread(consecutive, stride)] = code
+
+    # Turns and bends only replace coils, and exclude the ends.
+    turns = np.zeros(n_residues, dtype=bool)
+    for stride in (3, 4, 5):
+        for shift in range(1, stride):
+            turns[shift:] |= starts[stride][:-shift]
+    bends = _bends(backbone, segments)
+    coil = structure == 'C'
+    coil[0] = coil[-1] = False
+    structure[coil & turns] = 'T'
+    structure[coil & ~turns & bends] = 'S'
+    return structure.tolist()
+
+
+def assign_secondary_structure(molecule):
+    """
+    Assign the secondary structure of each residue of a molecule.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule to assign. The atom names must be compatible with the
+        'universal' force field.
+
+    Returns
+    -------
+    list[str]
+        One secondary structure code per residue, in the order of
+        :meth:`~vermouth.molecule.Molecule.iter_residues`. The residues
+        without a complete backbone are assigned a coil ('C').
+    """
+    complete, backbone, proline, chains = read_backbone(molecule)
+    result = np.full(len(complete), 'C')
+    result[complete] = secondary_structure(backbone, proline, chains)
+    return result.tolist()
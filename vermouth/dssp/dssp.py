@@ -17,15 +17,23 @@ Assign protein secondary structures using DSSP.
 """
 
 import collections
+import hashlib
 import os
+import shutil
 import subprocess
 import logging
 
+from ..executors import SerialExecutor, ThreadExecutor
 from ..pdb import pdb
 from ..system import System
 from ..processors.processor import Processor
 from ..selectors import is_protein, selector_has_position, filter_minimal, select_all
 from .. import utils
+from .builtin import assign_secondary_structure
+
+# The executable name that selects the builtin implementation of DSSP rather
+# than an external program.
+BUILTIN_DSSP = 'builtin'
 
 
 class DSSPError(Exception):
@@ -141,7 +149,51 @@ def read_dssp2(lines):
     return secstructs
 
 
-def run_dssp(system, executable='dssp', savefile=None):
+def _executable_identity(executable):
+    """
+    Describe the DSSP executable that would run, so that a different version
+    of DSSP does not reuse cached outputs.
+    """
+    path = shutil.which(executable)
+    if path is None:
+        return executable
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return '{} {} {}'.format(path, stat.st_size, stat.st_mtime_ns)
+
+
+def dssp_cache_key(pdb_string, executable='dssp'):
+    """
+    Compute the key under which the output of DSSP is cached.
+
+    The key covers the PDB file except for the hydrogen atoms. DSSP ignores
+    them, and the repair of a molecule can name symmetric hydrogens
+    differently from one run to the next.
+
+    Parameters
+    ----------
+    pdb_string: str
+        The PDB file given to DSSP.
+    executable: str
+        The path or name in the research PATH of the DSSP executable. The
+        key covers the path of the executable it resolves to, and its size
+        and modification time.
+
+    Returns
+    -------
+    str
+        The key as an hexadecimal string.
+    """
+    digest = hashlib.sha256(_executable_identity(executable).encode('utf8'))
+    for line in pdb_string.splitlines():
+        # The element is in columns 77 and 78.
+        if not (line.startswith(('ATOM', 'HETATM')) and line[76:78].strip() == 'H'):
+            digest.update(b'\n')
+            digest.update(line.encode('utf8'))
+    return digest.hexdigest()
+
+
+def run_dssp(system, executable='dssp', savefile=None, cache=None):
     """
     Run DSSP on a system and return the assigned secondary structures.
 
@@ -161,6 +213,10 @@ def run_dssp(system, executable='dssp', savefile=None):
     If "savefile" is set to a path, then the output of DSSP is written in
     that file.
 
+    If a "cache" is given, the output of DSSP is looked for in it before
+    running DSSP, and stored in it after. The outputs are keyed by
+    :func:`dssp_cache_key`.
+
     Parameters
     ----------
     system: System
@@ -168,6 +224,8 @@ def run_dssp(system, executable='dssp', savefile=None):
         Where to find the DSSP executable.
     savefile: None or str or pathlib.Path
         If set to a path, the output of DSSP is written in that file.
+    cache: None or vermouth.cache.TextCache
+        Where to reuse the outputs of DSSP from.
 
     Returns
     list of str
@@ -187,19 +245,25 @@ def run_dssp(system, executable='dssp', savefile=None):
     read_dssp2
         Parse a DSSP output.
     """
-    process = subprocess.Popen(
-        [executable, "-i", "/dev/stdin"],
-        stderr=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stdin=subprocess.PIPE
-    )
-    out, err = process.communicate(
-        pdb.write_pdb_string(system, conect=False).encode('utf8')
-    )
-    out = out.decode('utf8')
-    status = process.wait()
-    if status:
-        raise DSSPError(err.decode('utf8'))
+    pdb_string = pdb.write_pdb_string(system, conect=False)
+    out = None
+    if cache is not None:
+        key = dssp_cache_key(pdb_string, executable)
+        out = cache.get(key)
+    if out is None:
+        process = subprocess.Popen(
+            [executable, "-i", "/dev/stdin"],
+            stderr=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stdin=subprocess.PIPE
+        )
+        out, err = process.communicate(pdb_string.encode('utf8'))
+        out = out.decode('utf8')
+        status = process.wait()
+        if status:
+            raise DSSPError(err.decode('utf8'))
+        if cache is not None:
+            cache.put(key, out)
     if savefile is not None:
         with open(str(savefile), 'w') as outfile:
             outfile.write(out)
@@ -218,7 +282,8 @@ def _savefile_path(molecule, savedir=None):
     return savefile
 
 
-def annotate_dssp(molecule, executable='dssp', savedir=None, attribute='secstruct'):
+def annotate_dssp(molecule, executable='dssp', savedir=None, attribute='secstruct',
+                  cache=None):
     """
     Adds the DSSP assignation to the atoms of a molecule.
 
@@ -233,6 +298,11 @@ def annotate_dssp(molecule, executable='dssp', savedir=None, attribute='secstruc
     The atom names are assumed to be compatible with DSSP. Atoms with no known
     position are not passed to DSSP which may lead to an error in DSSP.
 
+    If "executable" is "builtin", the secondary structure is assigned by
+    :func:`vermouth.dssp.builtin.assign_secondary_structure` rather than by
+    an external program. Then, no output is saved in "savedir", and residues
+    with an incomplete backbone are assigned a coil.
+
     .. warning::
 
         The molecule is annotated **in-place**.
@@ -244,17 +314,20 @@ def annotate_dssp(molecule, executable='dssp', savedir=None, attribute='secstruc
         to write a PDB file; other atom attributes, edges, or molecule
         attributes are not used.
     executable: str
-        The path or name in the research PATH of the DSSP executable.
+        The path or name in the research PATH of the DSSP executable, or
+        "builtin".
     savedir: None or str
         If set to a path, the DSSP output will be written in this **directory**.
         The option is only available if chains are defined with the 'chain'
         atom attribute.
     attribute: str
         The name of the atom attribute in which to store the annotation.
+    cache: None or vermouth.cache.TextCache
+        Where to reuse the outputs of DSSP from. See :func:`run_dssp`.
 
     See Also
     --------
-    run_dssp, read_dssp2
+    run_dssp, read_dssp2, vermouth.dssp.builtin.assign_secondary_structure
     """
     if not is_protein(molecule):
         return
@@ -267,11 +340,13 @@ def annotate_dssp(molecule, executable='dssp', savedir=None, attribute='secstruc
     if not clean_pos:
         return
 
-    savefile = _savefile_path(molecule, savedir)
-
-    system = System()
-    system.add_molecule(clean_pos)
-    secstructs = run_dssp(system, executable, savefile)
+    if executable == BUILTIN_DSSP:
+        secstructs = assign_secondary_structure(clean_pos)
+    else:
+        savefile = _savefile_path(molecule, savedir)
+        system = System()
+        system.add_molecule(clean_pos)
+        secstructs = run_dssp(system, executable, savefile, cache)
 
     annotate_residues_from_sequence(molecule, attribute, secstructs)
 
@@ -432,15 +507,47 @@ def convert_dssp_annotation_to_martini(
 
 
 class AnnotateDSSP(Processor):
+    """
+    Annotate the secondary structure of the proteins with DSSP.
+
+    The external DSSP program runs in its own process for each molecule, so
+    the molecules are annotated by a pool of threads that run several DSSP
+    processes at the same time. The annotations are attached to the
+    molecules they come from regardless of the order in which DSSP finishes.
+    If DSSP fails for some molecules, the error of the first of them is
+    raised once all the molecules are processed.
+
+    Parameters
+    ----------
+    executable: str
+        The path or name in the research PATH of the DSSP executable, or
+        "builtin". See :func:`annotate_dssp`.
+    savedir: None or str
+        If set to a path, the DSSP output of each chain is written in this
+        directory.
+    max_workers: int or None
+        How many DSSP processes run at the same time. By default, one per
+        CPU. The builtin DSSP does not start processes and uses the default
+        executor of the processors instead.
+    cache: None or vermouth.cache.TextCache
+        Where to reuse the outputs of DSSP from. See :func:`run_dssp`.
+    """
     name = 'AnnotateDSSP'
 
-    def __init__(self, executable='dssp', savedir=None):
+    def __init__(self, executable='dssp', savedir=None, max_workers=None, cache=None):
         super().__init__()
         self.executable = executable
         self.savedir = savedir
+        self.max_workers = max_workers
+        self.cache = cache
+        if executable != BUILTIN_DSSP:
+            if max_workers == 1:
+                self.executor = SerialExecutor()
+            else:
+                self.executor = ThreadExecutor(max_workers or os.cpu_count())
 
     def run_molecule(self, molecule):
-        annotate_dssp(molecule, self.executable, self.savedir)
+        annotate_dssp(molecule, self.executable, self.savedir, cache=self.cache)
         return molecule
 
 
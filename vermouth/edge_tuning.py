@@ -22,10 +22,10 @@ import functools
 import numpy as np
 import networkx as nx
 
-from . import KDTree
 from . import selectors
-from . import geometry
-from .utils import distance
+from . import neighbor_search
+from . import graph_utils
+from .coordinates import gather_positions
 
 
 def _edge_is_between_selections(edge, selection_a, selection_b):
@@ -114,7 +114,8 @@ def prune_edges_with_selectors(molecule, selector_a, selector_b=None):
 
 
 def add_edges_at_distance(molecule, threshold,
-                          selection_a, selection_b, attribute='position'):
+                          selection_a, selection_b, attribute='position',
+                          box=None):
     """
     Add edges within a molecule when the distance is below a threshold.
 
@@ -141,6 +142,10 @@ def add_edges_at_distance(molecule, threshold,
     attribute: collections.abc.Hashable
         Name of the key in the node dictionaries under which the coordinates
         are stored.
+    box: numpy.ndarray or None
+        Periodic box in any format accepted by
+        :func:`vermouth.neighbor_search.box_matrix`, or ``None`` to ignore
+        periodic boundary conditions.
 
     Raises
     ------
@@ -151,19 +156,23 @@ def add_edges_at_distance(molecule, threshold,
     selection_b = set(selection_b)
     keys_a = np.array([key for key in molecule.nodes.keys() if key in selection_a])
     keys_b = np.array([key for key in molecule.nodes.keys() if key in selection_b])
-    coordinates_a = np.stack([
-        molecule.nodes[key][attribute] for key in keys_a
-    ])
-    coordinates_b = np.stack([
-        molecule.nodes[key][attribute] for key in keys_b
-    ])
-
-    distance_matrix = geometry.distance_matrix(coordinates_a, coordinates_b)
-    index_a, index_b = np.where(distance_matrix < threshold)
+    if not len(keys_a) or not len(keys_b):
+        return
+    coordinates_a = gather_positions(
+        (molecule.nodes[key] for key in keys_a), attribute
+    )
+    coordinates_b = gather_positions(
+        (molecule.nodes[key] for key in keys_b), attribute
+    )
+
+    index_a, index_b, distances = neighbor_search.pairs_between(
+        coordinates_a, coordinates_b, threshold, box=box
+    )
+    under = distances < threshold
     edges = (
         (node1, node2, {'distance': distance})
         for node1, node2, distance
-        in zip(keys_a[index_a], keys_b[index_b], distance_matrix[index_a, index_b])
+        in zip(keys_a[index_a[under]], keys_b[index_b[under]], distances[under])
     )
 
     molecule.add_edges_from(edges)
@@ -249,7 +258,7 @@ def add_inter_molecule_edges(molecules, edges):
 
 def pairs_under_threshold(molecules, threshold,
                           selection_a, selection_b,
-                          attribute='position', min_edges=0):
+                          attribute='position', min_edges=0, box=None):
     """
     List pairs of nodes from a selection that are closer than a threshold.
 
@@ -286,6 +295,10 @@ def pairs_under_threshold(molecules, threshold,
     min_edges: int
         Do not select pairs that are connected by less than that number of
         edges.
+    box: numpy.ndarray or None
+        Periodic box in any format accepted by
+        :func:`vermouth.neighbor_search.box_matrix`, or ``None`` to ignore
+        periodic boundary conditions.
 
     Yields
     ------
@@ -303,39 +316,48 @@ def pairs_under_threshold(molecules, threshold,
 
     Symetric node pairs are not deduplicated.
     """
-    coordinates_a = []
-    for key in selection_a:
-        coordinates_a.append(molecules[key[0]].nodes[key[1]][attribute])
-    coordinates_b = []
-    for key in selection_b:
-        coordinates_b.append(molecules[key[0]].nodes[key[1]][attribute])
-    if not coordinates_a or not coordinates_b:
+    if not selection_a or not selection_b:
         return
-    kdtree_a = KDTree(coordinates_a)
-    kdtree_b = KDTree(coordinates_b)
-    sparse_distance_matrix = kdtree_a.sparse_distance_matrix(kdtree_b, threshold)
-    for (idx, jdx), distance_between in sparse_distance_matrix.items():
+    coordinates_a = gather_positions(
+        (molecules[key[0]].nodes[key[1]] for key in selection_a), attribute
+    )
+    coordinates_b = gather_positions(
+        (molecules[key[0]].nodes[key[1]] for key in selection_b), attribute
+    )
+    pairs = neighbor_search.pairs_between(
+        coordinates_a, coordinates_b, threshold, box=box
+    )
+    connectivities = {}
+    for idx, jdx, distance_between in zip(*pairs):
         key_a = selection_a[idx]
         key_b = selection_b[jdx]
-        node_a = molecules[key_a[0]].nodes[key_a[1]]
-        node_b = molecules[key_b[0]].nodes[key_b[1]]
         if key_a != key_b and distance_between < threshold:
-            if not _are_close(min_edges, molecules, key_a, key_b):
+            if not _are_close(min_edges, molecules, key_a, key_b, connectivities):
                 yield (key_a, key_b, distance_between)
 
 
-def _are_close(threshold, molecules, key_a, key_b):
+def _are_close(threshold, molecules, key_a, key_b, connectivities=None):
+    """
+    Tell if two nodes are in the same molecule and connected by less than
+    `threshold` edges.
+
+    The neighborhoods explored for each molecule are cached in the
+    `connectivities` dictionary, if one is provided, so they can be reused
+    between calls.
+    """
     if not threshold:
         return False
-    if key_a[0] == key_b[0]:
-        try:
-            length = nx.shortest_path_length(
-                molecules[key_a[0]], key_a[1], key_b[1]
-            )
-        except nx.exception.NetworkXNoPath:
-            return False
-        else:
-            return length < threshold
+    if key_a[0] != key_b[0]:
+        return False
+    if connectivities is None:
+        connectivities = {}
+    try:
+        connectivity = connectivities[key_a[0]]
+    except KeyError:
+        connectivity = graph_utils.KHopConnectivity(molecules[key_a[0]],
+                                                    threshold - 1)
+        connectivities[key_a[0]] = connectivity
+    return connectivity.are_connected(key_a[1], key_b[1])
 
 
 def select_nodes_multi(molecules, selector):
@@ -367,7 +389,7 @@ def select_nodes_multi(molecules, selector):
 
 def add_edges_threshold(molecules, threshold,
                         templates_a, templates_b,
-                        attribute='position', min_edges=0):
+                        attribute='position', min_edges=0, box=None):
     """
     Add edges between two selections when under a given threshold.
 
@@ -392,6 +414,10 @@ def add_edges_threshold(molecules, threshold,
         are stored.
     min_edges: int
         Minimum number of edges between to nodes for an edge to be added.
+    box: numpy.ndarray or None
+        Periodic box in any format accepted by
+        :func:`vermouth.neighbor_search.box_matrix`, or ``None`` to ignore
+        periodic boundary conditions.
 
     Returns
     -------
@@ -408,7 +434,7 @@ def add_edges_threshold(molecules, threshold,
     selection_b = list(select_nodes_multi(molecules, selector_b))
     edges = pairs_under_threshold(molecules, threshold,
                                   selection_a, selection_b,
-                                  attribute, min_edges=min_edges)
+                                  attribute, min_edges=min_edges, box=box)
     edges = (
         (node1, node2, {'distance': distance})
         for node1, node2, distance in edges
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Provides executors to apply a function to many items, such as the molecules
+of a system.
+
+All the executors have a `map` method with the same signature. They return
+the results in the order of the items. An executor holds its workers until
+:meth:`~SerialExecutor.shutdown` is called, or until the end of a `with`
+block.
+"""
+
+import concurrent.futures
+import io
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+
+
+class _Executor:
+    """
+    Shutdown and context manager methods shared by the executors.
+    """
+    def shutdown(self):
+        """
+        Release the workers of the executor, if any.
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+class SerialExecutor(_Executor):
+    """
+    Apply the function to the items one after the other, in the current
+    thread.
+
+    The results are computed lazily, as they are consumed.
+    """
+    def map(self, function, items, shared=()):  # pylint: disable=unused-argument
+        """
+        Apply `function` to each item of `items`.
+
+        Parameters
+        ----------
+        function: collections.abc.Callable
+            The function to apply.
+        items: collections.abc.Iterable
+            The items to apply the function to.
+        shared: collections.abc.Sequence
+            Large objects the items refer to. Not used by this executor.
+
+        Returns
+        -------
+        collections.abc.Iterator
+            The result for each item, in order.
+        """
+        return map(function, items)
+
+
+class ThreadExecutor(_Executor):
+    """
+    Apply the function to the items in a pool of threads.
+
+    Threads do not need to copy the items, but they only help when the
+    function releases the GIL.
+
+    Parameters
+    ----------
+    max_workers: int or None
+        The number of threads. By default, use as many threads as
+        :class:`concurrent.futures.ThreadPoolExecutor` does.
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+    def map(self, function, items, shared=()):  # pylint: disable=unused-argument
+        """
+        Apply `function` to each item of `items`.
+
+        See :meth:`SerialExecutor.map` for the parameters.
+        """
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+            return list(pool.map(function, items))
+
+
+# State of a worker process of a ProcessExecutor. The function and the shared
+# objects of the current call to `map` are read by _run_task the first time
+# the worker gets a task of that call.
+_WORKER_STATE = {}
+
+
+class _RecordingHandler(logging.Handler):
+    """
+    Keep the log records of a worker so they can be sent to the calling
+    process.
+    """
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # The message is formatted here, as its arguments may not be
+        # picklable; this is what logging.handlers.QueueHandler does too.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _logger_levels():
+    """
+    The level of the root logger and of all the known loggers, by name.
+    """
+    levels = {'': logging.getLogger().level}
+    for name, logger in logging.Logger.manager.loggerDict.items():
+        if isinstance(logger, logging.Logger):
+            levels[name] = logger.level
+    return levels
+
+
+def _handle_records(records):
+    """
+    Handle log records sent by a worker as if they were logged here.
+    """
+    for record in records:
+        logging.getLogger(record.name).handle(record)
+
+
+class _SharedPickler(pickle.Pickler):
+    """
+    Pickler that refers to the shared objects by their index instead of
+    copying them.
+    """
+    def __init__(self, file, shared):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._shared_ids = {id(obj): idx for idx, obj in enumerate(shared)}
+
+    def persistent_id(self, obj):  # pylint: disable=method-hidden
+        return self._shared_ids.get(id(obj))
+
+
+class _SharedUnpickler(pickle.Unpickler):
+    """
+    Unpickler that resolves the references written by :class:`_SharedPickler`.
+    """
+    def __init__(self, file, shared):
+        super().__init__(file)
+        self._shared = shared
+
+    def persistent_load(self, pid):
+        return self._shared[pid]
+
+
+def _dumps(obj, shared):
+    buffer = io.BytesIO()
+    _SharedPickler(buffer, shared).dump(obj)
+    return buffer.getvalue()
+
+
+def _loads(payload, shared):
+    return _SharedUnpickler(io.BytesIO(payload), shared).load()
+
+
+def _initialize_worker(levels):
+    # The records logged in the worker are only recorded, the calling process
+    # handles them with its own handlers. Otherwise, they would not be
+    # counted by the handlers of the calling process.
+    loggers = [logging.getLogger(name) for name in levels]
+    for logger, level in zip(loggers, levels.values()):
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = True
+    handler = _RecordingHandler()
+    logging.getLogger().addHandler(handler)
+    _WORKER_STATE['handler'] = handler
+
+
+def _run_task(task):
+    path, payload = task
+    if _WORKER_STATE.get('path') != path:
+        with open(path, 'rb') as infile:
+            _WORKER_STATE['function'], _WORKER_STATE['shared'] = pickle.load(infile)
+        _WORKER_STATE['path'] = path
+    shared = _WORKER_STATE['shared']
+    handler = _WORKER_STATE['handler']
+    handler.records = []
+    result = _WORKER_STATE['function'](_loads(payload, shared))
+    return _dumps(result, shared), handler.records
+
+
+class ProcessExecutor(_Executor):
+    """
+    Apply the function to the items in a pool of processes.
+
+    The pool starts with the first call to :meth:`map`, and is reused by the
+    next calls until :meth:`shutdown`. For each call, the function and the
+    shared objects are written once in a temporary file that each worker
+    reads once. The items and the results are serialized with references to
+    the shared objects instead of copies, so large objects such as force
+    fields are not serialized for every item. The shared objects found in the
+    results are the ones of the calling process.
+
+    The records logged by the workers are handled by the loggers of the
+    calling process, when the result they come with is consumed.
+
+    The function, the items, and the results must be picklable. Changes the
+    function makes to objects other than the returned result are not seen by
+    the calling process.
+
+    Parameters
+    ----------
+    max_workers: int or None
+        The number of processes. By default, use as many processes as there
+        are CPUs.
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._pool = None
+        self._directory = None
+        self._cleanup = None
+        self._calls = 0
+
+    def __getstate__(self):
+        # The executor is pickled with the processors that refer to it. The
+        # workers get an executor without the pool of the calling process.
+        return {'max_workers': self.max_workers}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_workers'])
+
+    @property
+    def processes(self):
+        """
+        The number of processes of the pool.
+        """
+        return self.max_workers or multiprocessing.cpu_count()
+
+    def _start(self):
+        if self._pool is None:
+            self._directory = tempfile.mkdtemp(prefix='vermouth-')
+            # The directory is deleted at exit if the executor is not shut
+            # down.
+            self._cleanup = weakref.finalize(
+                self, shutil.rmtree, self._directory, ignore_errors=True
+            )
+            self._pool = multiprocessing.Pool(
+                self.processes, _initialize_worker, (_logger_levels(),)
+            )
+        return self._pool
+
+    def map(self, function, items, shared=()):
+        """
+        Apply `function` to each item of `items`.
+
+        See :meth:`SerialExecutor.map` for the parameters.
+        """
+        shared = list(shared)
+        payloads = [_dumps(item, shared) for item in items]
+        if not payloads:
+            return []
+        pool = self._start()
+        self._calls += 1
+        path = os.path.join(self._directory, '{}.pickle'.format(self._calls))
+        with open(path, 'wb') as outfile:
+            pickle.dump((function, shared), outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        chunksize = max(1, len(payloads) // (4 * self.processes))
+        tasks = [(path, payload) for payload in payloads]
+        results = []
+        try:
+            for result, records in pool.imap(_run_task, tasks, chunksize):
+                _handle_records(records)
+                results.append(_loads(result, shared))
+        finally:
+            os.remove(path)
+        return results
+
+    def shutdown(self):
+        """
+        Stop the pool of processes, and delete its temporary files.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            self._cleanup()
+            self._directory = None
+
+
+def make_executor(processes):
+    """
+    Build the executor that uses a given number of processes.
+
+    Parameters
+    ----------
+    processes: int or None
+        The number of processes. 1 gives a serial executor, and `None` or 0
+        a pool with one process per CPU.
+
+    Returns
+    -------
+    SerialExecutor or ProcessExecutor
+    """
+    if processes == 1:
+        return SerialExecutor()
+    return ProcessExecutor(processes or None)
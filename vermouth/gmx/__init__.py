@@ -17,6 +17,6 @@ Provides functionality to read and write Gromacs specific files.
 """
 
 
-from .gro import read_gro, write_gro
+from .gro import read_gro, write_gro, iter_gro_frames, write_gro_frames
 from .itp import write_molecule_itp
 from .rtp import read_rtp
@@ -16,17 +16,20 @@
 Provides functionality to read and write GRO96 files.
 """
 
+from array import array
 from functools import partial
 from itertools import chain
 
 import numpy as np
 
+from ..coordinates import CoordinateStore
 from ..molecule import Molecule
+from ..neighbor_search import box_matrix
 from ..truncating_formatter import TruncFormatter
 from ..utils import first_alpha
 
 
-def read_gro(file_name, exclude=('SOL',), ignh=False):
+def read_gro(file_name, exclude=('SOL',), ignh=False, dtype=float):
     """
     Parse a gro file to create a molecule.
 
@@ -38,14 +41,26 @@ def read_gro(file_name, exclude=('SOL',), ignh=False):
         Atoms that have one of these residue names will not be included.
     ignh: bool
         Whether hydrogen atoms should be ignored.
+    dtype: numpy.dtype
+        The type of the coordinates.
 
     Returns
     -------
     vermouth.molecule.Molecule
-        The parsed molecules. Will not contain edges.
+        The parsed molecules. Will not contain edges. The coordinates of the
+        atoms are in a :class:`~vermouth.coordinates.CoordinateStore`, set as
+        the `coordinates` attribute of the molecule.
+
+    See Also
+    --------
+    read_gro_box
     """
     molecule = Molecule()
     idx = 0
+    # The coordinates are collected flat, rather than as a tuple per atom,
+    # to not hold several times their size until the store is built.
+    positions = array('d')
+    velocities = array('d')
     field_types = [int, str, str, int, float, float, float]
     field_names = ['resid', 'resname', 'atomname', 'atomid', 'x', 'y', 'z']
     field_widths = [5, 5, 5, 5]
@@ -98,18 +113,130 @@ def read_gro(file_name, exclude=('SOL',), ignh=False):
             if properties['resname'] in exclude or (ignh and properties['element'] == 'H'):
                 continue
 
-            pos = (properties.pop('x'), properties.pop('y'), properties.pop('z'))
-            properties['position'] = np.array(pos, dtype=float)
+            positions.extend((properties.pop('x'), properties.pop('y'),
+                              properties.pop('z')))
 
             if has_vel:
-                vel = (properties.pop('vx'), properties.pop('vy'), properties.pop('vz'))
-                properties['velocity'] = np.array(vel, dtype=float)
+                velocities.extend((properties.pop('vx'), properties.pop('vy'),
+                                   properties.pop('vz')))
 
             molecule.add_node(idx, **properties)
             idx += 1
+    molecule.coordinates = CoordinateStore.for_nodes(
+        molecule.nodes.values(), positions, velocities if has_vel else None,
+        dtype=dtype,
+    )
     return molecule
 
 
+def parse_box_line(line):
+    """
+    Parse the box line of a GRO file.
+
+    Parameters
+    ----------
+    line: str
+        The box line. It contains either 3 values for a rectangular box, or 9
+        values for a triclinic box.
+
+    Returns
+    -------
+    numpy.ndarray or None
+        The box as a 3x3 matrix in which each row is a box vector. ``None``
+        is returned if the line does not describe a box with a volume.
+    """
+    try:
+        values = [float(value) for value in line.split()]
+    except ValueError:
+        return None
+    if len(values) not in (3, 9):
+        return None
+    return box_matrix(values)
+
+
+def read_gro_box(file_name):
+    """
+    Read the box of the first frame of a GRO file.
+
+    The atom lines are skipped without being parsed.
+
+    Parameters
+    ----------
+    file_name: str
+        The file to read.
+
+    Returns
+    -------
+    numpy.ndarray or None
+        The box as a 3x3 matrix in which each row is a box vector, or ``None``
+        if the file does not describe a box with a volume.
+    """
+    with open(str(file_name)) as gro:
+        next(gro)  # skip title
+        num_atoms = int(next(gro))
+        for _ in range(num_atoms):
+            next(gro)
+        return parse_box_line(next(gro, ''))
+
+
+def _keyfunc(graph, node_idx):
+    """Key function for sorting nodes."""
+    # TODO add something like idx_in_residue
+    return (graph.node[node_idx]['chain'],
+            graph.node[node_idx]['resid'],
+            graph.node[node_idx]['resname'])
+
+
+def iter_gro_frames(file_name, exclude=('SOL',), ignh=False):
+    """
+    Iterate over the frames of a GRO file as coordinate arrays.
+
+    A GRO file can contain several frames written one after the other. The
+    atoms are selected the same way :func:`read_gro` selects them, so the
+    rows of each frame correspond to the node keys of the molecule
+    :func:`read_gro` builds from the first frame.
+
+    Parameters
+    ----------
+    file_name: str
+        The file to read.
+    exclude: collections.abc.Container[str]
+        Atoms that have one of these residue names will not be included.
+    ignh: bool
+        Whether hydrogen atoms should be ignored.
+
+    Yields
+    ------
+    tuple[numpy.ndarray, numpy.ndarray]
+        The coordinates in nm of the atoms of a frame as a (n_atoms, 3)
+        array, and the box of the frame as a 3x3 matrix, or ``None`` if the
+        frame does not describe a box with a volume.
+    """
+    with open(str(file_name)) as gro:
+        for title in gro:
+            if not title.strip():
+                continue
+            num_atoms = int(next(gro))
+            lines = [next(gro) for _ in range(num_atoms)]
+            box = parse_box_line(next(gro))
+            if not lines:
+                yield np.zeros((0, 3)), box
+                continue
+            # The precision is given by the distance between two dots.
+            first_dot = lines[0].find('.', 25)
+            precision = lines[0].find('.', first_dot + 1) - first_dot
+            slices = [slice(20 + idx * precision, 20 + (idx + 1) * precision)
+                      for idx in range(3)]
+            positions = []
+            for line in lines:
+                resname = line[5:10].strip()
+                element = first_alpha(line[10:15].strip())
+                if resname in exclude or (ignh and element == 'H'):
+                    continue
+                positions.append([float(line[slice_]) for slice_ in slices])
+            yield np.array(positions, dtype=float).reshape((-1, 3)), box
+
+
 def write_gro(system, file_name, precision=7, title='Martinized!', box=(0, 0, 0)):
     """
     Write `system` to `file_name`, which will be a GRO96 file.
@@ -127,13 +254,6 @@ def write_gro(system, file_name, precision=7, title='Martinized!', box=(0, 0, 0)
     box: tuple[float]
         Box length and optionally angles.
     """
-    def keyfunc(graph, node_idx):
-        """Key function for sorting nodes."""
-        # TODO add something like idx_in_residue
-        return (graph.node[node_idx]['chain'],
-                graph.node[node_idx]['resid'],
-                graph.node[node_idx]['resname'])
-
     formatter = TruncFormatter()
     pos_format_string = '{{:{ntx}.3ft}}'.format(ntx=precision+1)
     format_string = '{:5dt}{:<5st}{:>5st}{:5dt}' + pos_format_string*3
@@ -150,7 +270,7 @@ def write_gro(system, file_name, precision=7, title='Martinized!', box=(0, 0, 0)
         out.write(formatter.format('{}\n', system.num_particles))  # number of atoms
         atomid = 1
         for molecule in system.molecules:
-            node_order = sorted(molecule, key=partial(keyfunc, molecule))
+            node_order = sorted(molecule, key=partial(_keyfunc, molecule))
             for node_idx in node_order:
                 node = molecule.node[node_idx]
                 atomname = node['atomname']
@@ -167,3 +287,73 @@ def write_gro(system, file_name, precision=7, title='Martinized!', box=(0, 0, 0)
                 out.write(line + '\n')
         # Box
         out.write(' '.join(str(value) for value in box))
+
+
+def _box_values(box):
+    """
+    Convert a box matrix into the values of a GRO box line.
+    """
+    if box is None:
+        return (0, 0, 0)
+    box = np.asarray(box)
+    values = [box[0, 0], box[1, 1], box[2, 2]]
+    off_diagonal = [box[0, 1], box[0, 2], box[1, 0],
+                    box[1, 2], box[2, 0], box[2, 1]]
+    if any(off_diagonal):
+        values.extend(off_diagonal)
+    return values
+
+
+def write_gro_frames(system, file_name, frames, precision=7, title='Martinized!'):
+    """
+    Write `system` to `file_name` as a GRO96 file with one frame per item of
+    `frames`.
+
+    The atom fields are formatted once from the nodes of `system`, only the
+    coordinates and the box are updated for each frame. Velocities are not
+    written.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+        The system to write.
+    file_name: str
+        The file to write to.
+    frames: collections.abc.Iterable[tuple[numpy.ndarray, numpy.ndarray]]
+        The positions and the box of each frame. The positions are given in
+        nm as an array with one row per node, ordered as the nodes of each
+        molecule of `system` in turn. The box is a 3x3 matrix, or ``None``.
+    precision: int
+        The desired precision for coordinates.
+    title: str
+        Title for the gro file.
+
+    See Also
+    --------
+    write_gro
+    """
+    formatter = TruncFormatter()
+    records = []
+    atomid = 1
+    offset = 0
+    for molecule in system.molecules:
+        rows = {key: offset + idx for idx, key in enumerate(molecule)}
+        for node_idx in sorted(molecule, key=partial(_keyfunc, molecule)):
+            node = molecule.node[node_idx]
+            prefix = formatter.format('{:5dt}{:<5st}{:>5st}{:5dt}', node['resid'],
+                                      node['resname'], node['atomname'], atomid)
+            records.append((rows[node_idx], prefix))
+            atomid += 1
+        offset += len(molecule)
+
+    template = '{{:{}.3f}}'.format(precision + 1)
+    with open(str(file_name), 'w') as out:
+        for positions, box in frames:
+            out.write(title + '\n')
+            out.write('{}\n'.format(len(records)))
+            for row, prefix in records:
+                coordinates = ''.join(template.format(value)[-(precision + 1):]
+                                      for value in positions[row])
+                out.write(prefix + coordinates + '\n')
+            out.write(' '.join('{:.5f}'.format(value)
+                               for value in _box_values(box)) + '\n')
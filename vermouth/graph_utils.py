@@ -17,7 +17,9 @@
 from collections import defaultdict
 import itertools
 import networkx as nx
+import numpy as np
 
+from . import matching_stats
 from .utils import maxes, first_alpha
 
 
@@ -84,6 +86,13 @@ def categorical_maximum_common_subgraph(graph1, graph2, attributes=tuple()):
 
 
 def maximum_common_subgraph(graph1, graph2, attributes=tuple()):
+    with matching_stats.timed('mcs', _match_name(graph1, graph2)) as found:
+        matches = _maximum_common_subgraph(graph1, graph2, attributes)
+        found.extend(matches)
+    return matches
+
+
+def _maximum_common_subgraph(graph1, graph2, attributes=tuple()):
     product = nx.Graph()
     # First, find the MCS between all nodes of degree != 1, such as the carbons
     # Nothing new or exciting here.
@@ -158,6 +167,21 @@ def maximum_common_subgraph(graph1, graph2, attributes=tuple()):
     return matches
 
 
+def _match_name(*graphs):
+    """
+    The name of the first block among graphs, or the residue name of the first
+    non empty graph, to count the searches with :mod:`vermouth.matching_stats`.
+    """
+    for graph in graphs:
+        name = getattr(graph, 'name', None)
+        if name:
+            return name
+    for graph in graphs:
+        for node in graph.nodes.values():
+            return node.get('resname')
+    return None
+
+
 def isomorphism(reference, residue):
     """
     Finds matching atoms between ``reference`` and ``residue``. ``residue`` should be
@@ -204,8 +228,10 @@ def isomorphism(reference, residue):
 #    heavy_ref.remove_nodes_from(ref_H_idxs)
     # First, generate all the isomorphisms on heavy atoms. For each of these
     # we'll find *something* where the hydrogens match.
+    name = _match_name(reference, residue)
     GM = ElementGraphMatcher(reference, heavy_res)
-    first_matches = list(GM.subgraph_isomorphisms_iter())
+    first_matches = list(matching_stats.track('isomorphism', name, GM,
+                                              GM.subgraph_isomorphisms_iter()))
     for match in first_matches:
         reverse_match = {v: k for k, v in match.items()}
         for res_H_idx in H_idxs:
@@ -241,7 +267,8 @@ def isomorphism(reference, residue):
         # hydrogens: the node-indices in heavy_res and residue are the same.
         GM_large.core_1 = match  # pylint: disable=attribute-defined-outside-init
         GM_large.core_2 = reverse_match  # pylint: disable=attribute-defined-outside-init
-        outcome = GM_large.subgraph_isomorphisms_iter()
+        outcome = matching_stats.track('isomorphism', name, GM_large,
+                                       GM_large.subgraph_isomorphisms_iter())
         # Take just the first match found, otherwise it becomes a combinatorics
         # problem (consider an alkane chain). This is fine though, since
         # hydrogrens are supposed to be equal. Let's say you have some sort of
@@ -258,6 +285,7 @@ def isomorphism(reference, residue):
         # include degree-1 nodes above.
         if match:
             matches.extend(itertools.islice(outcome, 1))
+            outcome.close()
         else:
             matches.extend(outcome)
     matches = sorted(matches,
@@ -267,6 +295,9 @@ def isomorphism(reference, residue):
 
 
 class ElementGraphMatcher(nx.isomorphism.GraphMatcher):
+    # Counted by vermouth.matching_stats when not None.
+    feasibility_checks = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         super().initialize()
@@ -276,6 +307,8 @@ class ElementGraphMatcher(nx.isomorphism.GraphMatcher):
 
     def semantic_feasibility(self, node1, node2):
         # TODO: implement (partial) wildcards
+        if self.feasibility_checks is not None:
+            self.feasibility_checks += 1
         elem1 = self.G1.node[node1]['element']
         elem2 = self.G2.node[node2]['element']
         return elem1 == elem2
@@ -420,3 +453,96 @@ def make_residue_graph(mol):
     res_graph = blockmodel(mol, grps, chain=chain, resid=resids,
                            resname=resnames, atomname=resnames)
     return res_graph
+
+
+class KHopConnectivity:
+    """
+    Sparse description of which nodes are within a number of edges.
+
+    The neighborhood of a node is computed the first time it is needed with a
+    breadth first search limited to `max_depth` edges, so that only the
+    vicinity of the nodes of interest is ever visited. Neighborhoods are
+    cached.
+
+    Parameters
+    ----------
+    graph: networkx.Graph
+        The graph to work on.
+    max_depth: int
+        The maximum number of edges between two nodes for them to be
+        considered connected. Must be >= 0.
+
+    Attributes
+    ----------
+    graph: networkx.Graph
+    max_depth: int
+    """
+    def __init__(self, graph, max_depth):
+        if max_depth < 0:
+            raise ValueError('The maximum depth has to be null or positive.')
+        self.graph = graph
+        self.max_depth = max_depth
+        self._neighborhoods = {}
+
+    def neighborhood(self, node):
+        """
+        The nodes within `max_depth` edges from a node.
+
+        Parameters
+        ----------
+        node: collections.abc.Hashable
+            A node key from the graph.
+
+        Returns
+        -------
+        dict[collections.abc.Hashable, int]
+            The nodes in the neighborhood, including `node` itself, and their
+            distance in number of edges from `node`.
+        """
+        try:
+            return self._neighborhoods[node]
+        except KeyError:
+            neighborhood = nx.single_source_shortest_path_length(
+                self.graph, node, cutoff=self.max_depth
+            )
+            self._neighborhoods[node] = neighborhood
+            return neighborhood
+
+    def distance(self, node_a, node_b):
+        """
+        The number of edges on the shortest path between two nodes.
+
+        Returns
+        -------
+        int or None
+            The number of edges, or ``None`` if the nodes are further than
+            `max_depth` edges from each other or are not connected.
+        """
+        return self.neighborhood(node_a).get(node_b)
+
+    def are_connected(self, node_a, node_b):
+        """
+        Whether two nodes are within `max_depth` edges from each other.
+        """
+        return node_b in self.neighborhood(node_a)
+
+    def pair_mask(self, nodes_a, nodes_b):
+        """
+        Tell which pairs of nodes are within `max_depth` edges.
+
+        Parameters
+        ----------
+        nodes_a: collections.abc.Iterable[collections.abc.Hashable]
+            The first node of each pair.
+        nodes_b: collections.abc.Iterable[collections.abc.Hashable]
+            The second node of each pair.
+
+        Returns
+        -------
+        numpy.ndarray
+            A boolean array with one value per pair.
+        """
+        return np.array([
+            self.are_connected(node_a, node_b)
+            for node_a, node_b in zip(nodes_a, nodes_b)
+        ], dtype=bool)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Count the graph matching searches, and where their time goes.
+
+The subgraph isomorphisms and the maximum common subgraphs are the expensive
+parts of vermouth. When counting is enabled with :func:`enable`, every search
+done by :func:`~vermouth.graph_utils.isomorphism`,
+:func:`~vermouth.graph_utils.maximum_common_subgraph`, and by the graph
+matchers of the mappings, the links, and the modifications is counted per
+kind of search and per name of residue, link, or modification: the number of
+searches, the number of calls to ``semantic_feasibility``, the number of
+matches found, and the time spent.
+
+Only the searches run in the current process are counted.
+"""
+
+import contextlib
+import threading
+import time
+
+# The statistics being recorded, or `None` when counting is disabled.
+ACTIVE = None
+
+
+class MatchingStats:
+    """
+    Counters of the graph matching searches.
+
+    Attributes
+    ----------
+    records: dict[tuple[str, str], dict[str, int or float]]
+        For each kind of search and name, the number of 'searches', of
+        'feasibility' checks, of 'matches' found, and the 'time' spent in
+        seconds.
+    """
+    def __init__(self):
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def _add(self, kind, name, feasibility, matches, seconds):
+        with self._lock:
+            record = self.records.setdefault(
+                (kind, name),
+                {'searches': 0, 'feasibility': 0, 'matches': 0, 'time': 0},
+            )
+            record['searches'] += 1
+            record['feasibility'] += feasibility
+            record['matches'] += matches
+            record['time'] += seconds
+
+    def track(self, kind, name, matcher, matches):
+        """
+        Count a search done with a graph matcher.
+
+        Parameters
+        ----------
+        kind: str
+        name: str
+        matcher: networkx.algorithms.isomorphism.GraphMatcher
+            A matcher that counts its feasibility checks in its
+            `feasibility_checks` attribute when it is not `None`.
+        matches: collections.abc.Iterator[dict]
+            The matches, as produced by the matcher.
+
+        Yields
+        ------
+        dict
+            The matches. Only the time spent producing them is counted.
+        """
+        matcher.feasibility_checks = 0
+        found = 0
+        seconds = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    match = next(matches)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - start
+                found += 1
+                yield match
+        finally:
+            self._add(kind, name, matcher.feasibility_checks, found, seconds)
+
+    @contextlib.contextmanager
+    def timed(self, kind, name):
+        """
+        Count a search done in the context.
+
+        Parameters
+        ----------
+        kind: str
+        name: str
+
+        Yields
+        ------
+        list
+            Put the matches found in this list to count them.
+        """
+        matches = []
+        start = time.perf_counter()
+        try:
+            yield matches
+        finally:
+            self._add(kind, name, 0, len(matches), time.perf_counter() - start)
+
+    def table(self):
+        """
+        Format the counters as a table, from the most to the least expensive.
+
+        Returns
+        -------
+        str
+        """
+        header = ('kind', 'name', 'searches', 'feasibility', 'matches', 'time (s)')
+        rows = [
+            (kind, str(name), str(record['searches']), str(record['feasibility']),
+             str(record['matches']), '{:.3f}'.format(record['time']))
+            for (kind, name), record in sorted(
+                self.records.items(), key=lambda item: -item[1]['time']
+            )
+        ]
+        widths = [max(len(row[column]) for row in [header] + rows)
+                  for column in range(len(header))]
+        lines = []
+        for row in [header] + rows:
+            cells = [cell.ljust(width) if column < 2 else cell.rjust(width)
+                     for column, (cell, width) in enumerate(zip(row, widths))]
+            lines.append('  '.join(cells).rstrip())
+        return '\n'.join(lines)
+
+
+def enable():
+    """
+    Start counting the searches.
+
+    Returns
+    -------
+    MatchingStats
+        The new counters.
+    """
+    global ACTIVE  # pylint: disable=global-statement
+    ACTIVE = MatchingStats()
+    return ACTIVE
+
+
+def disable():
+    """
+    Stop counting the searches.
+    """
+    global ACTIVE  # pylint: disable=global-statement
+    ACTIVE = None
+
+
+def track(kind, name, matcher, matches):
+    """
+    Count a search done with a graph matcher if counting is enabled.
+
+    See :meth:`MatchingStats.track`.
+
+    Returns
+    -------
+    collections.abc.Iterator[dict]
+        The matches.
+    """
+    if ACTIVE is None:
+        return matches
+    return ACTIVE.track(kind, name, matcher, iter(matches))
+
+
+def timed(kind, name):
+    """
+    Count a search done in the context if counting is enabled.
+
+    See :meth:`MatchingStats.timed`.
+    """
+    if ACTIVE is None:
+        return _untimed()
+    return ACTIVE.timed(kind, name)
+
+
+@contextlib.contextmanager
+def _untimed():
+    yield []
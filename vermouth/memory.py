@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Account for the memory used by the molecules of a system.
+
+The size of a molecule is split in categories:
+
+* 'node_dicts': the dictionaries of the node attributes;
+* 'positions': the arrays stored as 'position' and 'velocity';
+* 'node_attributes': the other node attributes, but 'graph';
+* 'subgraphs': the molecules stored as the 'graph' attribute of the nodes,
+  with everything they hold that is not counted elsewhere; for a
+  :class:`~vermouth.molecule.LazySubgraph`, that is the molecule it refers
+  to;
+* 'edges': the adjacency and the edge attributes;
+* 'interactions': the interaction lists and their content;
+* 'meta': the 'meta' attribute of the molecules;
+* 'molecules': the rest of the molecule objects.
+
+An object shared by several molecules, or by several attributes, is counted
+once, in the first category it is met in, in the order above. The force
+fields are not counted.
+"""
+
+import sys
+
+import numpy as np
+
+CATEGORIES = (
+    'node_dicts', 'positions', 'node_attributes', 'subgraphs', 'edges',
+    'interactions', 'meta', 'molecules',
+)
+POSITION_ATTRIBUTES = ('position', 'velocity')
+SUBGRAPH_ATTRIBUTE = 'graph'
+# Attributes that refer to objects shared by the whole program.
+SKIPPED_ATTRIBUTES = ('_force_field', 'force_field')
+
+
+def deep_size(obj, seen=None):
+    """
+    The size in bytes of an object and of everything it refers to.
+
+    Parameters
+    ----------
+    obj:
+        The object to measure.
+    seen: set[int] or None
+        The ids of the objects already counted; they are not counted again.
+        The set is updated with the objects counted.
+
+    Returns
+    -------
+    int
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, np.ndarray):
+            # A view does not own its data; its size does not include it.
+            if current.base is not None:
+                stack.append(current.base)
+            continue
+        if isinstance(current, (str, bytes, int, float, bool, type(None))):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        if hasattr(current, '__dict__') and not isinstance(current, type):
+            attributes = vars(current)
+            seen.add(id(attributes))
+            size += sys.getsizeof(attributes)
+            for key, value in attributes.items():
+                if key not in SKIPPED_ATTRIBUTES:
+                    stack.append(key)
+                    stack.append(value)
+    return size
+
+
+def molecule_footprint(molecule, seen=None):
+    """
+    The size in bytes of a molecule, per category.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+    seen: set[int] or None
+        See :func:`deep_size`.
+
+    Returns
+    -------
+    dict[str, int]
+        The size of each category of :data:`CATEGORIES`.
+    """
+    if seen is None:
+        seen = set()
+    sizes = dict.fromkeys(CATEGORIES, 0)
+    nodes = list(molecule.nodes.values())
+    for node in nodes:
+        seen.add(id(node))
+        sizes['node_dicts'] += sys.getsizeof(node)
+        for attribute in node:
+            sizes['node_dicts'] += deep_size(attribute, seen)
+    for node in nodes:
+        for attribute in POSITION_ATTRIBUTES:
+            if attribute in node:
+                sizes['positions'] += deep_size(node[attribute], seen)
+    for node in nodes:
+        for attribute, value in node.items():
+            if attribute not in POSITION_ATTRIBUTES and attribute != SUBGRAPH_ATTRIBUTE:
+                sizes['node_attributes'] += deep_size(value, seen)
+    for node in nodes:
+        if SUBGRAPH_ATTRIBUTE in node:
+            sizes['subgraphs'] += deep_size(node[SUBGRAPH_ATTRIBUTE], seen)
+    sizes['edges'] = deep_size(molecule._adj, seen)  # pylint: disable=protected-access
+    sizes['interactions'] = deep_size(molecule.interactions, seen)
+    sizes['meta'] = deep_size(molecule.meta, seen)
+    sizes['molecules'] = deep_size(molecule, seen)
+    return sizes
+
+
+def system_footprint(system):
+    """
+    The size in bytes of the molecules of a system, per category.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+
+    Returns
+    -------
+    dict[str, int]
+        The size of each category of :data:`CATEGORIES`, the 'total' size,
+        and the number of 'atoms'.
+    """
+    seen = set()
+    sizes = dict.fromkeys(CATEGORIES, 0)
+    atoms = 0
+    for molecule in system.molecules:
+        atoms += len(molecule)
+        for category, size in molecule_footprint(molecule, seen).items():
+            sizes[category] += size
+    sizes['total'] = sum(sizes.values())
+    sizes['atoms'] = atoms
+    return sizes
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 from collections import defaultdict, OrderedDict, namedtuple
+from collections.abc import Mapping
 import copy
 from functools import partial
 
@@ -316,6 +317,9 @@ class Molecule(nx.Graph):
         self.meta = kwargs.pop('meta', {})
         self._force_field = kwargs.pop('force_field', None)
         self.nrexcl = kwargs.pop('nrexcl', None)
+        # The vermouth.coordinates.CoordinateStore the atoms are attached to,
+        # if any. It is shared with the system and the copies.
+        self.coordinates = kwargs.pop('coordinates', None)
         super().__init__(*args, **kwargs)
         self.interactions = defaultdict(list)
 
@@ -351,11 +355,25 @@ class Molecule(nx.Graph):
         """
         Creates a copy of the molecule.
 
+        As with :meth:`subgraph`, the meta, the node and edge attribute
+        dictionaries, and the interaction lists are copied, but not the values
+        of the attributes nor the interactions themselves. Since all the nodes
+        are kept, the interactions are not filtered.
+
         Returns
         -------
         Molecule
         """
-        return self.subgraph(self.nodes)
+        new_molecule = self.__class__()
+        new_molecule.meta = copy.copy(self.meta)
+        new_molecule._force_field = self._force_field
+        new_molecule.nrexcl = self.nrexcl
+        new_molecule.coordinates = self.coordinates
+        new_molecule.add_nodes_from(self.nodes(data=True))
+        new_molecule.add_edges_from(self.edges(data=True))
+        for interaction_type, interactions in self.interactions.items():
+            new_molecule.interactions[interaction_type] = list(interactions)
+        return new_molecule
 
     def subgraph(self, nodes):
         """
@@ -370,6 +388,7 @@ class Molecule(nx.Graph):
         subgraph.meta = copy.copy(self.meta)
         subgraph._force_field = self._force_field
         subgraph.nrexcl = self.nrexcl
+        subgraph.coordinates = self.coordinates
 
         node_copies = [(node, copy.copy(self.nodes[node])) for node in nodes]
         subgraph.add_nodes_from(node_copies)
@@ -390,6 +409,21 @@ class Molecule(nx.Graph):
 
         return subgraph
 
+    def lazy_subgraph(self, nodes):
+        """
+        Refer to a subgraph of the molecule without building it.
+
+        Parameters
+        ----------
+        nodes: collections.abc.Iterable[collections.abc.Hashable]
+            The keys of the nodes of the subgraph.
+
+        Returns
+        -------
+        LazySubgraph
+        """
+        return LazySubgraph(self, nodes)
+
     def add_interaction(self, type_, atoms, parameters, meta=None):
         """
         Add an interaction of the specified type with the specified parameters
@@ -584,6 +618,8 @@ class Molecule(nx.Graph):
             )
         if self.nrexcl is None and not self:
             self.nrexcl = molecule.nrexcl
+        if self.coordinates is None:
+            self.coordinates = molecule.coordinates
         if self.nrexcl != molecule.nrexcl:
             raise ValueError(
                 'Cannot merge molecules with different nrexcl. '
@@ -710,6 +746,100 @@ class Molecule(nx.Graph):
         for node in nodes:
             self._remove_interactions_with_node(node)
 
+
+class _SubgraphNodes(Mapping):
+    """
+    The nodes of a :class:`LazySubgraph`, read from its parent molecule.
+
+    Like :attr:`networkx.Graph.nodes`, it maps the node keys to the node
+    attributes, and can be called with the `data` argument.
+    """
+    def __init__(self, parent, keys):
+        self._parent = parent
+        self._keys = keys
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return self._parent.nodes[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __call__(self, data=False, default=None):
+        if data is False:
+            return list(self._keys)
+        if data is True:
+            return list(self.items())
+        return [(key, node.get(data, default)) for key, node in self.items()]
+
+
+class LazySubgraph:
+    """
+    A subgraph of a molecule, described by the molecule and the keys of its
+    nodes.
+
+    It is used to keep track of the atoms a particle is built from, as the
+    'graph' node attribute, without copying the atoms for every particle.
+    The nodes are read from the parent molecule through :attr:`nodes`, and
+    are the node attributes of the parent rather than copies. Nothing prevents
+    modifying the parent, so whoever creates a lazy subgraph hands the parent
+    over and must not modify it afterwards. The edges, interactions, or meta
+    are only available from the subgraph built by :meth:`materialize`.
+
+    Parameters
+    ----------
+    parent: Molecule
+    nodes: collections.abc.Iterable[collections.abc.Hashable]
+
+    Attributes
+    ----------
+    parent: Molecule
+        The molecule the subgraph is part of.
+    keys: tuple
+        The keys of the nodes of the subgraph, in order.
+    """
+    def __init__(self, parent, nodes):
+        self.parent = parent
+        self.keys = tuple(nodes)
+
+    @property
+    def nodes(self):
+        """
+        The node attributes by node key.
+        """
+        return _SubgraphNodes(self.parent, self.keys)
+
+    def materialize(self):
+        """
+        Build the subgraph.
+
+        The subgraph is not kept; every call builds a new one, so callers
+        that need more than the nodes should call it once and keep the
+        result.
+
+        Returns
+        -------
+        Molecule
+        """
+        return self.parent.subgraph(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __repr__(self):
+        return '<{} of {} nodes>'.format(self.__class__.__name__, len(self))
+
+
 class Block(Molecule):
     """
     Residue topology template
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Find pairs of points closer than a cutoff distance.
+
+The search uses a cell list: the space is divided in cells at least as large
+as the cutoff, so that the neighbors of a point can only be in the same cell as
+the point, or in one of the 26 surrounding cells. All the operations are
+vectorized with numpy, and the search optionally accounts for periodic boundary
+conditions in orthorhombic or triclinic boxes.
+
+Boxes are given as a 3x3 matrix where each row is a box vector, as 3 box
+lengths for an orthorhombic box, or as the 9 values of a GRO file box line.
+A box of ``None``, or with a null volume, means no periodic boundary
+conditions.
+"""
+
+import itertools
+
+import numpy as np
+
+
+def box_matrix(box):
+    """
+    Normalize a box to a 3x3 matrix where each row is a box vector.
+
+    Parameters
+    ----------
+    box: None or numpy.ndarray or collections.abc.Sequence[float]
+        The box to normalize. Can be ``None``, 3 box lengths for a
+        orthorhombic box, the 9 values from a GRO file box line, or a 3x3
+        matrix.
+
+    Returns
+    -------
+    numpy.ndarray or None
+        The box as a 3x3 matrix, or ``None`` if there is no box or if the box
+        volume is null.
+
+    Raises
+    ------
+    ValueError
+        The box does not have a recognized shape.
+    """
+    if box is None:
+        return None
+    box = np.asarray(box, dtype=float)
+    if box.shape == (3, 3):
+        matrix = box.copy()
+    elif box.shape == (3, ):
+        matrix = np.diag(box)
+    elif box.shape == (9, ):
+        # The order in a GRO file is v1(x) v2(y) v3(z) v1(y) v1(z) v2(x)
+        # v2(z) v3(x) v3(y).
+        matrix = np.diag(box[:3])
+        matrix[0, 1], matrix[0, 2] = box[3], box[4]
+        matrix[1, 0], matrix[1, 2] = box[5], box[6]
+        matrix[2, 0], matrix[2, 1] = box[7], box[8]
+    else:
+        raise ValueError('A box must be given as 3 lengths, 9 GRO values, '
+                         'or a 3x3 matrix; got a shape of {}.'.format(box.shape))
+    if abs(np.linalg.det(matrix)) < 1e-12:
+        return None
+    return matrix
+
+
+def _box_heights(box):
+    """
+    Distance between the opposite faces of a box.
+    """
+    volume = abs(np.linalg.det(box))
+    return np.array([
+        volume / np.linalg.norm(np.cross(box[(dim + 1) % 3], box[(dim + 2) % 3]))
+        for dim in range(3)
+    ])
+
+
+def _is_orthorhombic(box):
+    return np.count_nonzero(box - np.diag(np.diag(box))) == 0
+
+
+def _minimum_image(vectors, box):
+    """
+    Apply the minimum image convention to an array of vectors in place.
+    """
+    if _is_orthorhombic(box):
+        lengths = np.diag(box)
+        vectors -= lengths * np.round(vectors / lengths)
+        return vectors
+    # Bring the vectors in the central image using fractional coordinates, then
+    # look for a shorter image among the neighboring ones; this is needed for
+    # skewed boxes.
+    inverse = np.linalg.inv(box)
+    fractional = np.dot(vectors, inverse)
+    vectors[:] = np.dot(fractional - np.round(fractional), box)
+    best = vectors.copy()
+    best_norm = np.sum(best ** 2, axis=1)
+    for shift in itertools.product((-1, 0, 1), repeat=3):
+        if shift == (0, 0, 0):
+            continue
+        shifted = vectors + np.dot(shift, box)
+        norm = np.sum(shifted ** 2, axis=1)
+        shorter = norm < best_norm
+        best[shorter] = shifted[shorter]
+        best_norm[shorter] = norm[shorter]
+    vectors[:] = best
+    return vectors
+
+
+class _Grid:
+    """
+    Assign points to the cells of a grid.
+    """
+    def __init__(self, coordinates, cutoff, box):
+        self.box = box
+        if box is None:
+            origin = coordinates.min(axis=0)
+            extent = coordinates.max(axis=0) - origin
+            self.n_cells = np.maximum(1, np.floor(extent / cutoff)).astype(int)
+            # Cells are at least as large as the cutoff.
+            self.cell_size = np.where(extent > 0, extent / self.n_cells, cutoff)
+            self.origin = origin
+        else:
+            heights = _box_heights(box)
+            if cutoff > heights.min() / 2:
+                raise ValueError('The cutoff ({}) must not be larger than half '
+                                 'the smallest box height ({}).'
+                                 .format(cutoff, heights.min()))
+            self.n_cells = np.maximum(1, np.floor(heights / cutoff)).astype(int)
+            self.inverse = np.linalg.inv(box)
+
+    def cells(self, coordinates):
+        """
+        Find the 3D index of the cell containing each point.
+        """
+        if self.box is None:
+            cells = np.floor((coordinates - self.origin) / self.cell_size)
+        else:
+            fractional = np.dot(coordinates, self.inverse)
+            fractional -= np.floor(fractional)
+            cells = np.floor(fractional * self.n_cells)
+        return np.clip(cells.astype(int), 0, self.n_cells - 1)
+
+    def flat(self, cells):
+        """
+        Convert 3D cell indices to flat ones.
+        """
+        return (cells[:, 0] * self.n_cells[1] + cells[:, 1]) * self.n_cells[2] + cells[:, 2]
+
+    def offsets(self):
+        """
+        The offsets to the neighboring cells, without duplicates.
+
+        With periodic boundary conditions and fewer than 3 cells along a
+        dimension, offsets of -1 and +1 may point to the same cell.
+        """
+        if self.box is None:
+            per_dim = [(-1, 0, 1)] * 3
+        else:
+            per_dim = [sorted(set(offset % n for offset in (-1, 0, 1)))
+                       for n in self.n_cells]
+        return np.array(list(itertools.product(*per_dim)), dtype=int)
+
+    def neighbor_cells(self, cells, offset):
+        """
+        Flat index of the neighboring cells, and whether they exist.
+        """
+        neighbors = cells + offset
+        if self.box is None:
+            valid = np.all((neighbors >= 0) & (neighbors < self.n_cells), axis=1)
+        else:
+            neighbors %= self.n_cells
+            valid = np.ones(len(cells), dtype=bool)
+        return self.flat(neighbors), valid
+
+
+def iter_pairs_between(coordinates_a, coordinates_b, cutoff, box=None,
+                       chunk_size=None):
+    """
+    Find the pairs of points from two sets that are within a cutoff distance.
+
+    The pairs are yielded by chunks of points from `coordinates_a` to keep the
+    memory usage bounded.
+
+    Parameters
+    ----------
+    coordinates_a: numpy.ndarray
+        Coordinates of the first set of points, as an (N, 3) array.
+    coordinates_b: numpy.ndarray
+        Coordinates of the second set of points, as an (M, 3) array.
+    cutoff: float
+        The distance under which (or at which) points are paired.
+    box: None or numpy.ndarray or collections.abc.Sequence[float]
+        The periodic box, in any format accepted by :func:`box_matrix`.
+    chunk_size: int or None
+        Number of points from `coordinates_a` to process at once. All the
+        points are processed at once if set to ``None``.
+
+    Yields
+    ------
+    tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        Indices in `coordinates_a`, indices in `coordinates_b`, and distances
+        for the pairs in a chunk. Pairs are sorted by their indices.
+
+    Raises
+    ------
+    ValueError
+        The cutoff is not strictly positive, or it is too large for the box.
+    """
+    if cutoff <= 0:
+        raise ValueError('The cutoff must be strictly positive.')
+    coordinates_a = np.asarray(coordinates_a, dtype=float).reshape(-1, 3)
+    coordinates_b = np.asarray(coordinates_b, dtype=float).reshape(-1, 3)
+    if not len(coordinates_a) or not len(coordinates_b):
+        return
+    box = box_matrix(box)
+    grid = _Grid(np.concatenate([coordinates_a, coordinates_b]), cutoff, box)
+
+    cells_b = grid.flat(grid.cells(coordinates_b))
+    order_b = np.argsort(cells_b, kind='stable')
+    sorted_cells_b = cells_b[order_b]
+    offsets = grid.offsets()
+
+    if chunk_size is None:
+        chunk_size = len(coordinates_a)
+    for chunk_start in range(0, len(coordinates_a), chunk_size):
+        chunk = coordinates_a[chunk_start:chunk_start + chunk_size]
+        cells_a = grid.cells(chunk)
+        found_a = []
+        found_b = []
+        for offset in offsets:
+            neighbors, valid = grid.neighbor_cells(cells_a, offset)
+            starts = np.searchsorted(sorted_cells_b, neighbors, side='left')
+            ends = np.searchsorted(sorted_cells_b, neighbors, side='right')
+            counts = np.where(valid, ends - starts, 0)
+            total = counts.sum()
+            if not total:
+                continue
+            # Expand every point of the chunk into as many candidate pairs as
+            # there are points in the neighboring cell.
+            index_a = np.repeat(np.arange(len(chunk)), counts)
+            first_of_run = np.repeat(np.cumsum(counts) - counts, counts)
+            positions = np.arange(total) - first_of_run + np.repeat(starts, counts)
+            found_a.append(index_a)
+            found_b.append(order_b[positions])
+        if not found_a:
+            continue
+        index_a = np.concatenate(found_a)
+        index_b = np.concatenate(found_b)
+        vectors = coordinates_b[index_b] - chunk[index_a]
+        if box is not None:
+            _minimum_image(vectors, box)
+        distances = np.sqrt(np.sum(vectors ** 2, axis=1))
+        keep = distances <= cutoff
+        index_a = index_a[keep] + chunk_start
+        index_b = index_b[keep]
+        distances = distances[keep]
+        order = np.lexsort((index_b, index_a))
+        yield index_a[order], index_b[order], distances[order]
+
+
+def iter_pairs_within(coordinates, cutoff, box=None, chunk_size=None):
+    """
+    Find the pairs of points from a set that are within a cutoff distance.
+
+    Each pair is only reported once, with the lowest index first.
+
+    Parameters
+    ----------
+    coordinates: numpy.ndarray
+        Coordinates of the points, as an (N, 3) array.
+    cutoff: float
+        The distance under which (or at which) points are paired.
+    box: None or numpy.ndarray or collections.abc.Sequence[float]
+        The periodic box, in any format accepted by :func:`box_matrix`.
+    chunk_size: int or None
+        Number of points to process at once. All the points are processed at
+        once if set to ``None``.
+
+    Yields
+    ------
+    tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        The indices of the first and second points of the pairs, and the
+        distances between them, for a chunk of points.
+
+    See Also
+    --------
+    iter_pairs_between
+    """
+    for index_a, index_b, distances in iter_pairs_between(
+            coordinates, coordinates, cutoff, box=box, chunk_size=chunk_size):
+        keep = index_a < index_b
+        yield index_a[keep], index_b[keep], distances[keep]
+
+
+def _concatenate_pairs(chunks):
+    index_a = []
+    index_b = []
+    distances = []
+    for chunk_a, chunk_b, chunk_distances in chunks:
+        index_a.append(chunk_a)
+        index_b.append(chunk_b)
+        distances.append(chunk_distances)
+    if not index_a:
+        return (np.zeros((0, ), dtype=int), np.zeros((0, ), dtype=int),
+                np.zeros((0, ), dtype=float))
+    return np.concatenate(index_a), np.concatenate(index_b), np.concatenate(distances)
+
+
+def pairs_between(coordinates_a, coordinates_b, cutoff, box=None):
+    """
+    Find the pairs of points from two sets that are within a cutoff distance.
+
+    Parameters
+    ----------
+    coordinates_a: numpy.ndarray
+        Coordinates of the first set of points, as an (N, 3) array.
+    coordinates_b: numpy.ndarray
+        Coordinates of the second set of points, as an (M, 3) array.
+    cutoff: float
+        The distance under which (or at which) points are paired.
+    box: None or numpy.ndarray or collections.abc.Sequence[float]
+        The periodic box, in any format accepted by :func:`box_matrix`.
+
+    Returns
+    -------
+    tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        Indices in `coordinates_a`, indices in `coordinates_b`, and distances.
+    """
+    return _concatenate_pairs(
+        iter_pairs_between(coordinates_a, coordinates_b, cutoff, box=box)
+    )
+
+
+def pairs_within(coordinates, cutoff, box=None):
+    """
+    Find the pairs of points from a set that are within a cutoff distance.
+
+    Parameters
+    ----------
+    coordinates: numpy.ndarray
+        Coordinates of the points, as an (N, 3) array.
+    cutoff: float
+        The distance under which (or at which) points are paired.
+    box: None or numpy.ndarray or collections.abc.Sequence[float]
+        The periodic box, in any format accepted by :func:`box_matrix`.
+
+    Returns
+    -------
+    tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        The indices of the first and second points of the pairs, with the
+        first index lower than the second, and the distances.
+    """
+    return _concatenate_pairs(iter_pairs_within(coordinates, cutoff, box=box))
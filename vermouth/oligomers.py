@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Process only one copy of identical molecules, and replicate the result.
+
+Homo-oligomers have many copies of the same molecule that only differ by
+their chain and their coordinates, and membranes or solvated systems have
+many copies of the same small molecules. The molecules are grouped by a
+signature; only one representative per group goes through the pipeline, the
+other copies get the topology of the representative with their own
+coordinates.
+"""
+
+import copy
+
+import networkx as nx
+import numpy as np
+
+from .cache import INPUT_HASH
+from .coordinates import ROW_ATTRIBUTE
+from .molecule import LazySubgraph
+from .system import System
+from .trajectory import FRAME_INDEX, TrajectoryMapper
+
+#: Node attributes that may differ between copies of a same molecule.
+PER_COPY_ATTRIBUTES = ('chain', 'resid', 'position', 'velocity', ROW_ATTRIBUTE,
+                       'atomid', 'occupancy', 'temp_factor', FRAME_INDEX)
+#: Per-copy attributes that the particles built from the atoms inherit, and
+#: that must be renamed for the particles of the copies. The residue numbers
+#: are not inherited; the mapping numbers the residues of each molecule.
+RENAMED_ATTRIBUTES = ('chain', )
+
+#: Molecule meta keys that may differ between copies of a same molecule.
+PER_COPY_META = (INPUT_HASH, )
+
+#: Molecule meta key used to follow the representatives through a pipeline.
+GROUP_KEY = 'oligomer_group'
+#: Node attribute that stores the index of the atoms of the representatives
+#: while they go through the pipeline.
+ATOM_INDEX = 'oligomer_atom'
+
+
+def _freeze(value):
+    """
+    Make a value hashable, for it to be part of a signature.
+
+    Graphs, such as the 'graph' node attribute, are described by their
+    :func:`topology_signature`. Values that cannot be made hashable are
+    identified by their identity.
+    """
+    if isinstance(value, nx.Graph):
+        return topology_signature(value)
+    if isinstance(value, LazySubgraph):
+        return topology_signature(value.materialize())
+    if isinstance(value, np.ndarray):
+        return ('array', value.shape, tuple(value.flatten().tolist()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted(((_freeze(key), _freeze(item))
+                                      for key, item in value.items()),
+                                     key=repr)))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return ('id', id(value))
+    return value
+
+
+def canonical_order(molecule):
+    """
+    Sort the node keys of a molecule by residue and atom name.
+
+    The nodes that cannot be told apart that way are kept in the order of the
+    molecule.
+
+    Parameters
+    ----------
+    molecule: networkx.Graph
+
+    Returns
+    -------
+    list
+        The node keys.
+    """
+    def sort_key(item):
+        idx, (_, node) = item
+        return (
+            str(node.get('chain', '')),
+            node.get('resid', 0),
+            str(node.get('insertion_code', '')),
+            str(node.get('atomname', '')),
+            idx,
+        )
+    items = sorted(enumerate(molecule.nodes.items()), key=sort_key)
+    return [key for _, (key, _) in items]
+
+
+def topology_signature(molecule):
+    """
+    Describe everything but the per-copy attributes of a molecule.
+
+    Two molecules with the same signature have the same atoms, with the same
+    attributes in the same :func:`canonical_order`, the same edges, and the
+    same meta. The chains are described by their order of appearance rather
+    than by their name, and only whether the atoms have a position is
+    described.
+
+    Parameters
+    ----------
+    molecule: networkx.Graph
+        The molecule to describe.
+
+    Returns
+    -------
+    tuple
+        The signature. It is hashable.
+    """
+    order = canonical_order(molecule)
+    index = {key: idx for idx, key in enumerate(order)}
+    chains = {}
+    nodes = []
+    for node in (molecule.nodes[key] for key in order):
+        chain = chains.setdefault(node.get('chain'), len(chains))
+        attributes = tuple(sorted(
+            ((name, _freeze(value)) for name, value in node.items()
+             if name not in PER_COPY_ATTRIBUTES and name != ATOM_INDEX),
+            key=repr,
+        ))
+        nodes.append((chain, node.get('position') is not None, attributes))
+    edges = sorted(tuple(sorted((index[key_a], index[key_b])))
+                   for key_a, key_b in molecule.edges)
+    meta = _freeze({key: value for key, value in getattr(molecule, 'meta', {}).items()
+                    if key != GROUP_KEY and key not in PER_COPY_META})
+    return (tuple(nodes), tuple(edges), meta)
+
+
+def residue_fingerprint(molecule):
+    """
+    Describe a molecule made of a single residue by its residue name, the
+    names of its atoms in order, and its edges.
+
+    This is much cheaper to compute than :func:`topology_signature`, but it
+    only describes molecules such as lipids, ligands, or solvent, whose
+    processing is fully determined by the names of their atoms.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule to describe.
+
+    Returns
+    -------
+    tuple or None
+        The fingerprint, or `None` if the molecule has more than one residue.
+    """
+    residues = {(node.get('chain'), node.get('resid'), node.get('resname'))
+                for node in molecule.nodes.values()}
+    if len(residues) != 1:
+        return None
+    (_, _, resname), = residues
+    order = canonical_order(molecule)
+    index = {key: idx for idx, key in enumerate(order)}
+    atoms = tuple(
+        (molecule.nodes[key].get('atomname'),
+         molecule.nodes[key].get('position') is not None,
+         molecule.nodes[key].get('secstruct'),
+         molecule.nodes[key].get('cgsecstruct'))
+        for key in order
+    )
+    edges = sorted(tuple(sorted((index[key_a], index[key_b])))
+                   for key_a, key_b in molecule.edges)
+    meta = _freeze({key: value for key, value in molecule.meta.items()
+                    if key != GROUP_KEY and key not in PER_COPY_META})
+    return ('residue', resname, atoms, tuple(edges), meta)
+
+
+def small_molecule_signature(molecule):
+    """
+    Describe a molecule with :func:`residue_fingerprint` if it has a single
+    residue, or with :func:`topology_signature` otherwise.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule to describe.
+
+    Returns
+    -------
+    tuple
+    """
+    fingerprint = residue_fingerprint(molecule)
+    if fingerprint is None:
+        return topology_signature(molecule)
+    return fingerprint
+
+
+def group_molecules(molecules, signature=topology_signature):
+    """
+    Group the molecules that have the same signature.
+
+    Parameters
+    ----------
+    molecules: list[vermouth.molecule.Molecule]
+    signature: collections.abc.Callable
+        Describes a molecule. Molecules described as `None` are not grouped.
+
+    Returns
+    -------
+    list[list[int]]
+        The indices of the molecules in each group. The groups are sorted by
+        their first molecule, and the indices within a group are sorted.
+    """
+    groups = {}
+    for idx, molecule in enumerate(molecules):
+        description = signature(molecule)
+        if description is None:
+            description = ('ungrouped', idx)
+        groups.setdefault(description, []).append(idx)
+    return sorted(groups.values())
+
+
+def _atom_nodes(graph):
+    """
+    Find the nodes with the :data:`ATOM_INDEX` attribute in a graph and in
+    the nested 'graph' attributes of the other nodes.
+    """
+    for node in graph.nodes.values():
+        if ATOM_INDEX in node:
+            yield node
+        elif node.get('graph'):
+            yield from _atom_nodes(node['graph'])
+
+
+def _per_copy_snapshot(molecule):
+    """
+    Record the per-copy attributes of the atoms of a molecule, in
+    :func:`canonical_order`.
+    """
+    return [
+        {attribute: _freeze(molecule.nodes[key].get(attribute))
+         for attribute in PER_COPY_ATTRIBUTES}
+        for key in canonical_order(molecule)
+    ]
+
+
+def _per_copy_values(processed, before, target):
+    """
+    Decide the per-copy attributes of the atoms of a copy.
+
+    The attributes the pipeline did not change on the representative, as
+    recorded in `before` by :func:`_per_copy_snapshot`, are taken from
+    `target`; the ones it changed, such as residue numbers reset when
+    repairing the graph, keep their value from `processed`.
+
+    Returns
+    -------
+    per_copy: dict[int, dict]
+        The per-copy attributes for each atom index.
+    renames: dict[str, dict]
+        How to rename the :data:`RENAMED_ATTRIBUTES` of the particles built
+        from the atoms.
+    """
+    target_keys = canonical_order(target)
+    per_copy = {}
+    renames = {attribute: {} for attribute in RENAMED_ATTRIBUTES}
+    for node in _atom_nodes(processed):
+        idx = node[ATOM_INDEX]
+        if idx in per_copy:
+            continue
+        target_node = target.nodes[target_keys[idx]]
+        values = {}
+        for attribute in PER_COPY_ATTRIBUTES:
+            if _freeze(node.get(attribute)) != before[idx][attribute]:
+                source = node
+            else:
+                source = target_node
+            if attribute in source:
+                values[attribute] = source[attribute]
+        for attribute in RENAMED_ATTRIBUTES:
+            renames[attribute][node.get(attribute)] = values.get(attribute)
+        per_copy[idx] = values
+    return per_copy, renames
+
+
+def _transplant_graph(graph, target_keys, target, per_copy, renames):
+    """
+    Rebuild a 'graph' node attribute so it refers to the atoms of `target`.
+
+    The atoms of the representative are recognized by their :data:`ATOM_INDEX`
+    attribute; they get the key of the corresponding atom of `target`, and
+    their per-copy attributes from `per_copy`. In a graph of atoms, the atoms without a
+    counterpart, such as the atoms added when repairing the graph, get new
+    keys that are not used in `target`. The other nodes get their
+    :data:`RENAMED_ATTRIBUTES` renamed according to `renames`. The 'graph'
+    attributes of the nodes are rebuilt recursively, unless `target` has its
+    own.
+    """
+    if isinstance(graph, LazySubgraph):
+        graph = graph.materialize()
+    is_atomistic = any(ATOM_INDEX in node for node in graph.nodes.values())
+    next_key = max(target, default=-1) + 1
+    mapping = {}
+    for key, node in graph.nodes.items():
+        if ATOM_INDEX in node:
+            mapping[key] = target_keys[node[ATOM_INDEX]]
+        elif is_atomistic:
+            mapping[key] = next_key
+            next_key += 1
+        else:
+            mapping[key] = key
+
+    new_graph = graph.__class__()
+    new_graph.meta = copy.copy(graph.meta)
+    new_graph._force_field = graph._force_field  # pylint: disable=protected-access
+    new_graph.nrexcl = graph.nrexcl
+    for key, node in graph.nodes.items():
+        new_node = dict(node)
+        if ATOM_INDEX in new_node:
+            target_node = target.nodes[mapping[key]]
+            for attribute in PER_COPY_ATTRIBUTES:
+                new_node.pop(attribute, None)
+            new_node.update(per_copy[new_node.pop(ATOM_INDEX)])
+            if 'graph' in target_node:
+                new_node['graph'] = target_node['graph']
+                new_graph.add_node(mapping[key], **new_node)
+                continue
+        else:
+            for attribute in RENAMED_ATTRIBUTES:
+                if attribute in new_node:
+                    new_node[attribute] = renames[attribute].get(
+                        new_node[attribute], new_node[attribute]
+                    )
+        if new_node.get('graph'):
+            new_node['graph'] = _transplant_graph(new_node['graph'], target_keys,
+                                                  target, per_copy, renames)
+        new_graph.add_node(mapping[key], **new_node)
+    new_graph.add_edges_from(
+        (mapping[key_a], mapping[key_b], dict(attributes))
+        for key_a, key_b, attributes in graph.edges(data=True)
+    )
+    for name, interactions in graph.interactions.items():
+        new_graph.interactions[name] = [
+            interaction._replace(atoms=tuple(mapping[atom] for atom in interaction.atoms))
+            for interaction in interactions
+        ]
+    return new_graph
+
+
+def _remove_atom_indices(molecule):
+    """
+    Remove the :data:`ATOM_INDEX` attribute from the nested graphs.
+    """
+    for node in molecule.nodes.values():
+        node.pop(ATOM_INDEX, None)
+        if node.get('graph'):
+            _remove_atom_indices(node['graph'])
+
+
+def _template_mapper(processed, weight):
+    """
+    Build the mapper that places the particles of `processed` from the
+    coordinates of the atoms of its representative, in order.
+    """
+    system = System()
+    system.add_molecule(processed)
+    return TrajectoryMapper(system, weight=weight, attribute=ATOM_INDEX)
+
+
+def replicate_molecule(processed, before, target, mapper):
+    """
+    Give a copy of a representative the processed topology of the
+    representative.
+
+    Parameters
+    ----------
+    processed: vermouth.molecule.Molecule
+        The result of the pipeline for the representative. The atoms of the
+        representative have the :data:`ATOM_INDEX` attribute.
+    before: list[dict]
+        The per-copy attributes of the atoms of the representative before the
+        pipeline, indexed by :data:`ATOM_INDEX`.
+    target: vermouth.molecule.Molecule
+        A molecule in the same group as the representative.
+    mapper: vermouth.trajectory.TrajectoryMapper
+        Computes the positions of the particles of `processed` from the
+        coordinates of the atoms of the representative.
+
+    Returns
+    -------
+    vermouth.molecule.Molecule
+        The processed topology for `target`. The 'graph' attributes refer to
+        the atoms of `target`, and the per-copy attributes the pipeline did
+        not change, such as the positions, are the ones of `target`, and so
+        are the :data:`PER_COPY_META` keys of the meta.
+    """
+    target_keys = canonical_order(target)
+    per_copy, renames = _per_copy_values(processed, before, target)
+    new_molecule = _transplant_graph(processed, target_keys, target,
+                                     per_copy, renames)
+    for key in PER_COPY_META:
+        if key in target.meta:
+            new_molecule.meta[key] = target.meta[key]
+
+    coordinates = np.full((len(target), 3), np.nan)
+    for idx, node in enumerate(target.nodes[key] for key in target_keys):
+        if node.get('position') is not None:
+            coordinates[idx] = node['position']
+    positions = mapper.map_frame(coordinates)
+    # The atoms of the representative already got the position of their
+    # counterpart in target.
+    for node, processed_node, position in zip(new_molecule.nodes.values(),
+                                              processed.nodes.values(),
+                                              positions):
+        if ATOM_INDEX in processed_node:
+            continue
+        if 'position' in node or not np.all(np.isnan(position)):
+            node['position'] = position
+    return new_molecule
+
+
+def run_on_representatives(system, pipeline, weight=None,
+                           signature=topology_signature):
+    """
+    Run a pipeline on one molecule per group of identical molecules, and
+    replicate the result on the other molecules of the group.
+
+    The pipeline must process the molecules independently, and keep the meta
+    of the molecules as :class:`~vermouth.processors.do_mapping.DoMapping`
+    does. It may delete molecules, in which case all the molecules of the
+    group are deleted.
+
+    The atoms of the copies keep the per-copy attributes, such as their
+    position, that the pipeline did not change on the representative. The
+    chain of the particles built from them follows. The
+    position of the particles is the average of the positions of the
+    underlying atoms, or for the particles that are not built from atoms, the
+    position they have relative to their neighbors in the representative.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+        The system to process. Is modified in-place.
+    pipeline: collections.abc.Callable
+        Takes a system and returns the processed system.
+    weight: collections.abc.Hashable or bool or None
+        The attribute the pipeline used to weight the average position of the
+        particles. See
+        :func:`~vermouth.processors.average_beads.resolve_weight`.
+    signature: collections.abc.Callable
+        Describes the molecules to group them. See :func:`group_molecules`.
+
+    Returns
+    -------
+    vermouth.system.System
+        The processed system.
+
+    Raises
+    ------
+    ValueError
+        The pipeline did not keep the meta of the molecules.
+    """
+    molecules = system.molecules
+    groups = group_molecules(molecules, signature)
+
+    snapshots = {}
+    representatives = System()
+    representatives.force_field = system.force_field
+    representatives.box = system.box
+    for group_idx, group in enumerate(groups):
+        representative = molecules[group[0]]
+        representative.meta[GROUP_KEY] = group_idx
+        if len(group) > 1:
+            for idx, key in enumerate(canonical_order(representative)):
+                representative.nodes[key][ATOM_INDEX] = idx
+            snapshots[group_idx] = _per_copy_snapshot(representative)
+        representatives.add_molecule(representative)
+    representatives = pipeline(representatives)
+
+    processed = {}
+    for molecule in representatives.molecules:
+        if GROUP_KEY not in molecule.meta:
+            raise ValueError('The pipeline did not keep the meta of the molecules.')
+        processed[molecule.meta.pop(GROUP_KEY)] = molecule
+    for molecule in molecules:
+        molecule.meta.pop(GROUP_KEY, None)
+
+    results = [None] * len(molecules)
+    for group_idx, group in enumerate(groups):
+        if group_idx not in processed:
+            continue
+        template = processed[group_idx]
+        results[group[0]] = template
+        if len(group) > 1:
+            mapper = _template_mapper(template, weight)
+            for idx in group[1:]:
+                results[idx] = replicate_molecule(
+                    template, snapshots[group_idx], molecules[idx], mapper
+                )
+            _remove_atom_indices(template)
+
+    system.molecules = [molecule for molecule in results if molecule is not None]
+    system.force_field = representatives.force_field
+    return system
@@ -16,4 +16,5 @@
 Provides functionality to read and write PDB files.
 """
 
-from .pdb import read_pdb, write_pdb
+from .pdb import (read_pdb, write_pdb, iter_pdb_frames, write_pdb_frames,
+                  PDBStreamWriter)
@@ -16,10 +16,13 @@
 Provides functions for reading and writing PDB files.
 """
 
+from array import array
 from functools import partial
+import tempfile
 
 import numpy as np
 
+from ..coordinates import CoordinateStore
 from ..molecule import Molecule
 from ..utils import first_alpha, distance
 from ..truncating_formatter import TruncFormatter
@@ -50,6 +53,166 @@ def get_not_none(node, attr, default):
     return value
 
 
+def _keyfunc(graph, node_idx):
+    """
+    Used for sorting nodes
+    """
+    # TODO add something like idx_in_residue
+    return graph.node[node_idx]['chain'], graph.node[node_idx]['resid'], graph.node[node_idx]['resname']
+
+
+def _molecule_atom_records(molecule, atomid, omit_charges=True,
+                           nan_missing_pos=False):
+    """
+    Describe the atoms of a molecule as PDB records.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule to describe.
+    atomid: int
+        The serial number of the first atom.
+    omit_charges: bool
+        Whether charges should be omitted.
+    nan_missing_pos: bool
+        Whether atoms without coordinates are written with 'nan' as
+        coordinates rather than failing.
+
+    Yields
+    ------
+    tuple[collections.abc.Hashable, str]
+        The key of the node in the molecule, and the formatted ATOM record.
+        The TER record that ends the molecule is yielded last, with ``None``
+        as node key.
+    """
+    formatter = TruncFormatter()
+#    format_string = 'ATOM  {: >5.5d} {:4.4s}{:1.1s}{:3.3s} {:1.1s}{:4.4d}{:1.1s}   {:8.3f}{:8.3f}{:8.3f}{:6.2f}{:6.2f}          {:2.2s}{:2.2s}'
+    format_string = 'ATOM  {: >5dt} {:4st}{:1st}{:3st} {:1st}{:>4dt}{:1st}   {:8.3ft}{:8.3ft}{:8.3ft}{:6.2ft}{:6.2ft}          {:2st}{:2st}'
+
+    node_order = sorted(molecule, key=partial(_keyfunc, molecule))
+
+    for node_idx in node_order:
+        node = molecule.node[node_idx]
+        atomname = node['atomname']
+        altloc = get_not_none(node, 'altloc', '')
+        resname = node['resname']
+        chain = node['chain']
+        resid = node['resid']
+        insertion_code = get_not_none(node, 'insertioncode', '')
+        try:
+            # converting from nm to A
+            x, y, z = node['position'] * 10  # pylint: disable=invalid-name
+        except KeyError:
+            if nan_missing_pos:
+                x = y = z = float('nan')  # pylint: disable=invalid-name
+            else:
+                raise
+        occupancy = get_not_none(node, 'occupancy', 1)
+        temp_factor = get_not_none(node, 'temp_factor', 0)
+        element = get_not_none(node, 'element', '')
+        charge = get_not_none(node, 'charge', 0)
+        if charge and not omit_charges:
+            charge = '{:+2d}'.format(int(charge))[::-1]
+        else:
+            charge = ''
+        line = formatter.format(format_string, atomid, atomname, altloc,
+                                resname, chain, resid, insertion_code, x,
+                                y, z, occupancy, temp_factor, element,
+                                charge)
+        atomid += 1
+        yield node_idx, line
+    terline = formatter.format('TER   {: >5dt}      {:3st} {:1st}{: >4dt}{:1st}',
+                               atomid, resname, chain, resid, insertion_code)
+    yield None, terline
+
+
+def _atom_records(system, omit_charges=True, nan_missing_pos=False):
+    """
+    Describe the atoms of `system` as PDB records.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+        The system to describe.
+    omit_charges: bool
+        Whether charges should be omitted.
+    nan_missing_pos: bool
+        Whether atoms without coordinates are written with 'nan' as
+        coordinates rather than failing.
+
+    Yields
+    ------
+    tuple[int, collections.abc.Hashable, str]
+        The index of the molecule in the system, the key of the node in the
+        molecule, and the formatted ATOM record. TER records are yielded with
+        ``None`` as node key.
+    """
+    atomid = 1
+    for mol_idx, molecule in enumerate(system.molecules):
+        for node_idx, line in _molecule_atom_records(molecule, atomid,
+                                                     omit_charges, nan_missing_pos):
+            yield mol_idx, node_idx, line
+        # One serial number per atom, and one for the TER record.
+        atomid += len(molecule) + 1
+
+
+def _molecule_conect_records(molecule, atomid):
+    """
+    Describe the edges of a molecule as PDB CONECT records.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule to describe.
+    atomid: int
+        The serial number of the first atom of the molecule.
+
+    Returns
+    -------
+    list[str]
+        The CONECT records.
+    """
+    formatter = TruncFormatter()
+    node_order = sorted(molecule, key=partial(_keyfunc, molecule))
+    nodeidx2atomid = {node_idx: atomid + idx for idx, node_idx in enumerate(node_order)}
+
+    out = []
+    number_fmt = '{:>4dt}'
+    for node_idx in node_order:
+        todo = [nodeidx2atomid[n_idx]
+                for n_idx in molecule[node_idx] if n_idx > node_idx]
+        while todo:
+            current, todo = todo[:4], todo[4:]
+            fmt = ['CONECT'] + [number_fmt]*(len(current) + 1)
+            fmt = ' '.join(fmt)
+            line = formatter.format(fmt, nodeidx2atomid[node_idx], *current)
+            out.append(line)
+    return out
+
+
+def _conect_records(system):
+    """
+    Describe the edges of the molecules in `system` as PDB CONECT records.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+        The system to describe.
+
+    Returns
+    -------
+    list[str]
+        The CONECT records.
+    """
+    out = []
+    atomid = 1
+    for molecule in system.molecules:
+        out.extend(_molecule_conect_records(molecule, atomid))
+        # One serial number per atom, and one for the TER record.
+        atomid += len(molecule) + 1
+    return out
+
+
 def write_pdb_string(system, conect=True, omit_charges=True, nan_missing_pos=False):
     """
     Describes `system` as a PDB formatted string. Will create CONECT records
@@ -76,76 +239,9 @@ def write_pdb_string(system, conect=True, omit_charges=True, nan_missing_pos=Fal
     str
         The system as PDB formatted string.
     """
-    def keyfunc(graph, node_idx):
-        """
-        Used for sorting nodes
-        """
-        # TODO add something like idx_in_residue
-        return graph.node[node_idx]['chain'], graph.node[node_idx]['resid'], graph.node[node_idx]['resname']
-
-    out = []
-
-    formatter = TruncFormatter()
-#    format_string = 'ATOM  {: >5.5d} {:4.4s}{:1.1s}{:3.3s} {:1.1s}{:4.4d}{:1.1s}   {:8.3f}{:8.3f}{:8.3f}{:6.2f}{:6.2f}          {:2.2s}{:2.2s}'
-    format_string = 'ATOM  {: >5dt} {:4st}{:1st}{:3st} {:1st}{:>4dt}{:1st}   {:8.3ft}{:8.3ft}{:8.3ft}{:6.2ft}{:6.2ft}          {:2st}{:2st}'
-
-    # FIXME Here we make the assumption that node indices are unique across
-    # molecules in a system. Probably not a good idea
-    nodeidx2atomid = {}
-    atomid = 1
-    for mol_idx, molecule in enumerate(system.molecules):
-        node_order = sorted(molecule, key=partial(keyfunc, molecule))
-
-        for node_idx in node_order:
-            nodeidx2atomid[(mol_idx, node_idx)] = atomid
-            node = molecule.node[node_idx]
-            atomname = node['atomname']
-            altloc = get_not_none(node, 'altloc', '')
-            resname = node['resname']
-            chain = node['chain']
-            resid = node['resid']
-            insertion_code = get_not_none(node, 'insertioncode', '')
-            try:
-                # converting from nm to A
-                x, y, z = node['position'] * 10  # pylint: disable=invalid-name
-            except KeyError:
-                if nan_missing_pos:
-                    x = y = z = float('nan')  # pylint: disable=invalid-name
-                else:
-                    raise
-            occupancy = get_not_none(node, 'occupancy', 1)
-            temp_factor = get_not_none(node, 'temp_factor', 0)
-            element = get_not_none(node, 'element', '')
-            charge = get_not_none(node, 'charge', 0)
-            if charge and not omit_charges:
-                charge = '{:+2d}'.format(int(charge))[::-1]
-            else:
-                charge = ''
-            line = formatter.format(format_string, atomid, atomname, altloc,
-                                    resname, chain, resid, insertion_code, x,
-                                    y, z, occupancy, temp_factor, element,
-                                    charge)
-            atomid += 1
-            out.append(line)
-        terline = formatter.format('TER   {: >5dt}      {:3st} {:1st}{: >4dt}{:1st}',
-                                   atomid, resname, chain, resid, insertion_code)
-        atomid += 1
-        out.append(terline)
+    out = [line for _, _, line in _atom_records(system, omit_charges, nan_missing_pos)]
     if conect:
-        number_fmt = '{:>4dt}'
-        format_string = 'CONECT '
-        for mol_idx, molecule in enumerate(system.molecules):
-            node_order = sorted(molecule, key=partial(keyfunc, molecule))
-
-            for node_idx in node_order:
-                todo = [nodeidx2atomid[(mol_idx, n_idx)]
-                        for n_idx in molecule[node_idx] if n_idx > node_idx]
-                while todo:
-                    current, todo = todo[:4], todo[4:]
-                    fmt = ['CONECT'] + [number_fmt]*(len(current) + 1)
-                    fmt = ' '.join(fmt)
-                    line = formatter.format(fmt, nodeidx2atomid[(mol_idx, node_idx)], *current)
-                    out.append(line)
+        out.extend(_conect_records(system))
     out.append('END   ')
     return '\n'.join(out)
 
@@ -180,6 +276,160 @@ def write_pdb(system, path, conect=True, omit_charges=True, nan_missing_pos=Fals
         out.write(write_pdb_string(system, conect, omit_charges, nan_missing_pos))
 
 
+class PDBStreamWriter:
+    """
+    Write molecules to a PDB file as they are produced.
+
+    The ATOM records of each molecule are written as soon as the molecule is
+    given, so the molecules do not need to be kept in memory. The CONECT
+    records, which come after all the atoms in a PDB file, are kept in a
+    temporary file until :meth:`close` is called. The resulting file is the
+    same as the one written by :func:`write_pdb` for a system with the same
+    molecules.
+
+    Parameters
+    ----------
+    path: str
+        The file to write to.
+    conect: bool
+        Whether to write CONECT records for the edges.
+    omit_charges: bool
+        Whether charges should be omitted.
+    nan_missing_pos: bool
+        Whether atoms without coordinates are written with 'nan' as
+        coordinates rather than failing.
+    """
+    def __init__(self, path, conect=True, omit_charges=True, nan_missing_pos=False):
+        self.conect = conect
+        self.omit_charges = omit_charges
+        self.nan_missing_pos = nan_missing_pos
+        self._atomid = 1
+        self._empty = True
+        self._out = open(path, 'w')
+        self._conect = tempfile.TemporaryFile('w+') if conect else None
+
+    def write_molecule(self, molecule):
+        """
+        Write the records of a molecule.
+
+        Parameters
+        ----------
+        molecule: vermouth.molecule.Molecule
+        """
+        for _, line in _molecule_atom_records(molecule, self._atomid,
+                                              self.omit_charges,
+                                              self.nan_missing_pos):
+            self._write_line(line)
+        if self._conect is not None:
+            for line in _molecule_conect_records(molecule, self._atomid):
+                self._conect.write(line + '\n')
+        self._atomid += len(molecule) + 1
+
+    def _write_line(self, line):
+        # write_pdb_string joins the lines with new lines, so there is no
+        # new line after the last one.
+        if not self._empty:
+            self._out.write('\n')
+        self._out.write(line)
+        self._empty = False
+
+    def close(self):
+        """
+        Write the CONECT and END records, and close the file.
+        """
+        if self._conect is not None:
+            self._conect.seek(0)
+            for line in self._conect:
+                self._write_line(line.rstrip('\n'))
+            self._conect.close()
+        self._write_line('END   ')
+        self._out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _format_coordinates(coordinates, width=8, precision=3):
+    """
+    Format coordinates as fixed width fields.
+
+    Fields that are too long are truncated from the left, the same way
+    :class:`~vermouth.truncating_formatter.TruncFormatter` does for numbers.
+    """
+    template = '{{:{}.{}f}}'.format(width, precision)
+    return ''.join(template.format(value)[-width:] for value in coordinates)
+
+
+def write_pdb_frames(system, path, frames, conect=True, omit_charges=True):
+    """
+    Writes `system` to `path` as a multi-model PDB file with one model per
+    frame.
+
+    The records are formatted once from the nodes of `system`, only the
+    coordinates are updated for each frame. The boxes of the frames are not
+    written.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+        The system to write.
+    path: str
+        The file to write to.
+    frames: collections.abc.Iterable[tuple[numpy.ndarray, numpy.ndarray]]
+        The positions and the box of each frame. The positions are given in
+        nm as an array with one row per node, ordered as the nodes of each
+        molecule of `system` in turn. Rows with 'nan' coordinates are written
+        as such.
+    conect: bool
+        Whether to write CONECT records for the edges.
+    omit_charges: bool
+        Whether charges should be omitted.
+
+    See Also
+    --------
+    :func:write_pdb
+    :func:vermouth.trajectory.map_frames
+    """
+    offsets = [0]
+    for molecule in system.molecules:
+        offsets.append(offsets[-1] + len(molecule))
+    rows = [
+        {key: offset + idx for idx, key in enumerate(molecule)}
+        for offset, molecule in zip(offsets, system.molecules)
+    ]
+
+    records = []
+    for mol_idx, node_idx, line in _atom_records(system, omit_charges,
+                                                  nan_missing_pos=True):
+        if node_idx is None:
+            records.append((None, line, ''))
+        else:
+            # The coordinates are the 3 fields of 8 characters after the
+            # 30 first characters of the record.
+            records.append((rows[mol_idx][node_idx], line[:30], line[54:]))
+
+    formatter = TruncFormatter()
+    with open(path, 'w') as out:
+        for model, (positions, _) in enumerate(frames, start=1):
+            out.write(formatter.format('MODEL     {:>4dt}\n', model))
+            # converting from nm to A
+            positions = np.asarray(positions) * 10
+            for row, prefix, suffix in records:
+                if row is None:
+                    out.write(prefix + '\n')
+                else:
+                    out.write(prefix + _format_coordinates(positions[row])
+                              + suffix + '\n')
+            out.write('ENDMDL\n')
+        if conect:
+            for line in _conect_records(system):
+                out.write(line + '\n')
+        out.write('END   ')
+
+
 def do_conect(mol, conectlist):
     """Apply connections to molecule based on CONECT records read from PDB file
 
@@ -213,7 +463,7 @@ def do_conect(mol, conectlist):
                 mol.add_edge(at0, atom, distance=dist)
 
 
-def read_pdb(file_name, exclude=('SOL',), ignh=False, model=0):
+def read_pdb(file_name, exclude=('SOL',), ignh=False, model=0, dtype=float):
     """
     Parse a PDB file to create a molecule.
 
@@ -227,14 +477,21 @@ def read_pdb(file_name, exclude=('SOL',), ignh=False, model=0):
         Whether hydrogen atoms should be ignored.
     model: int
         If the PDB file contains multiple models, which one to select.
+    dtype: numpy.dtype
+        The type of the coordinates.
 
     Returns
     -------
     vermouth.molecule.Molecule
         The parsed molecules. Will only contain edges if the PDB file has
-        CONECT records. Either way, might be disconnected.
+        CONECT records. Either way, might be disconnected. The coordinates of
+        the atoms are in a :class:`~vermouth.coordinates.CoordinateStore`,
+        set as the `coordinates` attribute of the molecule.
     """
     models = [Molecule()]
+    # The coordinates are collected flat, rather than as a tuple per atom,
+    # to not hold several times their size until the store is built.
+    positions = [array('d')]
     conect = []
     idx = 0
 
@@ -256,14 +513,17 @@ def read_pdb(file_name, exclude=('SOL',), ignh=False, model=0):
             record = line[:6]
             if record == 'ENDMDL':
                 models.append(Molecule())
+                positions.append(array('d'))
             elif record in ('ATOM  ', 'HETATM'):
+                if 0 <= model < len(models) - 1:
+                    # We are past the model we want. The rest of the file
+                    # only matters for the CONECT records.
+                    continue
                 properties = {}
                 for name, type_, slice_ in zip(field_names, field_types, slices):
                     properties[name] = type_(line[slice_].strip())
 
                 pos = (properties.pop('x'), properties.pop('y'), properties.pop('z'))
-                # Coordinates are read in Angstrom, but we want them in nm
-                properties['position'] = np.array(pos, dtype=float) / 10
 
                 if not properties['element']:
                     atomname = properties['atomname']
@@ -271,14 +531,25 @@ def read_pdb(file_name, exclude=('SOL',), ignh=False, model=0):
                 if properties['resname'] in exclude or (ignh and properties['element'] == 'H'):
                     continue
                 models[-1].add_node(idx, **properties)
+                positions[-1].extend(pos)
                 idx += 1
             elif record == 'CONECT':
                 conect.append(line)
 
     if not models[-1]:
         models.pop()
-
-    for molecule in models:
+        positions.pop()
+    if model >= 0:
+        # Only the requested model was read, the others are empty.
+        models = models[:model + 1]
+
+    for molecule, model_positions in zip(models, positions):
+        # Coordinates are read in Angstrom, but we want them in nm
+        model_positions = np.array(model_positions, dtype=float).reshape((-1, 3))
+        model_positions /= 10
+        molecule.coordinates = CoordinateStore.for_nodes(
+            molecule.nodes.values(), model_positions, dtype=dtype,
+        )
         do_conect(molecule, conect)
 
     molecule = models[model]
@@ -293,3 +564,47 @@ def read_pdb(file_name, exclude=('SOL',), ignh=False, model=0):
 #        molecule.add_weighted_edges_from(zip(idxs[0], idxs[1], weights))
 
     return molecule
+
+
+def iter_pdb_frames(file_name, exclude=('SOL',), ignh=False):
+    """
+    Iterate over the models of a PDB file as coordinate arrays.
+
+    The atoms are selected the same way :func:`read_pdb` selects them, so the
+    rows of each frame correspond to the node keys of the molecule
+    :func:`read_pdb` builds from the first model. Only the records needed to
+    select the atoms and read their coordinates are parsed.
+
+    Parameters
+    ----------
+    file_name: str
+        The file to read.
+    exclude: collections.abc.Container[str]
+        Atoms that have one of these residue names will not be included.
+    ignh: bool
+        Whether hydrogen atoms should be ignored.
+
+    Yields
+    ------
+    tuple[numpy.ndarray, None]
+        The coordinates in nm of the atoms of a model as a (n_atoms, 3) array,
+        and the box of the model. The box is not read from PDB files and is
+        always ``None``.
+    """
+    positions = []
+    with open(str(file_name)) as pdb:
+        for line in pdb:
+            record = line[:6]
+            if record == 'ENDMDL':
+                if positions:
+                    yield np.array(positions) / 10, None
+                positions = []
+            elif record in ('ATOM  ', 'HETATM'):
+                resname = line[17:21].strip()
+                element = line[76:78].strip() or first_alpha(line[12:16].strip())
+                if resname in exclude or (ignh and element == 'H'):
+                    continue
+                positions.append((float(line[30:38]), float(line[38:46]),
+                                  float(line[46:54])))
+    if positions:
+        yield np.array(positions) / 10, None
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Run a system through named stages, and resume from checkpoints.
+
+A :class:`Pipeline` runs its stages one after the other. After the stages
+marked for it, the system is written in a checkpoint file. The name of the
+file depends on the key of the pipeline, on the package version, and on the
+name and options of the stage and of all the stages before it. When the
+pipeline runs again, it restarts after the last stage that has a matching
+checkpoint, so changing the options of a stage only reruns the stages from
+that one.
+"""
+
+import collections
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+import time
+import zlib
+
+from . import __version__
+from .forcefield import ForceField
+from .log_helpers import StyleAdapter, get_logger
+
+LOGGER = StyleAdapter(get_logger(__name__))
+
+Stage = collections.namedtuple('Stage', 'name function options checkpoint')
+
+
+class _CheckpointPickler(pickle.Pickler):
+    """
+    Pickler that refers to the force fields by their name instead of copying
+    them.
+    """
+    def persistent_id(self, obj):  # pylint: disable=method-hidden
+        if isinstance(obj, ForceField):
+            return ('force_field', obj.name)
+        return None
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    """
+    Unpickler that resolves the force fields written by
+    :class:`_CheckpointPickler`.
+    """
+    def __init__(self, file, force_fields):
+        super().__init__(file)
+        self._force_fields = force_fields
+
+    def persistent_load(self, pid):
+        _, name = pid
+        try:
+            return self._force_fields[name]
+        except KeyError:
+            raise KeyError('The checkpoint refers to the unknown force field "{}".'
+                           .format(name))
+
+
+def save_checkpoint(path, system, data=None):
+    """
+    Write a system in a compressed binary checkpoint file.
+
+    The force fields are not written, only their name.
+
+    Parameters
+    ----------
+    path: str
+        The file to write.
+    system: vermouth.system.System
+        The system to write.
+    data: dict or None
+        Additional picklable data to store with the system.
+    """
+    buffer = io.BytesIO()
+    _CheckpointPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump((system, data))
+    # Write in a temporary file first, so an interrupted run does not leave
+    # a truncated checkpoint behind. The name is unique, as several processes
+    # may write the same checkpoint at the same time.
+    path = str(path)
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path) or os.curdir, suffix='.tmp',
+    )
+    with os.fdopen(descriptor, 'wb') as outfile:
+        outfile.write(zlib.compress(buffer.getvalue()))
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path, force_fields):
+    """
+    Read a checkpoint file written by :func:`save_checkpoint`.
+
+    Parameters
+    ----------
+    path: str
+        The file to read.
+    force_fields: dict[str, vermouth.forcefield.ForceField]
+        The force fields the system may refer to, keyed by name.
+
+    Returns
+    -------
+    tuple[vermouth.system.System, dict or None]
+        The system and the additional data.
+
+    Raises
+    ------
+    KeyError
+        The system refers to a force field that is not in `force_fields`.
+    """
+    with open(path, 'rb') as infile:
+        payload = zlib.decompress(infile.read())
+    return _CheckpointUnpickler(io.BytesIO(payload), force_fields).load()
+
+
+def file_hash(path):
+    """
+    Compute the SHA-256 hash of the content of a file.
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    str
+        The hash as an hexadecimal string.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Pipeline:
+    """
+    A sequence of named stages that process a system.
+
+    Parameters
+    ----------
+    key: str
+        Identifies the input of the pipeline, such as a hash of the input
+        file and the options used to read it.
+    checkpoint_dir: str or None
+        The directory where the checkpoints are written and looked for. If
+        `None`, no checkpoint is used.
+    force_fields: dict[str, vermouth.forcefield.ForceField]
+        The force fields the checkpoints may refer to, keyed by name.
+    profiler: vermouth.profiling.Profiler or None
+        If set, records the cost of each stage that runs.
+
+    Attributes
+    ----------
+    stages: list[Stage]
+        The stages, in order.
+    data: dict
+        Data the stages can share in addition to the system. It is stored in
+        the checkpoints, so it must be picklable.
+    timings: dict[str, float]
+        The wall time, in seconds, of each stage of the last run. The stages
+        skipped thanks to a checkpoint are not included.
+    """
+    def __init__(self, key='', checkpoint_dir=None, force_fields=None, profiler=None):
+        self.key = key
+        self.checkpoint_dir = checkpoint_dir
+        self.force_fields = force_fields or {}
+        self.profiler = profiler
+        self.stages = []
+        self.data = {}
+        self.timings = {}
+
+    def add_stage(self, name, function, options=None, checkpoint=False):
+        """
+        Add a stage at the end of the pipeline.
+
+        Parameters
+        ----------
+        name: str
+            The name of the stage.
+        function: collections.abc.Callable
+            Takes a system, or `None` for the first stage, and returns the
+            processed system.
+        options: dict or None
+            The options that change the result of the stage. Their
+            representation is part of the key of the checkpoints.
+        checkpoint: bool
+            Whether to write a checkpoint after the stage.
+        """
+        self.stages.append(Stage(name, function, options or {}, checkpoint))
+
+    def stage_keys(self):
+        """
+        Compute the checkpoint key of each stage.
+
+        The key of a stage depends on the key of the pipeline, on the package
+        version, and on the name and options of that stage and of the stages
+        before it.
+
+        Returns
+        -------
+        list[str]
+        """
+        keys = []
+        digest = hashlib.sha256('{}\n{}'.format(__version__, self.key).encode('utf8'))
+        for stage in self.stages:
+            options = sorted((str(name), repr(value))
+                             for name, value in stage.options.items())
+            digest.update(repr((stage.name, options)).encode('utf8'))
+            keys.append(digest.copy().hexdigest())
+        return keys
+
+    def checkpoint_path(self, stage, key):
+        """
+        The path of the checkpoint of a stage.
+
+        Parameters
+        ----------
+        stage: Stage
+        key: str
+            The key of the stage, as given by :meth:`stage_keys`.
+
+        Returns
+        -------
+        str
+        """
+        return os.path.join(self.checkpoint_dir,
+                            '{}-{}.ckpt'.format(stage.name, key[:16]))
+
+    def _resume(self, keys):
+        """
+        Find the last stage that has a checkpoint.
+
+        Returns
+        -------
+        tuple[int, vermouth.system.System or None]
+            The index of the first stage to run, and the system to give it.
+        """
+        if self.checkpoint_dir is None:
+            return 0, None
+        for idx in reversed(range(len(self.stages))):
+            stage = self.stages[idx]
+            path = self.checkpoint_path(stage, keys[idx])
+            if stage.checkpoint and os.path.exists(path):
+                LOGGER.info('Resuming after stage "{}" from {}.', stage.name, path)
+                system, data = load_checkpoint(path, self.force_fields)
+                self.data = data or {}
+                return idx + 1, system
+        return 0, None
+
+    def run(self, system=None):
+        """
+        Run the stages, starting after the last one with a checkpoint.
+
+        Parameters
+        ----------
+        system: vermouth.system.System or None
+            The system to give to the first stage, if there is no checkpoint.
+
+        Returns
+        -------
+        vermouth.system.System
+            The system returned by the last stage.
+        """
+        keys = self.stage_keys()
+        self.timings = {}
+        start, resumed = self._resume(keys)
+        if resumed is not None:
+            system = resumed
+        if self.checkpoint_dir is not None:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+        for idx in range(start, len(self.stages)):
+            stage = self.stages[idx]
+            stage_start = time.monotonic()
+            if self.profiler is None:
+                system = stage.function(system)
+            else:
+                with self.profiler.stage(stage.name, system) as record:
+                    system = stage.function(system)
+                    record['system'] = system
+            self.timings[stage.name] = time.monotonic() - stage_start
+            if stage.checkpoint and self.checkpoint_dir is not None:
+                save_checkpoint(self.checkpoint_path(stage, keys[idx]),
+                                system, self.data)
+        return system
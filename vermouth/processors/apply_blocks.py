@@ -82,7 +82,7 @@ def apply_blocks(molecule, blocks):
             atname_to_idx[atname] = at_idx
             attrs = molecule.nodes[atom[0]]
             graph_out.add_node(at_idx, **ChainMap(block.nodes[atname], attrs))
-            graph_out.nodes[at_idx]['graph'] = molecule.subgraph(atom)
+            graph_out.nodes[at_idx]['graph'] = molecule.lazy_subgraph(atom)
             graph_out.nodes[at_idx]['charge_group'] += charge_group_offset
             graph_out.nodes[at_idx]['resid'] = attrs['resid']
             at_idx += 1
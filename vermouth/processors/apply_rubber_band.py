@@ -14,13 +14,15 @@
 """
 Provides a processor that adds a rubber band elastic network.
 """
-import itertools
-
 import numpy as np
 import networkx as nx
 
 from .processor import Processor
 from .. import selectors
+from ..coordinates import gather_positions
+from ..graph_utils import KHopConnectivity
+from ..molecule import Interaction
+from ..neighbor_search import pairs_within
 
 DEFAULT_BOND_TYPE = 6
 
@@ -90,6 +92,33 @@ def compute_force_constants(distance_matrix, lower_bound, upper_bound,
     return constants
 
 
+def compute_pair_force_constants(distances, lower_bound, upper_bound,
+                                 decay_factor, decay_power, base_constant,
+                                 minimum_force):
+    """
+    Compute the force constants of elastic network bonds for a list of pairs.
+
+    This is the sparse counterpart of :func:`compute_force_constants`: it works
+    on the distances of the pairs of interest rather than on a full distance
+    matrix.
+
+    Parameters
+    ----------
+    distances: numpy.ndarray
+        The distances between the atoms of each pair.
+
+    Returns
+    -------
+    numpy.ndarray
+        The force constant for each pair.
+    """
+    constants = compute_decay(distances, lower_bound, decay_factor, decay_power)
+    constants *= base_constant
+    constants[constants < minimum_force] = 0
+    constants[distances > upper_bound] = 0
+    return constants
+
+
 def build_connectivity_matrix(graph, separation, selection=None):
     """
     Build a connectivity matrix based on the separation between nodes in a graph.
@@ -128,25 +157,36 @@ def build_connectivity_matrix(graph, separation, selection=None):
     """
     if separation < 0:
         raise ValueError('Separation has to be null or positive.')
-    if separation == 0:
-        # The connectivity matrix with a separation of 1 is the adjacency
-        # matrix. Thanksfully, networkx can directly give it to us a a numpy
-        # array.
-        return nx.to_numpy_matrix(graph, nodelist=selection).astype(bool)
-    subgraph = graph.subgraph(selection)
-    connectivity = np.zeros((len(subgraph), len(subgraph)), dtype=bool)
-    for (idx, key_idx), (jdx, key_jdx) in itertools.combinations(enumerate(subgraph.nodes), 2):
-        try:
-            shortest_path = len(nx.shortest_path(subgraph, key_idx, key_jdx))
-        except nx.NetworkXNoPath:
-            # There is no path between key_i and key_j so they are not
-            # connected; which is the default.
-            pass
-        else:
-            # The source and the target are counted in the shortest path
-            connectivity[idx, jdx] = shortest_path <= separation + 2
-            connectivity[jdx, idx] = connectivity[idx, jdx]
-    return connectivity
+    if selection is None:
+        selection = list(graph.nodes)
+    else:
+        selection = list(selection)
+    # The source and the target are not counted in the separation, the
+    # number of edges between two connected nodes is therefore at most
+    # `separation + 1`.
+    connectivity = KHopConnectivity(_selection_graph(graph, selection),
+                                    separation + 1)
+    index = {key: idx for idx, key in enumerate(selection)}
+    matrix = np.zeros((len(selection), len(selection)), dtype=bool)
+    for idx, key in enumerate(selection):
+        neighbors = [index[other] for other in connectivity.neighborhood(key)]
+        matrix[idx, neighbors] = True
+    np.fill_diagonal(matrix, False)
+    return matrix
+
+
+def _selection_graph(graph, selection):
+    """
+    Build a lightweight graph with only the selected nodes and the edges
+    between them.
+    """
+    selection_set = set(selection)
+    subgraph = nx.Graph()
+    subgraph.add_nodes_from(selection)
+    subgraph.add_edges_from(
+        edge for edge in graph.edges(selection) if edge[1] in selection_set
+    )
+    return subgraph
 
 
 def apply_rubber_band(molecule, selector,
@@ -210,43 +250,49 @@ def apply_rubber_band(molecule, selector,
         given.
     """
     selection = []
-    coordinates = []
-    missing = []
+    nodes = []
     for node_key, attributes in molecule.nodes.items():
         if selector(attributes):
             selection.append(node_key)
-            coordinates.append(attributes.get('position'))
-            if coordinates[-1] is None:
-                missing.append(node_key)
+            nodes.append(attributes)
+    coordinates = gather_positions(nodes, default=np.nan)
+    missing = [selection[idx] for idx in np.flatnonzero(np.isnan(coordinates).any(axis=1))]
     if missing:
         raise ValueError('All atoms from the selection must have coordinates. '
                          'The following atoms do not have some: {}.'
                          .format(' '.join(missing)))
-    coordinates = np.stack(coordinates)
-    distance_matrix = self_distance_matrix(coordinates)
-    constants = compute_force_constants(distance_matrix, lower_bound,
-                                        upper_bound, decay_factor, decay_power,
-                                        base_constant, minimum_force)
-    connectivity = build_connectivity_matrix(molecule, res_min_dist - 1,
-                                             selection=selection)
-    # Set the force constant to 0 for pairs that are connected. `connectivity`
-    # is a matrix of booleans that is True when a pair is connected. Because
-    # booleans acts as 0 or 1 in operation, we multiply the force constant
-    # matrix by the oposite (OR) of the connectivity matrix.
-    constants *= ~connectivity
-    distance_matrix = distance_matrix.round(5)  # For compatibility with legacy
-    for from_idx, to_idx in zip(*np.triu_indices_from(constants)):
-        from_key = selection[from_idx]
-        to_key = selection[to_idx]
-        force_constant = constants[from_idx, to_idx]
-        length = distance_matrix[from_idx, to_idx]
-        if force_constant > minimum_force:
-            molecule.add_interaction(
-                type_='bonds',
-                atoms=(from_key, to_key),
-                parameters=[bond_type, length, force_constant],
-                meta={'group': 'Rubber band'},
-            )
+    if not selection:
+        return
+    # Only the pairs closer than the upper bound can get a bond, so there is
+    # no need to compute the distance between all the pairs.
+    from_idx, to_idx, distances = pairs_within(coordinates, upper_bound)
+    constants = compute_pair_force_constants(distances, lower_bound,
+                                             upper_bound, decay_factor,
+                                             decay_power, base_constant,
+                                             minimum_force)
+    # Set the force constant to 0 for pairs that are connected. Two atoms are
+    # connected if they are separated by at most `res_min_dist - 1` atoms
+    # in the graph of the selection.
+    connectivity = KHopConnectivity(_selection_graph(molecule, selection),
+                                    res_min_dist)
+    connected = connectivity.pair_mask(
+        [selection[idx] for idx in from_idx],
+        [selection[idx] for idx in to_idx],
+    )
+    constants[connected] = 0
+    lengths = distances.round(5)  # For compatibility with legacy
+    keep = constants > minimum_force
+    # All the atoms come from the molecule, so the interactions can be added
+    # without going through `Molecule.add_interaction`.
+    molecule.interactions['bonds'].extend(
+        Interaction(
+            atoms=(selection[from_index], selection[to_index]),
+            parameters=[bond_type, length, force_constant],
+            meta={'group': 'Rubber band'},
+        )
+        for from_index, to_index, length, force_constant
+        in zip(from_idx[keep], to_idx[keep], lengths[keep], constants[keep])
+    )
 
 
 class ApplyRubberBand(Processor):
@@ -18,18 +18,187 @@ average of the positions of the atoms they are constructed from.
 
 
 import numpy as np
+from ..coordinates import gather_positions
 from .processor import Processor
 
 
+class MappingMatrix:
+    """
+    Sparse weights to compute the position of beads from their atoms.
+
+    The matrix has one row per bead that has a 'graph' attribute, and one
+    column per atom in the 'graph' of each of these beads. Because an atom
+    can contribute to several beads, it then has one column per bead it
+    contributes to. The columns are stored row after row, so the matrix is
+    described by the row of each column, the key of the atom in the
+    underlying graph for each column, and the weight of each column.
+
+    Once built, the matrix can be applied to the coordinates of the columns
+    for a single structure, or for many frames at once.
+
+    Attributes
+    ----------
+    bead_keys: list[collections.abc.Hashable]
+        The key of the bead for each row.
+    atom_keys: list[collections.abc.Hashable]
+        The key of the underlying atom for each column.
+    rows: numpy.ndarray
+        The row of each column.
+    weights: numpy.ndarray
+        The weight of each column.
+    """
+    def __init__(self, bead_keys, atom_keys, rows, weights):
+        self.bead_keys = bead_keys
+        self.atom_keys = atom_keys
+        self.rows = np.asarray(rows, dtype=int)
+        self.weights = np.asarray(weights, dtype=float)
+
+    @classmethod
+    def from_molecule(cls, molecule, weight=None):
+        """
+        Build the matrix from the 'graph' and 'mapping_weights' attributes of
+        the nodes of a molecule.
+
+        Parameters
+        ----------
+        molecule: vermouth.molecule.Molecule
+            The molecule to describe. Nodes without a 'graph' attribute, or
+            with an empty one, are not part of the matrix.
+        weight: collections.abc.Hashable
+            The name of the attribute used to weight the position of the node.
+            The attribute is read from the underlying atoms.
+
+        Returns
+        -------
+        MappingMatrix
+
+        Raises
+        ------
+        KeyError
+            An underlying atom does not have the `weight` attribute.
+        """
+        bead_keys = []
+        atom_keys = []
+        rows = []
+        weights = []
+        for key, node in molecule.nodes.items():
+            if not node.get('graph'):
+                continue
+            mapping_weights = node.get('mapping_weights', {})
+            row = len(bead_keys)
+            bead_keys.append(key)
+            for subnode_key, subnode in node['graph'].nodes.items():
+                if weight is not None and weight not in subnode:
+                    raise KeyError('Not all underlying atoms have an attribute {}.'
+                                   .format(weight))
+                atom_keys.append(subnode_key)
+                rows.append(row)
+                weights.append(mapping_weights.get(subnode_key, 1)
+                               * subnode.get(weight, 1))
+        return cls(bead_keys, atom_keys, rows, weights)
+
+    def gather(self, molecule, attribute='position'):
+        """
+        Collect the coordinates of the columns from the underlying graphs.
+
+        Atoms without coordinates get ``nan`` coordinates.
+
+        Parameters
+        ----------
+        molecule: vermouth.molecule.Molecule
+            The molecule the matrix was built from.
+        attribute: collections.abc.Hashable
+            The attribute under which the coordinates are stored.
+
+        Returns
+        -------
+        numpy.ndarray
+            The coordinates as an (n_columns, 3) array.
+        """
+        return gather_positions(
+            (subnode for bead_key in self.bead_keys
+             for subnode in molecule.nodes[bead_key]['graph'].nodes.values()),
+            attribute, default=np.nan,
+        )
+
+    def apply(self, coordinates):
+        """
+        Compute the weighted average of the coordinates for each row.
+
+        Columns with ``nan`` coordinates are left out of the average.
+
+        Parameters
+        ----------
+        coordinates: numpy.ndarray
+            Coordinates of the columns as an (n_columns, 3) array, or as an
+            (n_frames, n_columns, 3) array to process many frames at once.
+
+        Returns
+        -------
+        numpy.ndarray
+            The averaged coordinates as an (n_rows, 3) or an
+            (n_frames, n_rows, 3) array. Rows for which no column has
+            coordinates get ``nan`` coordinates.
+
+        Raises
+        ------
+        ValueError
+            The weights of the columns with coordinates sum to zero for a
+            row.
+        """
+        coordinates = np.asarray(coordinates, dtype=float)
+        present = ~np.isnan(coordinates).any(axis=-1)
+        weights = np.where(present, self.weights, 0)
+        weighted = np.where(present[..., np.newaxis],
+                            coordinates * weights[..., np.newaxis], 0)
+        # Accumulate along the first axis so each row is summed in column
+        # order, the same way numpy.average does.
+        totals = np.zeros((len(self.bead_keys), ) + weighted.shape[:-2] + (3, ))
+        np.add.at(totals, self.rows, np.moveaxis(weighted, -2, 0))
+        normalization = np.zeros((len(self.bead_keys), ) + weights.shape[:-1])
+        np.add.at(normalization, self.rows, np.moveaxis(weights, -1, 0))
+        counts = np.zeros(normalization.shape, dtype=int)
+        np.add.at(counts, self.rows, np.moveaxis(present, -1, 0))
+        zero_weight = (counts > 0) & (normalization == 0)
+        if zero_weight.any():
+            keys = [key for key, zero in zip(self.bead_keys, zero_weight)
+                    if np.any(zero)]
+            raise ValueError('The weights of the underlying atoms sum to zero '
+                             'for the particles {}.'.format(keys))
+        # The rows without coordinates are 0 / 0, and get nan.
+        with np.errstate(invalid='ignore'):
+            averages = totals / normalization[..., np.newaxis]
+        return np.moveaxis(averages, 0, -2)
+
+    def missing_rows(self, coordinates):
+        """
+        Find the rows for which no column has coordinates.
+
+        Parameters
+        ----------
+        coordinates: numpy.ndarray
+            Coordinates of the columns as an (n_columns, 3) array.
+
+        Returns
+        -------
+        list[collections.abc.Hashable]
+            The bead keys of these rows.
+        """
+        present = ~np.isnan(coordinates).any(axis=-1)
+        counts = np.bincount(self.rows[present], minlength=len(self.bead_keys))
+        return [key for key, count in zip(self.bead_keys, counts) if not count]
+
+
 def do_average_bead(molecule, ignore_missing_graphs=False, weight=None):
     """
     Set the position of the particles to the mean of the underlying atoms.
 
     This requires the atoms to have a 'graph' attributes. By default, a
     :exc:`ValueError` is raised if any atom in the molecule is missing that
-    'graph' attribute. This behavior can be changed by setting the
-    'ignore_missing_graphs' argument to `True`, then the average positions are
-    computed, but the atoms without a 'graph' attribute are skipped.
+    'graph' attribute, or has an empty one. This behavior can be changed by
+    setting the 'ignore_missing_graphs' argument to `True`, then the average
+    positions are computed, but the atoms without a 'graph' attribute, or
+    with an empty one, are skipped and keep their position.
 
     The average is weighted using the 'mapping_weights' atom attribute. If the
     'mapping_weights' attribute is set, it has to be a dictionary with the
@@ -46,52 +215,77 @@ def do_average_bead(molecule, ignore_missing_graphs=False, weight=None):
     The atoms in the underlying graph must have a position. If they do not,
     they are ignored from the average.
 
+    The averages for all the particles are computed at once from a
+    :class:`MappingMatrix`.
+
     Parameters
     ----------
     molecule: vermouth.molecule.Molecule
         The molecule to update. The attribute `position` of the particles
         is updated on place. The nodes of the molecule must have an attribute
-        `graph` that contains the subgraph of the initial molecule.
+        `graph` that contains the subgraph of the initial molecule, or a
+        :class:`~vermouth.molecule.LazySubgraph` of it.
     ignore_missing_graphs: bool
         If `True`, skip the atoms that do not have a `graph` attribute; else
         fail if not all the atoms in the molecule have a `graph` attribute.
     weight: collections.abc.Hashable
         The name of the attribute used to weight the position of the node. The
         attribute is read from the underlying atoms.
+
+    Raises
+    ------
+    ValueError
+        Some particles are missing the graph attribute or have an empty one,
+        none of the underlying atoms of a particle has a position, or the
+        weights of the underlying atoms of a particle sum to zero.
+    KeyError
+        An underlying atom does not have the `weight` attribute.
     """
     # Make sure the molecule fullfill the requirements.
-    missing = []
-    for node in molecule.nodes.values():
-        if 'graph' not in node:
-            missing.append(node)
-        elif weight is not None:
-            have_all_weights =  all(
-                weight in subnode for subnode in node['graph'].nodes.values()
-            )
-            if not have_all_weights:
-                raise KeyError('Not all underlying atoms have an attribute {}.'
-                               .format(weight))
+    # An empty graph does not give a position any more than a missing one.
+    missing = [node for node in molecule.nodes.values() if not node.get('graph')]
     if missing and not ignore_missing_graphs:
-        raise ValueError('{} particles are missing the graph attribute'
-                         .format(len(missing)))
-
-    for node in molecule.nodes.values():
-        if 'graph' in node:
-            positions = np.stack([
-                subnode['position']
-                for subnode in node['graph'].nodes().values()
-                if subnode.get('position') is not None
-            ])
-            weights = np.array([
-                node.get('mapping_weights', {}).get(subnode_key, 1) * subnode.get(weight, 1)
-                for subnode_key, subnode in node['graph'].nodes.items()
-                if subnode.get('position') is not None
-            ])
-            node['position'] = np.average(positions, axis=0, weights=weights)
+        raise ValueError('{} particles are missing the graph attribute, or '
+                         'have an empty one'.format(len(missing)))
+
+    matrix = MappingMatrix.from_molecule(molecule, weight=weight)
+    coordinates = matrix.gather(molecule)
+    no_position = matrix.missing_rows(coordinates)
+    if no_position:
+        raise ValueError('None of the underlying atoms have a position for '
+                         'the particles {}.'.format(no_position))
+    positions = matrix.apply(coordinates)
+    for key, position in zip(matrix.bead_keys, positions):
+        molecule.nodes[key]['position'] = position
 
     return molecule
 
 
+def resolve_weight(molecule, weight=None):
+    """
+    Find the attribute to weight the average position of the beads with.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule to average. Its force field may define the weight with
+        the 'center_weight' variable.
+    weight: collections.abc.Hashable or bool or None
+        The attribute to use. If `None`, the 'center_weight' variable of the
+        force field is used; if `False`, the average is not weighted.
+
+    Returns
+    -------
+    collections.abc.Hashable or None
+        The name of the attribute, or `None` for an unweighted average.
+    """
+    if weight is None:
+        return molecule.force_field.variables.get('center_weight', None)
+    elif weight is False:
+        return None
+    return weight
+
+
 class DoAverageBead(Processor):
     def __init__(self, ignore_missing_graphs=False, weight=None):
         super().__init__()
@@ -99,10 +293,5 @@ class DoAverageBead(Processor):
         self.weight = weight
 
     def run_molecule(self, molecule):
-        if self.weight is None:
-            weight = molecule.force_field.variables.get('center_weight', None)
-        elif self.weight is False:
-            weight = None
-        else:
-            weight = self.weight
+        weight = resolve_weight(molecule, self.weight)
         return do_average_bead(molecule, self.ignore_missing_graphs, weight=weight)
@@ -26,6 +26,7 @@ import itertools
 import networkx as nx
 
 from .processor import Processor
+from .. import matching_stats
 from ..log_helpers import StyleAdapter, get_logger
 from ..utils import format_atom_string
 
@@ -36,6 +37,9 @@ class PTMGraphMatcher(nx.isomorphism.GraphMatcher):
     """
     Implements matching logic for PTMs
     """
+    # Counted by vermouth.matching_stats when not None.
+    feasibility_checks = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -47,6 +51,8 @@ class PTMGraphMatcher(nx.isomorphism.GraphMatcher):
         atoms, the elements need to match, and otherwise, the atomnames must
         match.
         """
+        if self.feasibility_checks is not None:
+            self.feasibility_checks += 1
         node1 = self.G1.nodes[node1]
         node2 = self.G2.nodes[node2]
         if node1.get('PTM_atom', False) == node2['PTM_atom']:
@@ -171,36 +177,104 @@ def identify_ptms(residue, residue_ptms, known_ptms):
 
 
 def _cover_graph(graph, to_cover, fragments):
-    # BASECASE: to_cover is empty
+    """
+    Find a combination of `fragments` that covers all nodes in `to_cover`.
+
+    The problem is solved as an exact cover problem: every PTM atom in
+    `to_cover` must be covered by exactly one fragment match, while the non
+    PTM atoms (the anchors) in `to_cover` must be covered at least once. The
+    matches of every fragment are computed only once, and the search is
+    memoized on the remaining atoms to cover so that dead ends are never
+    explored twice.
+
+    Fragments are tried in the order given, and a fragment is never followed by
+    a fragment that comes before it in `fragments`. Since the fragments are
+    sorted from large to small, the first cover found prefers the largest
+    modifications.
+
+    Parameters
+    ----------
+    graph: networkx.Graph
+        The graph to cover. The nodes may have the `PTM_atom` attribute.
+    to_cover: collections.abc.Set
+        The node keys in `graph` that need to be covered.
+    fragments: collections.abc.Sequence[tuple[networkx.Graph, PTMGraphMatcher]]
+        The fragments to use, and their matcher against `graph`.
+
+    Returns
+    -------
+    list[tuple[networkx.Graph, dict]]
+        The fragments used to cover `graph` and their matches.
+
+    Raises
+    ------
+    KeyError
+        There is no combination of `fragments` that covers `to_cover`.
+    """
+    to_cover = frozenset(to_cover)
     if not to_cover:
         return []
-
-    # All non-PTM atoms in residue are always available for matching...
-    available = set(n_idx for n_idx in graph
-                    if not graph.nodes[n_idx].get('PTM_atom', False))
-    # ... and add those we still need to cover
-    available.update(to_cover)
-
-    # REDUCTION: Apply one of fragments, remove those atoms from to_cover
-    # COMBINATION: add the applied option to the output.
-    for idx, option in enumerate(fragments):
-        graphlet, matcher = option
-        matches = list(matcher.subgraph_isomorphisms_iter())
-        # Matches: [{graph_idxs: fragment_idxs}, {...}, ...]
+    ptm_atoms = frozenset(n_idx for n_idx in graph
+                          if graph.nodes[n_idx].get('PTM_atom', False))
+
+    # Precompute all the options once. An option is a match of a fragment,
+    # with the nodes it covers. Options that use a PTM atom we are not
+    # asked to cover, or that do not cover anything, can never be part of
+    # a solution.
+    options = []
+    fragment_starts = []
+    for fragment_idx, (graphlet, matcher) in enumerate(fragments):
+        fragment_starts.append(len(options))
+        matches = matching_stats.track('modification', graphlet.name, matcher,
+                                       matcher.subgraph_isomorphisms_iter())
         for match in matches:
-            matching = set(match.keys())
-            # TODO: one of the matching atoms must be an anchor. Should be
-            # handled by PTMGraphMatcher already, assuming every PTM graph has
-            # at least one non-ptm atom specified
-            if matching <= available:
-                # Continue with the remaining ptm atoms, and try just this
-                # option and all smaller.
-                try:
-                    rest_cover = _cover_graph(graph, to_cover - matching, fragments[idx:])
-                except KeyError:
-                    continue
+            # Matches: {graph_idxs: fragment_idxs}
+            matching = frozenset(match.keys())
+            exclusive = matching & ptm_atoms
+            covers = matching & to_cover
+            if exclusive <= to_cover and covers:
+                options.append((fragment_idx, graphlet, match, exclusive, covers))
+    fragment_starts.append(len(options))
+
+    # For every node to cover, the options that can cover it.
+    options_per_node = {n_idx: [] for n_idx in to_cover}
+    for option_idx, option in enumerate(options):
+        for n_idx in option[4]:
+            options_per_node[n_idx].append(option_idx)
+
+    dead_ends = set()
+
+    def is_usable(option_idx, remaining):
+        # PTM atoms can only be used once, and all the PTM atoms that were not
+        # used yet are still in `remaining`.
+        return options[option_idx][3] <= remaining
+
+    def search(remaining, start):
+        if not remaining:
+            return []
+        if (remaining, start) in dead_ends:
+            return None
+        # Before branching, make sure every node we still have to cover can be
+        # covered by at least one option. This prunes most dead ends early.
+        for n_idx in remaining:
+            if not any(option_idx >= start and is_usable(option_idx, remaining)
+                       for option_idx in options_per_node[n_idx]):
+                dead_ends.add((remaining, start))
+                return None
+        for option_idx in range(start, len(options)):
+            fragment_idx, graphlet, match, _, covers = options[option_idx]
+            if not is_usable(option_idx, remaining) or not covers & remaining:
+                continue
+            rest_cover = search(remaining - covers, fragment_starts[fragment_idx])
+            if rest_cover is not None:
                 return [(graphlet, match)] + rest_cover
-    raise KeyError('Could not identify PTM')
+        dead_ends.add((remaining, start))
+        return None
+
+    cover = search(to_cover, 0)
+    if cover is None:
+        raise KeyError('Could not identify PTM')
+    return cover
 
 
 def allowed_ptms(residue, res_ptms, known_ptms):
@@ -225,7 +299,11 @@ def allowed_ptms(residue, res_ptms, known_ptms):
     # TODO: filter by element count first
     for ptm in known_ptms:
         ptm_graph_matcher = PTMGraphMatcher(residue, ptm)
-        if ptm_graph_matcher.subgraph_is_isomorphic():
+        matches = matching_stats.track('modification', ptm.name, ptm_graph_matcher,
+                                       ptm_graph_matcher.subgraph_isomorphisms_iter())
+        is_subgraph = next(matches, None) is not None
+        matches.close()
+        if is_subgraph:
             yield ptm, ptm_graph_matcher
 
 
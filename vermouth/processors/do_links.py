@@ -20,17 +20,23 @@ import numbers
 import networkx as nx
 from numpy import sign
 
+from .. import matching_stats
 from ..molecule import attributes_match
 from .processor import Processor
 
 
 class LinkGraphMatcher(nx.isomorphism.isomorphvf2.GraphMatcher):
+    # Counted by vermouth.matching_stats when not None.
+    feasibility_checks = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def semantic_feasibility(self, node1_name, node2_name):
         # TODO: implement (partial) wildcards
         # Node2 is the link
+        if self.feasibility_checks is not None:
+            self.feasibility_checks += 1
         node1 = self.G1.nodes[node1_name]
         node2 = self.G2.nodes[node2_name]
         return _atoms_match(node1, node2)
@@ -221,13 +227,24 @@ def match_order(order1, resid1, order2, resid2):
     return True
 
 
+def _link_name(link):
+    """
+    The name of a link, or the names of its atoms if it is not named.
+    """
+    if link.name:
+        return link.name
+    atomnames = (link.nodes[node].get('atomname') for node in link.nodes)
+    return '-'.join(name if isinstance(name, str) else '?' for name in atomnames)
+
+
 def match_link(molecule, link):
     if not attributes_match(molecule.meta, link.molecule_meta):
         return
 
     GM = LinkGraphMatcher(molecule, link)
 
-    raw_matches = GM.subgraph_isomorphisms_iter()
+    raw_matches = matching_stats.track('link', _link_name(link), GM,
+                                       GM.subgraph_isomorphisms_iter())
     for raw_match in raw_matches:
         # raw_match: mol -> link
         # rev_raw_match: link -> mol
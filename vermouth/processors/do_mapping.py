@@ -23,6 +23,7 @@ from itertools import product, combinations
 
 import networkx as nx
 
+from .. import matching_stats
 from ..molecule import Molecule
 from .processor import Processor
 from ..utils import are_all_equal, format_atom_string
@@ -159,6 +160,9 @@ def build_graph_mapping_collection(from_ff, to_ff, mappings):
 
 
 class MappingGraphMatcher(nx.isomorphism.isomorphvf2.GraphMatcher):
+    # Counted by vermouth.matching_stats when not None.
+    feasibility_checks = None
+
     def __init__(self, *args, edge_match=None, node_match=None, **kwargs):
         self.edge_match = edge_match
         self.node_match = node_match
@@ -169,6 +173,8 @@ class MappingGraphMatcher(nx.isomorphism.isomorphvf2.GraphMatcher):
         Returns True if mapping G1_node to G2_node is semantically feasible.
         Adapted from networkx.algorithms.isomorphism.vf2userfunc._semantic_feasibility.
         """
+        if self.feasibility_checks is not None:
+            self.feasibility_checks += 1
         # Make sure the nodes match
         if self.node_match is not None:
             nm = self.node_match(self.G1.nodes[G1_node], self.G2.nodes[G2_node])
@@ -235,7 +241,10 @@ def do_mapping(molecule, mappings, to_ff, attribute_keep=()):
     -------
     :class:`~vermouth.molecule.Molecule`
         A new molecule, created by transforming `molecule` to `to_ff` according
-        to `mappings`.
+        to `mappings`. The 'graph' attribute of its nodes is a
+        :class:`~vermouth.molecule.LazySubgraph` that refers to the nodes of
+        `molecule` rather than to copies: `molecule` is handed over to the new
+        molecule and must not be modified afterwards.
     """
     # Transfering the meta meybe should be a copy, or a deep copy...
     # If it breaks we look at this line.
@@ -254,7 +263,8 @@ def do_mapping(molecule, mappings, to_ff, attribute_keep=()):
         # We're going to find *every* way block fits on molecule.
         graphmatcher = MappingGraphMatcher(molecule, mapping.block_from,
                                            node_match=node_match, edge_match=edge_match)
-        matches = graphmatcher.subgraph_isomorphisms_iter()
+        matches = matching_stats.track('mapping', resname, graphmatcher,
+                                       graphmatcher.subgraph_isomorphisms_iter())
         for match in matches:
             all_matches.append((match, resname, mapping))
     mol_to_out = defaultdict(list)
@@ -284,8 +294,10 @@ def do_mapping(molecule, mappings, to_ff, attribute_keep=()):
             for mol_idx in mol_idxs:
                 mol_to_out[mol_idx].append(out_idx)
 
-            # Keep track of what bead comes from where
-            subgraph = molecule.subgraph(mol_idxs)
+            # Keep track of what bead comes from where. The atoms are not
+            # copied; the subgraph refers to the nodes of the molecule, which
+            # must therefore not be modified once mapped.
+            subgraph = molecule.lazy_subgraph(mol_idxs)
             graph_out.nodes[out_idx]['graph'] = subgraph
             weights = {block_to_mol[from_idx]: mapping.weights[to_idx][from_idx]
                        for from_idx in from_idxs}
@@ -293,7 +305,8 @@ def do_mapping(molecule, mappings, to_ff, attribute_keep=()):
             # We drop the node keys, since those are not super relevant. We are
             # just interested in values of the node attributes, and whether
             # they're all equal.
-            attrs = {name: list(nx.get_node_attributes(subgraph, name).values())
+            attrs = {name: [node[name] for node in subgraph.nodes.values()
+                            if name in node]
                      for name in attribute_keep}
             for attr, vals in attrs.items():
                 if not are_all_equal(vals):
@@ -393,17 +406,9 @@ class DoMapping(Processor):
 
     def run_system(self, system):
         mols = []
-        for molecule in system.molecules:
-            try:
-                new_molecule = self.run_molecule(molecule)
-            except KeyError as err:
-                if not self.delete_unknown:
-                    raise err
-                else:
-                    raise
-                    # TODO: raise a loud warning here
-            else:
-                if new_molecule:
-                    mols.append(new_molecule)
+        # No error is handled, so run_molecules raises them.
+        for new_molecule, _ in self.run_molecules(system.molecules):
+            if new_molecule:
+                mols.append(new_molecule)
         system.molecules = mols
         system.force_field = self.to_ff
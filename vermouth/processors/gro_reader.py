@@ -26,11 +26,13 @@ from ..gmx import gro
 from .processor import Processor
 
 class GROInput(Processor):
-    def __init__(self, filename, exclude=()):
+    def __init__(self, filename, exclude=(), dtype=float):
         super().__init__()
         self.filename = filename
         self.exclude = exclude
+        self.dtype = dtype
 
     def run_system(self, system):
-        molecule = gro.read_gro(self.filename, exclude=self.exclude)
+        molecule = gro.read_gro(self.filename, exclude=self.exclude, dtype=self.dtype)
+        system.box = gro.read_gro_box(self.filename)
         system.add_molecule(molecule)
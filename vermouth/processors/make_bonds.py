@@ -21,10 +21,10 @@ Provides a processor that can add edges to a graph based on geometric criteria.
 import networkx as nx
 import numpy as np
 
-from .. import KDTree
+from ..coordinates import gather_positions
 from ..molecule import Molecule
+from ..neighbor_search import iter_pairs_within
 from .processor import Processor
-from ..utils import distance
 
 # Van der Waals radii from A. Bondi, J. Phys. Chem., 68, 441-452, 1964.
 # https://doi.org/10.1021/j100785a001
@@ -53,24 +53,41 @@ VDW_RADII = {  # in nm
 }
 #VALENCES = {'H': 1, 'C': 4, 'N': 3, 'O': 2, 'S': 6}
 
+# Number of atoms for which the neighbors are searched at once when guessing
+# bonds. Each atom has a few tens of candidate neighbors, so this keeps the
+# temporary arrays in the tens of megabytes.
+CHUNK_SIZE = 50000
 
-def bonds_from_distance(system, fudge=1.2):
+
+def bonds_from_distance(system, fudge=1.2, chunk_size=CHUNK_SIZE, pbc=False):
     """
     Creates edges between nodes of molecules in system based on a distance
     criterion. Nodes in system must have `position` and `element` attributes.
     The possible distance between nodes is determined by values in
-    `VDW_RADII`.
+    `VDW_RADII`. If `pbc` is set and the system has a box, bonds are also
+    guessed across the periodic boundaries.
 
     Notes
     -----
     Elements that are not in `VDW_RADII` do not make bonds.
 
+    The molecules bonded across the periodic boundaries are not made whole,
+    so the steps that average or compare positions, such as
+    :class:`~vermouth.processors.average_beads.DoAverageBead`, see them
+    broken.
+
     Parameters
     ----------
     system: :class:`~vermouth.system.System`
         The system in which to add edges.
     fudge: :class:`~numbers.Number`
         Increase the allowed distance by this factor.
+    chunk_size: int
+        Number of atoms for which the neighbors are searched at once. Lower
+        values reduce the memory footprint of the search.
+    pbc: bool
+        Whether to guess bonds across the periodic boundaries of the box of
+        the system.
 
     Returns
     -------
@@ -78,55 +95,62 @@ def bonds_from_distance(system, fudge=1.2):
         A new graph where edges are added between nodes that are within a
         certain distance from each other. It is probably disconnected.
     """
-    system = nx.compose_all(system.molecules)
+    # Gather all the molecules in a single graph. This does the same as
+    # `nx.compose_all`, but without copying the growing graph for every
+    # molecule.
+    graph = nx.Graph()
+    for molecule in system.molecules:
+        graph.add_nodes_from(molecule.nodes(data=True))
+        graph.add_edges_from(molecule.edges(data=True))
+
     # We filter out the nodes for which we do not know the radius. Indeed, we
     # consider these nodes cannot make bonds. The filtering is done before we
-    # enter the KDTree; we only provide to the KDTree the position of the nodes
-    # that could make a bond. `idx_to_nodenum` make the link between the
-    # indices in the `positions` array, and the node keys in the `system`
-    # graph.
-    idx_to_nodenum = {
-        idx: n
-        for idx, n in enumerate(
-                subn
-                for subn in system
-                if system.nodes[subn].get('element') in VDW_RADII
+    # search for neighbors; we only provide the position of the nodes that
+    # could make a bond. `keys` make the link between the indices in the
+    # `positions` array, and the node keys in `graph`.
+    keys = []
+    nodes = []
+    radii = []
+    for key, node in graph.nodes(data=True):
+        radius = VDW_RADII.get(node.get('element'))
+        if radius is not None:
+            keys.append(key)
+            nodes.append(node)
+            radii.append(radius)
+    if not keys:
+        return graph
+    positions = gather_positions(nodes)
+    radii = np.array(radii, dtype=float)
+    max_dist = radii.max()
+
+    pairs = iter_pairs_within(positions, max_dist * fudge,
+                              box=system.box if pbc else None,
+                              chunk_size=chunk_size)
+    for idx1, idx2, dist in pairs:
+        bond_distance = 0.5 * (radii[idx1] + radii[idx2])
+        bonded = dist <= bond_distance * fudge
+        graph.add_edges_from(
+            (keys[node_idx1], keys[node_idx2], {'distance': distance})
+            for node_idx1, node_idx2, distance
+            in zip(idx1[bonded], idx2[bonded], dist[bonded])
         )
-    }
-    max_dist = max(
-        VDW_RADII[node.get('element')]
-        for node in system.nodes.values()
-        if node.get('element') in VDW_RADII
-    )
-    positions = np.array([
-        node['position']
-        for node in system.nodes.values()
-        if node.get('element') in VDW_RADII
-    ], dtype=float)
-    tree = KDTree(positions)
-    pairs = tree.sparse_distance_matrix(tree, max_dist * fudge)
-
-    for (idx1, idx2), dist in pairs.items():
-        if idx1 >= idx2:
-            continue
-        node_idx1 = idx_to_nodenum[idx1]
-        node_idx2 = idx_to_nodenum[idx2]
-        atom1 = system.node[node_idx1]
-        atom2 = system.node[node_idx2]
-        element1 = atom1['element']
-        element2 = atom2['element']
-
-        bond_distance = 0.5 * (VDW_RADII[element1] + VDW_RADII[element2])
-        if dist <= bond_distance * fudge:
-            system.add_edge(node_idx1, node_idx2, distance=dist)
-    return system
+    return graph
 
 
 class MakeBonds(Processor):
+    def __init__(self, fudge=1.2, chunk_size=CHUNK_SIZE, pbc=False):
+        super().__init__()
+        self.fudge = fudge
+        self.chunk_size = chunk_size
+        self.pbc = pbc
+
     def run_system(self, system):
-        mols = bonds_from_distance(system)
+        mols = bonds_from_distance(system, fudge=self.fudge,
+                                   chunk_size=self.chunk_size, pbc=self.pbc)
         system.molecules = list(map(Molecule, (mols.subgraph(mol)
                                                for mol in nx.connected_components(mols))))
+        for molecule in system.molecules:
+            molecule.coordinates = system.coordinates
         # Restore the force field in each molecule. Setting the force field
         # at the system level propagates it to all the molecules.
         system.force_field = system.force_field
@@ -27,11 +27,12 @@ from .processor import Processor
 
 
 class PDBInput(Processor):
-    def __init__(self, filename, exclude=()):
+    def __init__(self, filename, exclude=(), dtype=float):
         super().__init__()
         self.filename = filename
         self.exclude = exclude
+        self.dtype = dtype
 
     def run_system(self, system):
-        molecule = read_pdb(self.filename, exclude=self.exclude)
+        molecule = read_pdb(self.filename, exclude=self.exclude, dtype=self.dtype)
         system.add_molecule(molecule)
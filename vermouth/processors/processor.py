@@ -18,11 +18,66 @@ Provides an abstract base class for processors.
 """
 
 
-class Processor:
+import functools
+import time
+
+from ..executors import SerialExecutor
+from ..forcefield import ForceField
+
+
+def _profiled(run_system):
+    """
+    Make a `run_system` method report to the profiler of the processor.
+    """
+    @functools.wraps(run_system)
+    def wrapper(self, system):
+        profiler = self.profiler
+        # A subclass that calls the run_system of its parent is only recorded
+        # once.
+        if profiler is None or profiler.is_active(self):
+            return run_system(self, system)
+        with profiler.processor(self, system):
+            return run_system(self, system)
+    wrapper.profiled = True
+    return wrapper
+
+
+class _ProfiledType(type):
+    """
+    Metaclass that profiles the `run_system` method every processor class
+    defines, so the overrides report to the profiler too.
+    """
+    def __new__(mcs, name, bases, namespace):
+        run_system = namespace.get('run_system')
+        if run_system is not None and not getattr(run_system, 'profiled', False):
+            namespace['run_system'] = _profiled(run_system)
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class Processor(metaclass=_ProfiledType):
     """
     An abstract base class for processors. Subclasses must implement a
     `run_molecule` method.
+
+    Attributes
+    ----------
+    executor: vermouth.executors.SerialExecutor or vermouth.executors.ThreadExecutor or vermouth.executors.ProcessExecutor
+        The executor :meth:`run_system` dispatches the molecules with. It is
+        set on the instance; the molecules are processed serially by default.
+    handled_errors: tuple[type]
+        The exceptions raised by :meth:`run_molecule` that
+        :meth:`run_molecules` gives back rather than raises, because the
+        processor knows what to do with them.
+    profiler: vermouth.profiling.Profiler or None
+        If set, every call to :meth:`run_system`, including the ones of the
+        subclasses that override it, and the processing of each molecule are
+        recorded by this profiler. It can be set on an instance or on the
+        class.
     """
+    executor = SerialExecutor()
+    handled_errors = ()
+    profiler = None
+
     def run_system(self, system):
         """
         Process `system`.
@@ -33,10 +88,68 @@ class Processor:
             The system to process. Is modified in-place.
         """
         mols = []
-        for molecule in system.molecules:
-            mols.append(self.run_molecule(molecule))
+        for molecule, error in self.run_molecules(system.molecules):
+            if error is not None:
+                raise error
+            mols.append(molecule)
         system.molecules = mols
 
+    def run_molecules(self, molecules):
+        """
+        Process molecules with :meth:`run_molecule` using the executor.
+
+        An exception listed in :attr:`handled_errors` raised by
+        :meth:`run_molecule` does not interrupt the other molecules, it is
+        given back instead so the caller can decide if it is fatal. Any other
+        exception is raised. With the serial executor, the molecules are
+        processed as the results are consumed.
+
+        Parameters
+        ----------
+        molecules: list[vermouth.molecule.Molecule]
+            The molecules to process.
+
+        Returns
+        -------
+        collections.abc.Iterable[tuple]
+            For each molecule, in order, the processed molecule and ``None``,
+            or ``None`` and the handled exception raised while processing the
+            molecule.
+        """
+        shared = self._shared_objects(molecules)
+        if self.profiler is None:
+            return self.executor.map(self._try_run_molecule, molecules, shared=shared)
+        results = self.executor.map(self._timed_run_molecule, molecules, shared=shared)
+        return self.profiler.record_molecules(self, results)
+
+    def _timed_run_molecule(self, molecule):
+        atoms = len(molecule)
+        start = time.perf_counter()
+        result, error = self._try_run_molecule(molecule)
+        return result, error, atoms, time.perf_counter() - start
+
+    def _try_run_molecule(self, molecule):
+        try:
+            return self.run_molecule(molecule), None
+        except self.handled_errors as error:
+            return None, error
+
+    def _shared_objects(self, molecules):
+        """
+        The force fields referred to by the molecules or by the processor.
+
+        These are sent only once to the workers of a process pool.
+        """
+        candidates = [molecule.force_field for molecule in molecules]
+        candidates.extend(vars(self).values())
+        shared = []
+        seen = set()
+        for candidate in candidates:
+            if isinstance(candidate, ForceField) and id(candidate) not in seen:
+                seen.add(id(candidate))
+                shared.append(candidate)
+        return shared
+
     def run_molecule(self, molecule):
         """
         Process a single molecule. Must be implemented by subclasses.
@@ -286,6 +286,9 @@ def repair_graph(molecule, reference_graph, include_graph=True):
 
 
 class RepairGraph(Processor):
+    # The molecules with unknown residues are deleted with delete_unknown.
+    handled_errors = (KeyError,)
+
     def __init__(self, delete_unknown=False, include_graph=True):
         super().__init__()
         self.delete_unknown = delete_unknown
@@ -299,16 +302,14 @@ class RepairGraph(Processor):
 
     def run_system(self, system):
         mols = []
-        for idx, molecule in enumerate(system.molecules):
-            try:
-                new_molecule = self.run_molecule(molecule)
-            except KeyError as err:
-                if not self.delete_unknown:
-                    raise err
-                else:
-                    LOGGER.warning("Cannot recognize residue {} in  molecule {}. "
-                                   "Deleting the molecule.",
-                                   str(err), idx, type='unknown-residue')
+        results = self.run_molecules(system.molecules)
+        for idx, (new_molecule, err) in enumerate(results):
+            if isinstance(err, KeyError) and self.delete_unknown:
+                LOGGER.warning("Cannot recognize residue {} in  molecule {}. "
+                               "Deleting the molecule.",
+                               str(err), idx, type='unknown-residue')
+            elif err is not None:
+                raise err
             else:
                 mols.append(new_molecule)
         system.molecules = mols
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Record where the time and the memory go when processing a system.
+
+A :class:`Profiler` records the stages of a
+:class:`~vermouth.pipeline.Pipeline`, and every call to the
+:meth:`~vermouth.processors.processor.Processor.run_system` method of the
+processors when it is set as :attr:`Processor.profiler
+<vermouth.processors.processor.Processor.profiler>`. For each of them, it
+records the wall time, the CPU time, how much the peak memory of the process
+grew, and the number of molecules and atoms before and after. The processors
+also record the time spent on each molecule.
+
+With `trace_memory`, the allocations are also traced with :mod:`tracemalloc`,
+and the memory held by the molecules is accounted for with
+:func:`vermouth.memory.system_footprint` after each stage and processor.
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from .memory import system_footprint
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def _peak_rss():
+    """
+    The peak resident memory of the process in bytes, or `None` if it cannot
+    be known.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _cpu_time():
+    """
+    The CPU time used by the process and by its finished children.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _count(system):
+    """
+    The number of molecules and atoms in a system.
+    """
+    if system is None:
+        return None, None
+    molecules = system.molecules
+    return len(molecules), sum(len(molecule) for molecule in molecules)
+
+
+def _snapshot():
+    """
+    A snapshot of the traced allocations, without the ones of tracemalloc.
+    """
+    return tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),)
+    )
+
+
+class Profiler:
+    """
+    Record the cost of the stages and of the processors.
+
+    Parameters
+    ----------
+    cprofile_dir: str or None
+        If set, each stage is run under :mod:`cProfile`, and the statistics
+        are written in this directory as ``<index>-<stage>.prof``.
+    trace_memory: bool
+        If set, the allocations are traced with :mod:`tracemalloc` from the
+        first stage on, and every record also holds the 'traced_delta' of
+        the traced memory, and the 'footprint' of the system it returns as
+        given by :func:`~vermouth.memory.system_footprint`. The stages also
+        hold their 'traced_peak', and the `top_allocations` lines that
+        allocated the most since the previous stage.
+    top_allocations: int
+        The number of lines reported per stage with `trace_memory`.
+
+    Attributes
+    ----------
+    stages: list[dict]
+        One record per stage, in order.
+    processors: list[dict]
+        One record per call to
+        :meth:`~vermouth.processors.processor.Processor.run_system`, in the
+        order the calls start.
+
+    Notes
+    -----
+    The CPU time includes the worker processes once they are finished, but
+    the peak memory is only the one of the current process. Likewise, only
+    the allocations of the current process are traced. Tracing slows the
+    run down noticeably, and accounting for the footprint walks the whole
+    system after every step.
+    """
+    def __init__(self, cprofile_dir=None, trace_memory=False, top_allocations=10):
+        self.cprofile_dir = cprofile_dir
+        self.trace_memory = trace_memory
+        self.top_allocations = top_allocations
+        self.stages = []
+        self.processors = []
+        self._stage = None
+        self._active = []
+        self._started_tracing = False
+        self._snapshot = None
+
+    def close(self):
+        """
+        Stop tracing the allocations, if the profiler started it.
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._snapshot = None
+
+    @contextlib.contextmanager
+    def _measure(self, record, system):
+        record['molecules_in'], record['atoms_in'] = _count(system)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        traced = tracemalloc.get_traced_memory()[0] if tracing else None
+        peak = _peak_rss()
+        cpu = _cpu_time()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.perf_counter() - start
+            record['cpu'] = _cpu_time() - cpu
+            end_peak = _peak_rss()
+            record['peak_rss_delta'] = None if peak is None else end_peak - peak
+            if tracing:
+                record['traced_delta'] = tracemalloc.get_traced_memory()[0] - traced
+
+    def _start_tracing(self):
+        """
+        Start tracing the allocations before a stage, and reset the peak.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self._snapshot is None:
+            self._snapshot = _snapshot()
+        # Only available from python 3.9; the peak is then the one since
+        # tracing started.
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def _record_allocations(self, record, traced):
+        """
+        Record the traced peak of a stage, and the lines that allocated the
+        most since the previous stage.
+        """
+        record['traced_peak'] = tracemalloc.get_traced_memory()[1] - traced
+        snapshot = _snapshot()
+        differences = snapshot.compare_to(self._snapshot, 'lineno')
+        self._snapshot = snapshot
+        record['allocations'] = [
+            {'location': '{}:{}'.format(difference.traceback[0].filename,
+                                        difference.traceback[0].lineno),
+             'size_diff': difference.size_diff,
+             'count_diff': difference.count_diff}
+            for difference in differences[:self.top_allocations]
+        ]
+
+    @contextlib.contextmanager
+    def stage(self, name, system=None):
+        """
+        Record a stage.
+
+        Parameters
+        ----------
+        name: str
+            The name of the stage.
+        system: vermouth.system.System or None
+            The system given to the stage.
+
+        Yields
+        ------
+        dict
+            The record of the stage. The caller should set the system the
+            stage returns as 'system' to count its molecules and atoms.
+        """
+        record = {'name': name}
+        self.stages.append(record)
+        profile = None
+        if self.cprofile_dir is not None:
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            record['cprofile'] = os.path.join(
+                self.cprofile_dir, '{:02d}-{}.prof'.format(len(self.stages) - 1, name)
+            )
+            profile = cProfile.Profile()
+        traced = self._start_tracing() if self.trace_memory else None
+        self._stage = name
+        try:
+            with self._measure(record, system):
+                if profile is not None:
+                    profile.enable()
+                try:
+                    yield record
+                finally:
+                    if profile is not None:
+                        profile.disable()
+        finally:
+            self._stage = None
+            output = record.pop('system', None)
+            record['molecules_out'], record['atoms_out'] = _count(output)
+            if self.trace_memory:
+                self._record_allocations(record, traced)
+                record['footprint'] = None if output is None else system_footprint(output)
+            if profile is not None:
+                profile.dump_stats(record['cprofile'])
+
+    def is_active(self, processor):
+        """
+        Whether a call of the processor is being recorded.
+        """
+        return any(active is processor for active, _ in self._active)
+
+    @contextlib.contextmanager
+    def processor(self, processor, system):
+        """
+        Record a call to the `run_system` method of a processor.
+
+        Parameters
+        ----------
+        processor: vermouth.processors.processor.Processor
+        system: vermouth.system.System
+            The system given to the processor. It is modified in place.
+
+        Yields
+        ------
+        dict
+            The record of the call.
+        """
+        name = getattr(processor, 'name', None) or type(processor).__name__
+        record = {'name': name, 'stage': self._stage,
+                  'depth': len(self._active), 'molecule_timings': []}
+        self.processors.append(record)
+        self._active.append((processor, record))
+        try:
+            with self._measure(record, system):
+                yield record
+        finally:
+            self._active.pop()
+            record['molecules_out'], record['atoms_out'] = _count(system)
+            if self.trace_memory:
+                record['footprint'] = system_footprint(system)
+
+    def record_molecules(self, processor, results):
+        """
+        Record the time spent on each molecule by a processor.
+
+        Parameters
+        ----------
+        processor: vermouth.processors.processor.Processor
+        results: collections.abc.Iterable[tuple]
+            For each molecule, the molecule and the error as returned by
+            :meth:`~vermouth.processors.processor.Processor.run_molecules`,
+            followed by the number of atoms of the input molecule and the
+            time spent on it.
+
+        Yields
+        ------
+        tuple
+            The molecule and the error for each molecule.
+        """
+        record = None
+        for active, active_record in reversed(self._active):
+            if active is processor:
+                record = active_record
+                break
+        for index, (molecule, error, atoms, seconds) in enumerate(results):
+            if record is not None:
+                record['molecule_timings'].append(
+                    {'index': index, 'atoms': atoms, 'wall': seconds}
+                )
+            yield molecule, error
+
+    def report(self):
+        """
+        Summarize the records.
+
+        Returns
+        -------
+        dict
+            The 'stages' and 'processors' records, and the 'total' wall and
+            CPU time per processor name.
+        """
+        total = {}
+        for record in self.processors:
+            # Nested calls are already counted in their parent.
+            if record['depth']:
+                continue
+            summary = total.setdefault(record['name'], {'calls': 0, 'wall': 0, 'cpu': 0})
+            summary['calls'] += 1
+            summary['wall'] += record['wall']
+            summary['cpu'] += record['cpu']
+        return {'stages': self.stages, 'processors': self.processors, 'total': total}
+
+    def write(self, path):
+        """
+        Write the report as JSON.
+
+        Parameters
+        ----------
+        path: str
+        """
+        with open(str(path), 'w') as outfile:
+            json.dump(self.report(), outfile, indent=2)
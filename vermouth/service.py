@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Serve requests on a local socket, with the expensive state kept in memory.
+
+The protocol exchanges JSON objects, one per line. A request is an object
+with an optional 'id', and the fields the handler expects. The response has
+the same 'id', a 'status' that is either 'ok' or 'error', the 'result' of
+the handler or the 'error' message, and the 'timings' of the request in
+seconds: the time spent waiting for a worker ('queued'), the time spent in
+the handler ('processing'), and the time between the reception of the
+request and the response ('total').
+
+The requests are handled in a pool of worker processes, so that several
+requests are processed concurrently. A connection can send several requests;
+they are answered in order.
+"""
+
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import stat
+import time
+
+from .log_helpers import StyleAdapter, get_logger
+
+LOGGER = StyleAdapter(get_logger(__name__))
+
+# State of a worker process of a RequestServer. It is set once per worker by
+# _initialize_worker.
+_WORKER_STATE = {}
+
+
+def _initialize_worker(handler):
+    _WORKER_STATE['handler'] = handler
+
+
+def _run_request(request, received):
+    """
+    Run the handler of the worker on a request, and describe the exception
+    it raises instead of propagating it.
+    """
+    start = time.time()
+    response = {'id': request.get('id')}
+    try:
+        response['result'] = _WORKER_STATE['handler'](request)
+    except Exception as error:  # pylint: disable=broad-except
+        response['status'] = 'error'
+        response['error'] = '{}: {}'.format(type(error).__name__, error)
+    else:
+        response['status'] = 'ok'
+    end = time.time()
+    response['timings'] = {'queued': start - received, 'processing': end - start}
+    return response
+
+
+def encode_message(message):
+    """
+    Serialize a message as a line of JSON.
+
+    Parameters
+    ----------
+    message: dict
+
+    Returns
+    -------
+    bytes
+    """
+    return json.dumps(message).encode('utf8') + b'\n'
+
+
+def parse_address(address):
+    """
+    Interpret an address given as a string.
+
+    Parameters
+    ----------
+    address: str
+        Either 'host:port' for a TCP socket, or the path of a Unix domain
+        socket.
+
+    Returns
+    -------
+    str or tuple[str, int]
+        The path of the Unix socket, or the host and the port.
+    """
+    host, separator, port = str(address).rpartition(':')
+    if separator and host and port.isdigit():
+        return (host, int(port))
+    return str(address)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answer the requests of a connection, one per line.
+    """
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.process(line)
+            self.wfile.write(encode_message(response))
+            self.wfile.flush()
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn,
+                           socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RequestServer:
+    """
+    Answer requests sent on a local socket with a pool of worker processes.
+
+    Parameters
+    ----------
+    address: str or tuple[str, int]
+        The path of a Unix domain socket, or a host and a port. A port of 0
+        picks a free port. See :func:`parse_address`.
+    handler: collections.abc.Callable
+        Takes a request as a dict, and returns the result as an object that
+        can be serialized to JSON. It is sent once to each worker, so it can
+        hold the expensive state, such as the force fields. It must be
+        picklable.
+    max_workers: int or None
+        The number of worker processes. By default, one per CPU.
+
+    Attributes
+    ----------
+    address: str or tuple[str, int]
+        The address the server listens to.
+    """
+    def __init__(self, address, handler, max_workers=None):
+        self._pool = multiprocessing.Pool(max_workers, _initialize_worker, (handler, ))
+        if isinstance(address, tuple):
+            self._server = _ThreadingTCPServer(address, _RequestHandler)
+        else:
+            # A socket file left by a server that did not stop cleanly would
+            # prevent binding.
+            if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+                os.remove(address)
+            self._server = _ThreadingUnixServer(address, _RequestHandler)
+        self._server.process = self.process
+        self.address = self._server.server_address
+
+    def process(self, line):
+        """
+        Answer one request.
+
+        Parameters
+        ----------
+        line: bytes
+            The request as a line of JSON.
+
+        Returns
+        -------
+        dict
+            The response.
+        """
+        received = time.time()
+        try:
+            request = json.loads(line.decode('utf8'))
+            if not isinstance(request, dict):
+                raise ValueError('A request must be a JSON object.')
+        except ValueError as error:
+            return {'id': None, 'status': 'error',
+                    'error': 'Invalid request: {}'.format(error),
+                    'timings': {'queued': 0, 'processing': 0,
+                                'total': time.time() - received}}
+        response = self._pool.apply_async(_run_request, (request, received)).get()
+        response['timings']['total'] = time.time() - received
+        LOGGER.info('Request {} answered with status "{}" in {:.2f} s.',
+                    response['id'], response['status'],
+                    response['timings']['total'])
+        return response
+
+    def serve_forever(self):
+        """
+        Answer requests until :meth:`shutdown` is called.
+        """
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """
+        Stop :meth:`serve_forever`. Must be called from another thread.
+        """
+        self._server.shutdown()
+
+    def close(self):
+        """
+        Close the socket and stop the workers.
+        """
+        self._server.server_close()
+        self._pool.close()
+        self._pool.join()
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Client:
+    """
+    Send requests to a :class:`RequestServer`.
+
+    Parameters
+    ----------
+    address: str or tuple[str, int]
+        The address of the server.
+    timeout: float or None
+        How long to wait for a response, in seconds. `None` waits forever.
+    """
+    def __init__(self, address, timeout=None):
+        family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+        self._file = self._socket.makefile('rb')
+
+    def request(self, request):
+        """
+        Send a request and wait for the response.
+
+        Parameters
+        ----------
+        request: dict
+
+        Returns
+        -------
+        dict
+            The response.
+
+        Raises
+        ------
+        ConnectionError
+            The server closed the connection.
+        """
+        self._socket.sendall(encode_message(request))
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError('The server closed the connection.')
+        return json.loads(line.decode('utf8'))
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Stream molecules through a sequence of steps, a few at a time.
+
+Most processors handle each molecule independently, so the molecules do not
+need to all be in memory at once: each molecule can go through all the steps
+and be written before the next one is read. A step that needs the whole
+system, such as guessing the bonds, is marked as a :class:`Barrier`; all the
+molecules are gathered before it, and streamed again after it.
+"""
+
+import collections
+import itertools
+
+from .processors.processor import Processor
+from .system import System
+
+
+class Barrier:
+    """
+    A step that needs all the molecules of the system at once.
+
+    Parameters
+    ----------
+    step: vermouth.processors.processor.Processor or collections.abc.Callable
+        The step to run on the whole system. See :func:`stream_molecules`.
+    """
+    def __init__(self, step):
+        self.step = step
+
+
+class StreamContext:
+    """
+    The attributes of the system that the molecules stream through.
+
+    Attributes
+    ----------
+    force_field: vermouth.forcefield.ForceField or None
+        The force field of the system. It follows the steps that change it,
+        such as :class:`~vermouth.processors.do_mapping.DoMapping`.
+    box: numpy.ndarray or None
+        The periodic box of the system.
+    """
+    def __init__(self, force_field=None, box=None):
+        self.force_field = force_field
+        self.box = box
+
+    def make_system(self, molecules):
+        """
+        Build a system with some of the molecules.
+        """
+        system = System()
+        system.molecules = list(molecules)
+        # Do not go through the setter: it would reset the force field of
+        # the molecules.
+        system._force_field = self.force_field  # pylint: disable=protected-access
+        system.box = self.box
+        return system
+
+    def update(self, system):
+        """
+        Record the changes a step made to the attributes of a system.
+        """
+        self.force_field = system.force_field
+        self.box = system.box
+
+
+def _run_step(step, system):
+    """
+    Run a processor or a callable on a system, and return the processed
+    system.
+    """
+    if isinstance(step, Processor):
+        step.run_system(system)
+        return system
+    result = step(system)
+    return system if result is None else result
+
+
+def _drain(molecules):
+    """
+    Iterate over a list of molecules and empty it, so that the molecules can
+    be freed once they are processed.
+    """
+    queue = collections.deque(molecules)
+    del molecules[:]
+    while queue:
+        yield queue.popleft()
+
+
+def _run_segment(molecules, steps, context, batch_size):
+    """
+    Run steps that handle the molecules independently, a batch at a time.
+    """
+    molecules = iter(molecules)
+    while True:
+        batch = list(itertools.islice(molecules, batch_size))
+        if not batch:
+            return
+        system = context.make_system(batch)
+        for step in steps:
+            system = _run_step(step, system)
+            context.update(system)
+        # The molecules are dropped from the system, so that only the
+        # consumer keeps them alive.
+        yield from _drain(system.molecules)
+
+
+def _run_barrier(molecules, step, context):
+    """
+    Gather all the molecules, and run a step on the whole system.
+    """
+    system = context.make_system(molecules)
+    system = _run_step(step, system)
+    context.update(system)
+    yield from _drain(system.molecules)
+
+
+def stream_molecules(system, steps, batch_size=1):
+    """
+    Stream the molecules of a system through a sequence of steps.
+
+    The steps are processors, or callables that take a system and either
+    return the processed system or modify it in-place and return `None`.
+    Unless they are wrapped in a :class:`Barrier`, the steps are given
+    systems with only `batch_size` molecules, and must therefore handle the
+    molecules independently. A barrier gets a system with all the molecules.
+
+    The molecules are processed lazily, as the returned iterator is
+    consumed. The molecules of `system` are removed from it as they are
+    streamed, so they can be freed once processed.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+        The system to process.
+    steps: list
+        The processors, callables, or barriers to run, in order.
+    batch_size: int
+        The number of molecules that go through the steps together.
+
+    Returns
+    -------
+    tuple[StreamContext, collections.abc.Iterator[vermouth.molecule.Molecule]]
+        The context holds the force field and box of the system as the steps
+        change them; they are final once the iterator is exhausted. The
+        iterator gives the processed molecules in order.
+    """
+    if batch_size < 1:
+        raise ValueError('The batch size must be at least 1.')
+    context = StreamContext(system.force_field, system.box)
+    molecules = _drain(system.molecules)
+    segment = []
+    for step in steps:
+        if isinstance(step, Barrier):
+            if segment:
+                molecules = _run_segment(molecules, segment, context, batch_size)
+                segment = []
+            molecules = _run_barrier(molecules, step.step, context)
+        else:
+            segment.append(step)
+    if segment:
+        molecules = _run_segment(molecules, segment, context, batch_size)
+    return context, molecules
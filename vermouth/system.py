@@ -17,6 +17,8 @@
 Provides a class to describe a system.
 """
 
+from .coordinates import CoordinateStore
+
 
 class System:
     """
@@ -26,10 +28,18 @@ class System:
     ----------
     molecules: list[:class:`~vermouth.molecule.Molecule`]
         The molecules in the system.
+    box: numpy.ndarray or None
+        The periodic box of the system as a 3x3 matrix where each row is a box
+        vector, in nm. ``None`` if the system has no periodic box.
+    coordinates: :class:`~vermouth.coordinates.CoordinateStore` or None
+        The contiguous coordinates the atoms of the system are attached to,
+        if any. The readers set it, and :meth:`pack_coordinates` builds it.
     """
     def __init__(self):
         self.molecules = []
         self._force_field = None
+        self.box = None
+        self.coordinates = None
 
     @property
     def force_field(self):
@@ -60,6 +70,8 @@ class System:
         molecule: :class:`~vermouth.molecule.Molecule`
         """
         self.molecules.append(molecule)
+        if self.coordinates is None:
+            self.coordinates = getattr(molecule, 'coordinates', None)
 
     @property
     def num_particles(self):
@@ -72,12 +84,43 @@ class System:
         """
         Creates a copy of this system and it's molecules.
 
+        The molecules are copied with
+        :meth:`~vermouth.molecule.Molecule.copy`, so the attribute values and
+        the coordinate store are shared with the copy.
+
         Returns
         -------
         System
-            A deep copy of this system.
         """
         new_system = self.__class__()
         new_system.molecules = [mol.copy() for mol in self.molecules]
         new_system.force_field = self.force_field
+        new_system.box = self.box
+        new_system.coordinates = self.coordinates
         return new_system
+
+    def pack_coordinates(self, dtype=float):
+        """
+        Move the coordinates of all the atoms to a single new store.
+
+        The positions, and the velocities if all the atoms have some, are
+        copied to a :class:`~vermouth.coordinates.CoordinateStore`, and the
+        node attributes are replaced by views of it.
+
+        Parameters
+        ----------
+        dtype: numpy.dtype
+            The type of the coordinates.
+
+        Returns
+        -------
+        vermouth.coordinates.CoordinateStore
+        """
+        store = CoordinateStore.from_nodes(
+            (node for molecule in self.molecules for node in molecule.nodes.values()),
+            dtype=dtype,
+        )
+        for molecule in self.molecules:
+            molecule.coordinates = store
+        self.coordinates = store
+        return store
@@ -38,6 +38,7 @@ import hypothesis.extra.numpy as hnp
 import vermouth
 from vermouth.molecule import Molecule
 from vermouth.gmx import gro
+from vermouth.coordinates import ROW_ATTRIBUTE
 
 
 # The data comes from residues 3 to 5 of 1BTA.pdb. The atoms from ILE 5 are
@@ -576,6 +577,9 @@ def test_read_gro(gro_reference, exclude, ignh):  # pylint: disable=redefined-ou
     """
     filename, reference = gro_reference
     filter_molecule(reference, exclude=exclude, ignh=ignh)
+    # The atoms read are attached to the rows of the coordinate store.
+    for row, node in enumerate(reference.nodes.values()):
+        node[ROW_ATTRIBUTE] = row
     molecule = gro.read_gro(filename, exclude=exclude, ignh=ignh)
     pprint(list(molecule.nodes.items()))
     assert_molecule_equal(molecule, reference)
@@ -606,3 +610,52 @@ def test_write_gro(gro_reference, tmpdir):
     )
     with open(str(filename)) as ref, open(str(outname)) as out:
         assert out.read() == ref.read()
+
+
+def test_gro_frames(gro_reference, tmpdir):
+    """
+    Test writing and reading GRO files with several frames.
+    """
+    _, molecule = gro_reference
+    system = vermouth.System()
+    system.molecules.append(molecule)
+    n_atoms = len(molecule)
+    random = np.random.RandomState(0)
+    frames = [
+        (random.uniform(0, 9, size=(n_atoms, 3)), np.diag([10.0, 11.1, 12.2])),
+        (random.uniform(0, 9, size=(n_atoms, 3)),
+         np.array([[3, 0, 0], [1, 3, 0], [1, 1, 3]], dtype=float)),
+        (random.uniform(0, 9, size=(n_atoms, 3)), None),
+    ]
+    outname = tmpdir / 'frames.gro'
+    gro.write_gro_frames(system, outname, frames, title='Just a title')
+
+    read_frames = list(gro.iter_gro_frames(outname, exclude=()))
+    assert len(read_frames) == len(frames)
+    for (positions, box), (expected_positions, expected_box) in zip(read_frames, frames):
+        assert np.allclose(positions, expected_positions, atol=1e-3)
+        if expected_box is None:
+            assert box is None
+        else:
+            assert np.allclose(box, expected_box)
+
+    # The first frame is what read_gro and read_gro_box understand.
+    first = gro.read_gro(outname, exclude=())
+    assert [node['atomname'] for node in first.nodes.values()] \
+        == [node['atomname'] for node in molecule.nodes.values()]
+    assert np.allclose(gro.read_gro_box(outname), frames[0][1])
+
+
+@pytest.mark.parametrize('exclude', ((), ('SOL', ), ('ALA', 'VAL')))
+@pytest.mark.parametrize('ignh', (True, False))
+def test_iter_gro_frames_selection(gro_reference, exclude, ignh):
+    """
+    Test that the frames select the same atoms as :func:`gro.read_gro`.
+    """
+    filename, _ = gro_reference
+    molecule = gro.read_gro(filename, exclude=exclude, ignh=ignh)
+    (positions, box), = gro.iter_gro_frames(filename, exclude=exclude, ignh=ignh)
+    expected = np.stack([node['position'] for node in molecule.nodes.values()])
+    assert np.allclose(positions, expected)
+    assert np.allclose(box, np.diag([10.0, 11.1, 12.2]))
+    assert np.allclose(gro.read_gro_box(filename), box)
@@ -146,3 +146,78 @@ TER      11      B       4
 END
 '''
     assert pdb_found.strip() == expected.strip()
+
+
+def test_write_pdb_frames(dummy_system, tmpdir):
+    """
+    Make sure each frame is written as a model that can be read back, and
+    that the records only differ by their coordinates.
+    """
+    n_particles = dummy_system.num_particles
+    frames = [
+        (np.arange(n_particles * 3).reshape((n_particles, 3)) * (idx + 1) / 10, None)
+        for idx in range(3)
+    ]
+    path = str(tmpdir / 'frames.pdb')
+    pdb.write_pdb_frames(dummy_system, path, frames)
+
+    with open(path) as infile:
+        content = infile.read()
+    assert content.count('MODEL') == content.count('ENDMDL') == 3
+    single = pdb.write_pdb_string(dummy_system).splitlines()
+    first_model = content.split('ENDMDL')[0].splitlines()[1:]
+    assert [line[:30] + line[54:] for line in first_model] \
+        == [line[:30] + line[54:] for line in single if not line.startswith(('CONECT', 'END'))]
+
+    read_frames = list(pdb.iter_pdb_frames(path))
+    assert len(read_frames) == 3
+    # The frames follow the order of the nodes in the molecules, the file
+    # follows the sorted order.
+    written_order = []
+    offset = 0
+    for molecule in dummy_system.molecules:
+        keys = list(molecule)
+        written_order.extend(
+            offset + keys.index(key)
+            for key in sorted(keys, key=lambda key: pdb._keyfunc(molecule, key))
+        )
+        offset += len(keys)
+    for (positions, box), (expected, _) in zip(read_frames, frames):
+        assert box is None
+        assert np.allclose(positions, expected[written_order], atol=1e-4)
+    for model, (expected, _) in enumerate(frames):
+        molecule = pdb.read_pdb(path, model=model)
+        found = np.stack([node['position'] for node in molecule.nodes.values()])
+        assert np.allclose(found, expected[written_order], atol=1e-4)
+        assert len(molecule.edges) == sum(len(mol.edges) for mol in dummy_system.molecules)
+
+
+def test_iter_pdb_frames_exclude(dummy_system, tmpdir):
+    """
+    Make sure the frames select the same atoms as :func:`pdb.read_pdb`.
+    """
+    path = str(tmpdir / 'frames.pdb')
+    frames = [(np.random.RandomState(idx).uniform(size=(8, 3)), None)
+              for idx in range(2)]
+    pdb.write_pdb_frames(dummy_system, path, frames)
+    molecule = pdb.read_pdb(path, exclude=('B', ))
+    positions, _ = next(pdb.iter_pdb_frames(path, exclude=('B', )))
+    expected = np.stack([node['position'] for node in molecule.nodes.values()])
+    assert list(molecule.nodes) == list(range(len(molecule)))
+    assert np.allclose(positions, expected)
+
+
+@pytest.mark.parametrize('conect', (True, False))
+def test_stream_writer(dummy_system, tmpdir, conect):
+    """
+    Make sure writing the molecules one at a time gives the same file as
+    writing the whole system.
+    """
+    path = str(tmpdir / 'stream.pdb')
+    with pdb.PDBStreamWriter(path, conect=conect, omit_charges=False) as writer:
+        for molecule in dummy_system.molecules:
+            writer.write_molecule(molecule)
+    with open(path) as infile:
+        found = infile.read()
+    assert found == pdb.write_pdb_string(dummy_system, conect=conect,
+                                         omit_charges=False)
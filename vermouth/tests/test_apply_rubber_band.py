@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the rubber band elastic network.
+"""
+
+import itertools
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import vermouth
+from vermouth import selectors
+from vermouth.processors import apply_rubber_band as rubber_band
+
+# pylint: disable=redefined-outer-name
+
+
+def _dense_rubber_band(molecule, selector, lower_bound, upper_bound,
+                       decay_factor, decay_power, base_constant,
+                       minimum_force, res_min_dist):
+    """
+    Build the elastic network from the full distance matrix, independently
+    of the sparse implementation.
+    """
+    selection = [key for key in molecule if selector(molecule.nodes[key])]
+    coordinates = np.stack([molecule.nodes[key]['position'] for key in selection])
+    distance_matrix = rubber_band.self_distance_matrix(coordinates)
+    constants = rubber_band.compute_force_constants(
+        distance_matrix, lower_bound, upper_bound, decay_factor, decay_power,
+        base_constant, minimum_force,
+    )
+    # The pairs closer than `res_min_dist` bonds within the selection are
+    # excluded; this does not rely on the connectivity matrix of the module.
+    index = {key: idx for idx, key in enumerate(selection)}
+    lengths = nx.all_pairs_shortest_path_length(molecule.subgraph(selection),
+                                                cutoff=res_min_dist)
+    for key, neighbours in lengths:
+        for other in neighbours:
+            if other != key:
+                constants[index[key], index[other]] = 0
+    distance_matrix = distance_matrix.round(5)
+    bonds = []
+    for from_idx, to_idx in zip(*np.triu_indices_from(constants)):
+        if constants[from_idx, to_idx] > minimum_force:
+            bonds.append((
+                (selection[from_idx], selection[to_idx]),
+                distance_matrix[from_idx, to_idx],
+                constants[from_idx, to_idx],
+            ))
+    return bonds
+
+
+@pytest.fixture
+def chain():
+    """
+    A random walk of backbone beads with a side chain bead every other bead.
+    """
+    random = np.random.RandomState(12)
+    molecule = vermouth.Molecule()
+    position = np.zeros(3)
+    previous_backbone = None
+    for idx in range(80):
+        step = random.normal(size=3)
+        position = position + 0.35 * step / np.linalg.norm(step)
+        molecule.add_node(idx, atomname='BB', resid=idx, position=position)
+        if previous_backbone is not None:
+            molecule.add_edge(previous_backbone, idx)
+        previous_backbone = idx
+        if idx % 2:
+            key = 1000 + idx
+            molecule.add_node(key, atomname='SC1', resid=idx,
+                              position=position + 0.2)
+            molecule.add_edge(idx, key)
+    return molecule
+
+
+@pytest.mark.parametrize('decay_factor, decay_power, minimum_force, res_min_dist', (
+    (0, 0, 0, 3),
+    (1, 1, 0, 3),
+    (1, 2, 100, 3),
+    (0, 0, 0, 1),
+    (0.5, 1, 10, 5),
+))
+def test_apply_rubber_band(chain, decay_factor, decay_power, minimum_force,
+                           res_min_dist):
+    """
+    Make sure the sparse elastic network is the same as the one built from
+    the full distance matrix.
+    """
+    parameters = dict(
+        selector=selectors.select_backbone,
+        lower_bound=0.5,
+        upper_bound=0.9,
+        decay_factor=decay_factor,
+        decay_power=decay_power,
+        base_constant=500,
+        minimum_force=minimum_force,
+        res_min_dist=res_min_dist,
+    )
+    expected = _dense_rubber_band(chain, **parameters)
+    rubber_band.apply_rubber_band(chain, bond_type=6, **parameters)
+
+    found = [
+        (interaction.atoms, interaction.parameters[1], interaction.parameters[2])
+        for interaction in chain.interactions['bonds']
+    ]
+    assert expected
+    assert found == expected
+    assert all(interaction.parameters[0] == 6
+               for interaction in chain.interactions['bonds'])
+
+
+def test_apply_rubber_band_empty_selection(chain):
+    """
+    Make sure a molecule without selected atoms does not get bonds.
+    """
+    rubber_band.apply_rubber_band(
+        chain, selector=lambda node: False,
+        lower_bound=0.5, upper_bound=0.9, decay_factor=0, decay_power=0,
+        base_constant=500, minimum_force=0, bond_type=6,
+    )
+    assert not chain.interactions['bonds']
+
+
+@pytest.mark.parametrize('separation', (0, 1, 2, 5))
+def test_build_connectivity_matrix(chain, separation):
+    """
+    Make sure the connectivity matrix follows the shortest paths within the
+    selection.
+    """
+    selection = [key for key in chain if key % 3]
+    subgraph = chain.subgraph(selection)
+    matrix = rubber_band.build_connectivity_matrix(chain, separation,
+                                                   selection=selection)
+    for (idx, key_idx), (jdx, key_jdx) in itertools.product(enumerate(selection), repeat=2):
+        try:
+            path = nx.shortest_path(subgraph, key_idx, key_jdx)
+        except nx.NetworkXNoPath:
+            expected = False
+        else:
+            expected = key_idx != key_jdx and len(path) <= separation + 2
+        assert matrix[idx, jdx] == expected
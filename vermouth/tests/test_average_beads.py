@@ -19,6 +19,7 @@ import pytest
 import networkx as nx
 import numpy as np
 
+from vermouth.molecule import Molecule
 from vermouth.processors import average_beads
 
 
@@ -113,6 +114,19 @@ def test_shoot_graph(mol_with_subgraph):
         average_beads.do_average_bead(mol_with_subgraph)
 
 
+def test_shoot_empty_graph(mol_with_subgraph):
+    """
+    Test that :func:`average_beads.do_average_bead` fails if a subgraph is
+    empty, unless the missing graphs are ignored.
+    """
+    mol_with_subgraph.nodes[1]['graph'] = nx.Graph()
+    mol_with_subgraph.nodes[1]['position'] = np.zeros(3)
+    with pytest.raises(ValueError):
+        average_beads.do_average_bead(mol_with_subgraph)
+    average_beads.do_average_bead(mol_with_subgraph, ignore_missing_graphs=True)
+    assert np.allclose(mol_with_subgraph.nodes[1]['position'], 0)
+
+
 def test_processor_variable(mol_with_variable):
     processor = average_beads.DoAverageBead()
     mol = processor.run_molecule(mol_with_variable)
@@ -131,3 +145,87 @@ def test_processor_weight(mol_with_variable, weight):
     target_positions = np.stack([node[target_key] for node in mol_with_variable.nodes.values()])
     positions = np.stack([node['position'] for node in mol_with_variable.nodes.values()])
     assert np.allclose(positions, target_positions)
+
+
+def test_missing_position(mol_with_subgraph):
+    """
+    Test that atoms without a position are left out of the average.
+    """
+    mol_with_subgraph.nodes[0]['graph'].nodes[0]['position'] = None
+    del mol_with_subgraph.nodes[1]['graph'].nodes[1]['position']
+    average_beads.do_average_bead(mol_with_subgraph)
+    assert np.allclose(mol_with_subgraph.nodes[0]['position'], [2.6, 3.6, 4.6])
+    assert np.allclose(mol_with_subgraph.nodes[1]['position'], [2, 3, 4])
+
+
+def test_shoot_no_position(mol_with_subgraph):
+    """
+    Test that :func:`average_beads.do_average_bead` fails if none of the atoms
+    of a particle have a position.
+    """
+    for subnode in mol_with_subgraph.nodes[1]['graph'].nodes.values():
+        del subnode['position']
+    with pytest.raises(ValueError):
+        average_beads.do_average_bead(mol_with_subgraph)
+
+
+@pytest.mark.parametrize('missing', (False, True))
+def test_shoot_zero_weight(mol_with_subgraph, missing):
+    """
+    Test that :func:`average_beads.do_average_bead` fails if the weights of
+    the atoms with a position sum to zero for a particle.
+    """
+    node = mol_with_subgraph.nodes[1]
+    if missing:
+        # Only the atom with a zero weight has a position.
+        node['mapping_weights'] = {0: 0, 1: 3}
+        del node['graph'].nodes[1]['position']
+    else:
+        node['mapping_weights'] = {0: 0, 1: 0}
+    with pytest.raises(ValueError):
+        average_beads.do_average_bead(mol_with_subgraph)
+
+
+@pytest.mark.parametrize('weight', (None, 'mass'))
+def test_mapping_matrix_frames(mol_with_subgraph, weight):
+    """
+    Test that :class:`average_beads.MappingMatrix` maps many frames at once.
+    """
+    matrix = average_beads.MappingMatrix.from_molecule(mol_with_subgraph, weight=weight)
+    assert matrix.bead_keys == [0, 1]
+    assert matrix.atom_keys == [0, 1, 2, 0, 1]
+
+    coordinates = matrix.gather(mol_with_subgraph)
+    shifts = np.arange(4)[:, np.newaxis, np.newaxis]
+    frames = coordinates[np.newaxis, ...] + shifts
+    frames[2, 0] = np.nan
+
+    positions = matrix.apply(frames)
+    assert positions.shape == (4, 2, 3)
+    target = np.stack([
+        mol_with_subgraph.nodes[key]['target {}'.format(weight)] for key in (0, 1)
+    ])
+    for frame in (0, 1, 3):
+        assert np.allclose(positions[frame], target + frame)
+    assert np.allclose(positions[2], matrix.apply(frames[2]))
+    assert np.allclose(positions[2, 1], target[1] + 2)
+
+
+@pytest.mark.parametrize('weight', (None, 'mass', 'not mass'))
+def test_do_average_bead_lazy_subgraph(mol_with_subgraph, weight):
+    """
+    Test :func:`average_beads.do_average_bead` when the subgraphs refer to
+    the nodes of a molecule.
+    """
+    atoms = Molecule()
+    atoms.add_nodes_from(mol_with_subgraph.nodes[0]['graph'].nodes(data=True))
+    mol_with_subgraph.nodes[0]['graph'] = atoms.lazy_subgraph([0, 1, 2])
+    mol_with_subgraph.nodes[1]['graph'] = atoms.lazy_subgraph([1, 2])
+    mol_with_subgraph.nodes[1]['mapping_weights'] = {1: 2, 2: 3}
+    average_beads.do_average_bead(
+        mol_with_subgraph, ignore_missing_graphs=False, weight=weight,
+    )
+    target_key = 'target {}'.format(weight)
+    target_positions = np.stack([node[target_key] for node in mol_with_subgraph.nodes.values()])
+    positions = np.stack([node['position'] for node in mol_with_subgraph.nodes.values()])
+    assert np.allclose(positions, target_positions)
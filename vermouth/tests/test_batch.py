@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the processing of batches of inputs.
+"""
+
+import pytest
+
+from vermouth import batch
+from vermouth.executors import ProcessExecutor, SerialExecutor
+
+
+def test_read_manifest(tmpdir):
+    """
+    Make sure the manifest lines are split as in a shell, and the comments
+    and empty lines are skipped.
+    """
+    path = tmpdir / 'manifest.txt'
+    path.write('# a comment\n'
+               '-f a.pdb -x a.gro\n'
+               '\n'
+               '  -f "with space.pdb" -ss HHH  \n')
+    assert batch.read_manifest(str(path)) == [
+        ['-f', 'a.pdb', '-x', 'a.gro'],
+        ['-f', 'with space.pdb', '-ss', 'HHH'],
+    ]
+
+
+def test_glob_inputs(tmpdir):
+    """
+    Make sure the matching files are sorted, and found in subdirectories.
+    """
+    for name in ('b.pdb', 'a.pdb', 'sub/c.pdb', 'd.gro'):
+        tmpdir.ensure(name)
+    found = batch.glob_inputs(str(tmpdir / '**' / '*.pdb'))
+    assert found == [str(tmpdir / name) for name in ('a.pdb', 'b.pdb', 'sub/c.pdb')]
+
+
+def test_unique_names():
+    """
+    Make sure inputs with the same file name get different names.
+    """
+    paths = ['x/prot.pdb', 'y/prot.pdb', 'z/prot.gro', 'other.pdb']
+    assert batch.unique_names(paths) == ['prot', 'prot_1', 'prot_2', 'other']
+    # A numbered name can collide with the name of another file.
+    assert batch.unique_names(['a.pdb', 'a.gro', 'a_1.pdb']) == ['a', 'a_1', 'a_1_1']
+
+
+def _fail_on_odd(value):
+    if value % 2:
+        raise ValueError('odd value {}'.format(value))
+    return value
+
+
+@pytest.mark.parametrize('executor', (None, SerialExecutor(), ProcessExecutor(2)))
+def test_run_batch(executor):
+    """
+    Make sure the failures are recorded without stopping the batch.
+    """
+    items = [('input_{}'.format(value), value) for value in range(5)]
+    results = batch.run_batch(_fail_on_odd, items, executor)
+    assert [result.name for result in results] == [name for name, _ in items]
+    assert [result.error for result in results] == [
+        None, 'ValueError: odd value 1', None, 'ValueError: odd value 3', None
+    ]
+    assert all(result.duration >= 0 for result in results)
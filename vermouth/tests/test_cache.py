@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the on-disk cache of processed molecules.
+"""
+
+import os
+import zlib
+
+import numpy as np
+import pytest
+
+import vermouth
+from vermouth import cache as cache_module
+from vermouth.forcefield import ForceField
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def force_field():
+    """
+    A force field the cached molecules refer to by name.
+    """
+    return ForceField('dummy')
+
+
+def _molecule(force_field, shift=0):
+    """
+    Build a molecule with 3 atoms in a row.
+    """
+    molecule = vermouth.Molecule(force_field=force_field)
+    for idx in range(3):
+        molecule.add_node(idx, atomname='A{}'.format(idx), resid=1,
+                          resname='RES', chain='A',
+                          position=np.array([idx + shift, 0.0, 0.0]))
+    molecule.add_edges_from([(0, 1), (1, 2)])
+    return molecule
+
+
+def _system(force_field, shifts=(0, 0, 1)):
+    system = vermouth.System()
+    for shift in shifts:
+        system.add_molecule(_molecule(force_field, shift))
+    system.force_field = force_field
+    return system
+
+
+@pytest.fixture
+def cache(tmpdir, force_field):
+    """
+    An empty cache.
+    """
+    return cache_module.MoleculeCache(str(tmpdir / 'cache'),
+                                      {force_field.name: force_field})
+
+
+def test_molecule_hash(force_field):
+    """
+    Make sure the hash depends on the positions and on the options.
+    """
+    reference = cache_module.molecule_hash(_molecule(force_field))
+    assert cache_module.molecule_hash(_molecule(force_field)) == reference
+    assert cache_module.molecule_hash(_molecule(force_field, 1)) != reference
+    assert cache_module.molecule_hash(_molecule(force_field), {'a': 1}) != reference
+    molecule = _molecule(force_field)
+    molecule.nodes[0]['graph'] = molecule.subgraph([0])
+    assert cache_module.molecule_hash(molecule) != reference
+
+
+def test_processing_hash(force_field):
+    """
+    Make sure the hash of a molecule with an input hash ignores the atom
+    names, but not the secondary structure.
+    """
+    system = _system(force_field, (0, 1))
+    cache_module.set_input_hashes(system)
+    first, second = system.molecules
+    reference = cache_module.processing_hash(first)
+    assert cache_module.processing_hash(second) != reference
+    first.nodes[1]['atomname'] = 'renamed'
+    assert cache_module.processing_hash(first) == reference
+    first.nodes[1]['secstruct'] = 'H'
+    assert cache_module.processing_hash(first) != reference
+
+
+def test_get_put(cache, force_field):
+    """
+    Make sure a stored molecule is read back with its force field.
+    """
+    molecule = _molecule(force_field)
+    assert cache.get('key') is None
+    cache.put('key', molecule)
+    loaded = cache.get('key')
+    assert loaded.force_field is force_field
+    assert list(loaded.nodes(data='atomname')) == list(molecule.nodes(data='atomname'))
+    assert cache.stats == {'hits': 1, 'misses': 1, 'stored': 1, 'evicted': 0}
+
+
+@pytest.mark.parametrize('corrupt', (
+    lambda content: b'',
+    lambda content: content[:len(content) // 2],
+    lambda content: zlib.compress(zlib.decompress(content)[:20]),
+    lambda content: zlib.compress(b'not a pickle'),
+))
+def test_get_corrupt(cache, force_field, corrupt):
+    """
+    Make sure a corrupt or truncated entry is a miss, and is deleted.
+    """
+    cache.put('key', _molecule(force_field))
+    path = os.path.join(cache.directory, 'key' + cache.suffix)
+    with open(path, 'rb') as infile:
+        content = infile.read()
+    with open(path, 'wb') as outfile:
+        outfile.write(corrupt(content))
+    assert cache.get('key') is None
+    assert not os.path.exists(path)
+    assert cache.stats['misses'] == 1
+
+
+def test_evict(cache, force_field):
+    """
+    Make sure the least recently used molecules are evicted first.
+    """
+    for time, key in enumerate(('old', 'used', 'new')):
+        cache.put(key, _molecule(force_field))
+        os.utime(cache._path(key), (time, time))  # pylint: disable=protected-access
+    size = os.path.getsize(cache._path('new'))  # pylint: disable=protected-access
+    assert cache.get('used') is not None
+    cache.max_size = 2 * size
+    cache.evict()
+    assert cache.stats['evicted'] == 1
+    assert cache.get('old') is None
+    assert cache.get('used') is not None
+    assert cache.get('new') is not None
+
+
+def test_run_with_cache(cache, force_field):
+    """
+    Make sure the pipeline only runs on the molecules the cache misses, and
+    only once per distinct molecule.
+    """
+    calls = []
+
+    def pipeline(system):
+        calls.append(len(system.molecules))
+        for molecule in system.molecules:
+            for node in molecule.nodes.values():
+                node['mass'] = 12
+        return system
+
+    result = cache_module.run_with_cache(_system(force_field), pipeline, cache)
+    assert calls == [2]
+    assert len(result.molecules) == 3
+    result = cache_module.run_with_cache(_system(force_field, (0, 2)), pipeline, cache)
+    assert calls == [2, 1]
+    assert [molecule.nodes[2]['position'][0] for molecule in result.molecules] == [2, 4]
+    assert all(node['mass'] == 12
+               for molecule in result.molecules
+               for node in molecule.nodes.values())
+    assert all(cache_module.CACHE_KEY not in molecule.meta
+               for molecule in result.molecules)
+
+
+def test_run_with_cache_duplicates(cache, force_field):
+    """
+    Make sure identical molecules are processed once, and each occurrence
+    gets its own molecule.
+    """
+    calls = []
+
+    def pipeline(system):
+        calls.append(len(system.molecules))
+        return system
+
+    result = cache_module.run_with_cache(_system(force_field, (0, 0, 1, 0)),
+                                         pipeline, cache)
+    assert calls == [2]
+    assert len(result.molecules) == 4
+    assert len({id(molecule) for molecule in result.molecules}) == 4
+    assert [molecule.nodes[2]['position'][0]
+            for molecule in result.molecules] == [2, 2, 3, 2]
+    first, second = result.molecules[:2]
+    first.nodes[2]['position'][0] = 10
+    first.remove_node(0)
+    assert second.nodes[2]['position'][0] == 2
+    assert len(second) == 3
+
+
+def test_lost_meta(cache, force_field):
+    """
+    Make sure a pipeline that does not keep the meta is detected.
+    """
+    def pipeline(system):
+        system.molecules = [vermouth.Molecule() for _ in system.molecules]
+        return system
+
+    with pytest.raises(ValueError):
+        cache_module.run_with_cache(_system(force_field), pipeline, cache)
+
+
+def test_text_cache(tmpdir):
+    """
+    Make sure texts are stored, read back, and evicted least recently used
+    first.
+    """
+    cache = cache_module.TextCache(str(tmpdir / 'texts'), suffix='.ssd')
+    assert cache.get('old') is None
+    for time, key in enumerate(('old', 'used', 'new')):
+        cache.put(key, key * 10)
+        os.utime(cache._path(key), (time, time))  # pylint: disable=protected-access
+    assert cache.get('used') == 'usedusedusedusedusedusedusedusedusedused'
+    assert sorted(os.listdir(cache.directory)) == ['new.ssd', 'old.ssd', 'used.ssd']
+    cache.max_size = 80
+    cache.evict()
+    assert cache.get('old') is None
+    assert cache.get('new') == 'new' * 10
+    assert cache.stats == {'hits': 2, 'misses': 2, 'stored': 3, 'evicted': 1}
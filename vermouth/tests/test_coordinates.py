@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the contiguous coordinate store.
+"""
+
+import pickle
+
+import numpy as np
+import pytest
+
+import vermouth
+from vermouth.coordinates import CoordinateStore, ROW_ATTRIBUTE, gather_positions
+from vermouth.pdb.pdb import read_pdb
+from vermouth.tests.datafiles import PDB_PROTEIN
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def positions():
+    return np.arange(30, dtype=float).reshape((10, 3))
+
+
+@pytest.fixture
+def nodes(positions):
+    """
+    Node dicts attached to a store of 10 atoms.
+    """
+    nodes = [{'atomname': 'A{}'.format(idx)} for idx in range(10)]
+    store = CoordinateStore.for_nodes(nodes, positions)
+    # The nodes do not keep the store alive on their own.
+    nodes.append(store)
+    return nodes
+
+
+def test_attach(nodes, positions):
+    """
+    Make sure the nodes get views of the store.
+    """
+    store = nodes.pop()
+    for row, node in enumerate(nodes):
+        assert node[ROW_ATTRIBUTE] == row
+        assert node['position'].base is store.positions
+        assert np.all(node['position'] == positions[row])
+    nodes[3]['position'] += 1
+    assert np.all(store.positions[3] == positions[3] + 1)
+    assert CoordinateStore.of_node(nodes[3]) is store
+
+
+def test_gather_all(nodes):
+    """
+    Make sure gathering all the rows in order gives the array of the store.
+    """
+    store = nodes.pop()
+    assert gather_positions(nodes) is store.positions
+
+
+def test_gather_subset(nodes, positions):
+    """
+    Make sure gathering some rows indexes the store.
+    """
+    nodes.pop()
+    selected = [nodes[7], nodes[2], nodes[5]]
+    assert np.all(gather_positions(selected) == positions[[7, 2, 5]])
+
+
+def test_gather_replaced(nodes, positions):
+    """
+    Make sure a node whose position got replaced is read from the node.
+    """
+    store = nodes.pop()
+    nodes[4]['position'] = np.array([-1., -2., -3.])
+    expected = positions.copy()
+    expected[4] = (-1, -2, -3)
+    gathered = gather_positions(nodes)
+    assert gathered is not store.positions
+    assert np.all(gathered == expected)
+    assert CoordinateStore.of_node(nodes[4]) is None
+
+
+def test_gather_missing():
+    """
+    Make sure the nodes without a position get the default, or raise an
+    error without one.
+    """
+    nodes = [{'position': np.zeros(3)}, {}, {'position': None}]
+    gathered = gather_positions(nodes, default=np.nan)
+    assert np.all(gathered[0] == 0)
+    assert np.all(np.isnan(gathered[1:]))
+    with pytest.raises(KeyError):
+        gather_positions(nodes)
+
+
+def test_velocities(positions):
+    """
+    Make sure velocities are stored next to the positions.
+    """
+    nodes = [{} for _ in positions]
+    store = CoordinateStore.for_nodes(nodes, positions, -positions, dtype=np.float32)
+    assert store.dtype == np.float32
+    assert np.all(gather_positions(nodes, 'velocity') == -positions)
+    assert nodes[1]['velocity'].dtype == np.float32
+    with pytest.raises(ValueError):
+        CoordinateStore(positions, positions[:3])
+
+
+def test_pickle(nodes, positions):
+    """
+    Make sure the unpickled nodes are read from their own arrays.
+    """
+    nodes = pickle.loads(pickle.dumps(nodes))
+    store = nodes.pop()
+    nodes[0]['position'][:] = 100
+    assert store.positions[0, 0] == 0
+    gathered = gather_positions(nodes)
+    assert np.all(gathered[0] == 100)
+    assert np.all(gathered[1:] == positions[1:])
+
+
+def test_read_pdb():
+    """
+    Make sure the PDB reader fills a store, shared by the system and the
+    copies.
+    """
+    molecule = read_pdb(str(PDB_PROTEIN), dtype=np.float32)
+    store = molecule.coordinates
+    assert len(store) == len(molecule)
+    assert store.dtype == np.float32
+    system = vermouth.System()
+    system.add_molecule(molecule)
+    assert system.coordinates is store
+    copy = system.copy()
+    assert copy.coordinates is store
+    assert copy.molecules[0].coordinates is store
+    gathered = gather_positions(copy.molecules[0].nodes.values())
+    assert gathered.dtype == float
+    assert np.all(gathered == store.positions)
+
+
+@pytest.mark.parametrize('replace', (False, True))
+def test_gather_dtype(positions, replace):
+    """
+    Make sure the gathered coordinates are in double precision, whether they
+    come from a single precision store or from the nodes.
+    """
+    nodes = [{} for _ in positions]
+    CoordinateStore.for_nodes(nodes, positions, dtype=np.float32)
+    if replace:
+        nodes[3]['position'] = np.array(nodes[3]['position'])
+    for step in (1, 2):
+        gathered = gather_positions(nodes[::step])
+        assert gathered.dtype == float
+        assert np.all(gathered == positions[::step])
+
+
+def test_pack_coordinates():
+    """
+    Make sure a system can be packed in a single store.
+    """
+    system = vermouth.System()
+    for offset in (0, 10):
+        molecule = vermouth.Molecule()
+        molecule.add_nodes_from(
+            (idx, {'position': np.full(3, offset + idx, dtype=float)})
+            for idx in range(3)
+        )
+        system.add_molecule(molecule)
+    store = system.pack_coordinates()
+    assert system.coordinates is store
+    assert [molecule.coordinates for molecule in system.molecules] == [store, store]
+    assert np.all(store.positions[:, 0] == [0, 1, 2, 10, 11, 12])
+    nodes = [node for molecule in system.molecules for node in molecule.nodes.values()]
+    assert gather_positions(nodes) is store.positions
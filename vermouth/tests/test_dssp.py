@@ -18,11 +18,14 @@ Test the functions required to use DSSP.
 
 import os
 import itertools
+import sys
 
+import numpy as np
 import pytest
 
 import vermouth
-from vermouth.dssp import dssp
+from vermouth.cache import TextCache
+from vermouth.dssp import builtin, dssp
 from vermouth.pdb.pdb import read_pdb
 from vermouth.tests.datafiles import (
     PDB_PROTEIN,
@@ -349,3 +352,230 @@ def test_run_dssp(savefile, tmpdir):
     else:
         # Is the directory empty?
         assert not os.listdir(str(tmpdir))
+
+
+def _read_dssp_hbonds(lines):
+    """
+    Read the two N-H-->O hydrogen bonds of each residue from a DSSP output, as
+    (offset, energy) tuples.
+    """
+    lines = iter(lines)
+    for line in lines:
+        if line.startswith('  #  RESIDUE AA'):
+            break
+    hbonds = []
+    for line in lines:
+        if not line.strip() or '!' in line:
+            continue
+        hbonds.append([])
+        for column in (39, 61):
+            offset, energy = line[column:column + 11].split(',')
+            hbonds[-1].append((int(offset), float(energy)))
+    return hbonds
+
+
+def test_builtin_dssp():
+    """
+    Make sure the builtin DSSP gives the same secondary structure as the
+    DSSP program.
+    """
+    molecule = read_pdb(str(PDB_PROTEIN))
+    with open(str(DSSP_OUTPUT)) as infile:
+        expected = dssp.read_dssp2(infile)
+    assert builtin.assign_secondary_structure(molecule) == expected
+
+
+def test_builtin_hbonds():
+    """
+    Make sure the builtin DSSP finds the same hydrogen bonds as the DSSP
+    program, with the same energies.
+    """
+    molecule = read_pdb(str(PDB_PROTEIN))
+    complete, backbone, proline, chains = builtin.read_backbone(molecule)
+    assert complete.all()
+    segments = builtin.chain_segments(backbone, chains)
+    acceptors, energies = builtin.best_hbonds(
+        len(backbone), *builtin.hbond_energies(backbone, proline, segments)
+    )
+    with open(str(DSSP_OUTPUT)) as infile:
+        expected = _read_dssp_hbonds(infile)
+    assert len(expected) == len(backbone)
+    for residue, residue_hbonds in enumerate(expected):
+        for rank, (offset, energy) in enumerate(residue_hbonds):
+            # DSSP writes the energies with one decimal.
+            assert energies[residue, rank] == pytest.approx(energy, abs=0.051)
+            if energy:
+                assert acceptors[residue, rank] - residue == offset
+
+
+def test_builtin_incomplete_residue():
+    """
+    Make sure residues without a complete backbone are coils, and split the
+    chain.
+    """
+    molecule = read_pdb(str(PDB_PROTEIN))
+    residue = list(molecule.iter_residues())[16]
+    molecule.remove_nodes_from([
+        key for key in residue if molecule.nodes[key]['atomname'] == 'O'
+    ])
+    found = builtin.assign_secondary_structure(molecule)
+    assert len(found) == len(SECSTRUCT_1BTA)
+    assert found[16] == 'C'
+    assert found[:12] == SECSTRUCT_1BTA[:12]
+
+
+def test_builtin_empty():
+    """
+    Make sure a molecule without backbone has no secondary structure.
+    """
+    molecule = vermouth.Molecule()
+    molecule.add_node(0, atomname='CA', resname='ALA', resid=1, chain='A',
+                      position=[0, 0, 0])
+    assert builtin.assign_secondary_structure(molecule) == ['C']
+    assert builtin.secondary_structure(np.zeros((0, 4, 3)), np.zeros(0, bool), []) == []
+
+
+def test_annotate_dssp_builtin(tmpdir):
+    """
+    Make sure :func:`dssp.annotate_dssp` uses the builtin DSSP when asked to,
+    and does not write a save file.
+    """
+    molecule = read_pdb(str(PDB_PROTEIN))
+    dssp.annotate_dssp(molecule, executable=dssp.BUILTIN_DSSP, savedir=str(tmpdir))
+    assert list(dssp.sequence_from_residues(molecule, 'secstruct')) == SECSTRUCT_1BTA
+    assert not os.listdir(str(tmpdir))
+
+
+FAKE_DSSP = '''#!{python}
+"""
+Pretend to be DSSP: wait until {concurrent} instances run at the same
+time, then fail for chain "X" or write the reference output.
+"""
+import os
+import sys
+import time
+
+pdb = sys.stdin.read()
+marker = os.path.join({markers!r}, str(os.getpid()))
+open(marker, 'w').close()
+deadline = time.time() + 10
+while len(os.listdir({markers!r})) < {concurrent} and time.time() < deadline:
+    time.sleep(0.01)
+if len(os.listdir({markers!r})) < {concurrent}:
+    sys.exit('Not run concurrently.')
+if ' X ' in pdb.splitlines()[0]:
+    sys.exit('Cannot read chain X.')
+with open({output!r}) as infile:
+    sys.stdout.write(infile.read())
+'''
+
+
+def _fake_dssp(directory, concurrent):
+    """
+    Write a fake DSSP executable in `directory`, and return its path.
+    """
+    markers = directory.mkdir('markers')
+    path = directory / 'fake_dssp'
+    path.write(FAKE_DSSP.format(python=sys.executable, concurrent=concurrent,
+                                markers=str(markers), output=str(DSSP_OUTPUT)))
+    path.chmod(0o755)
+    return str(path)
+
+
+def _protein_system(chains):
+    system = vermouth.System()
+    for chain in chains:
+        molecule = read_pdb(str(PDB_PROTEIN))
+        for node in molecule.nodes.values():
+            node['chain'] = chain
+        system.add_molecule(molecule)
+    return system
+
+
+def test_annotate_dssp_concurrent(tmpdir):
+    """
+    Make sure DSSP runs concurrently for the molecules, and that the
+    results and save files are those of each molecule.
+    """
+    executable = _fake_dssp(tmpdir, concurrent=3)
+    savedir = tmpdir.mkdir('save')
+    system = _protein_system('ABC')
+    dssp.AnnotateDSSP(executable, savedir=str(savedir), max_workers=3).run_system(system)
+    for molecule in system.molecules:
+        assert list(dssp.sequence_from_residues(molecule, 'secstruct')) == SECSTRUCT_1BTA
+    assert sorted(os.listdir(str(savedir))) == ['chain_A.ssd', 'chain_B.ssd', 'chain_C.ssd']
+
+
+def test_annotate_dssp_concurrent_error(tmpdir):
+    """
+    Make sure a DSSP failure is reported when DSSP runs concurrently.
+    """
+    executable = _fake_dssp(tmpdir, concurrent=2)
+    system = _protein_system('AX')
+    with pytest.raises(dssp.DSSPError) as error:
+        dssp.AnnotateDSSP(executable, max_workers=2).run_system(system)
+    assert 'Cannot read chain X.' in str(error.value)
+
+
+COUNTING_DSSP = '''#!{python}
+"""
+Pretend to be DSSP: count the runs, and write the reference output.
+"""
+import sys
+
+sys.stdin.read()
+with open({counter!r}, 'a') as counter:
+    counter.write('run\\n')
+with open({output!r}) as infile:
+    sys.stdout.write(infile.read())
+'''
+
+
+def test_run_dssp_cache(tmpdir):
+    """
+    Make sure DSSP does not run again for a structure it already processed,
+    and that the save file is still written.
+    """
+    counter = tmpdir / 'counter'
+    executable = tmpdir / 'counting_dssp'
+    executable.write(COUNTING_DSSP.format(python=sys.executable, counter=str(counter),
+                                          output=str(DSSP_OUTPUT)))
+    executable.chmod(0o755)
+    cache = TextCache(str(tmpdir / 'cache'), suffix='.ssd')
+    system = vermouth.System()
+    system.add_molecule(read_pdb(str(PDB_PROTEIN)))
+
+    for _ in range(2):
+        found = dssp.run_dssp(system, str(executable), cache=cache)
+        assert found == SECSTRUCT_1BTA
+    assert counter.read() == 'run\n'
+    savefile = tmpdir / 'saved.ssd'
+    dssp.run_dssp(system, str(executable), savefile=str(savefile), cache=cache)
+    assert savefile.read() == DSSP_OUTPUT.read_text()
+    assert cache.stats == {'hits': 2, 'misses': 1, 'stored': 1, 'evicted': 0}
+
+    # Another structure, or another DSSP executable, is another entry.
+    system.molecules[0].remove_node(0)
+    dssp.run_dssp(system, str(executable), cache=cache)
+    stat = os.stat(str(executable))
+    os.utime(str(executable), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    dssp.run_dssp(system, str(executable), cache=cache)
+    assert counter.read() == 'run\n' * 3
+
+
+def test_dssp_cache_key():
+    """
+    Make sure the key of a DSSP output ignores the hydrogen names, but not the
+    other atoms.
+    """
+    lines = [
+        'ATOM      1 N    ALA A   1       1.000   1.000   1.000  1.00  0.00          N   ',
+        'ATOM      2 HD2  ALA A   1       1.000   1.000   2.000  1.00  0.00          H   ',
+        'ATOM      3 HD3  ALA A   1       2.000   1.000   2.000  1.00  0.00          H   ',
+    ]
+    reference = dssp.dssp_cache_key('\n'.join(lines))
+    swapped = [lines[0], lines[1].replace('HD2', 'HD3'), lines[2].replace('HD3', 'HD2')]
+    assert dssp.dssp_cache_key('\n'.join(swapped)) == reference
+    moved = [lines[0].replace('1.000   1.000   1.000', '1.000   1.000   1.500')] + lines[1:]
+    assert dssp.dssp_cache_key('\n'.join(moved)) != reference
+    assert dssp.dssp_cache_key('\n'.join(lines), 'other_dssp') != reference
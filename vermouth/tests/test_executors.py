@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the executors and how processors use them.
+"""
+
+import logging
+import os
+
+import pytest
+
+import vermouth
+from vermouth import executors
+from vermouth.forcefield import ForceField
+from vermouth.log_helpers import CountingHandler, StyleAdapter, get_logger
+from vermouth.processors.processor import Processor
+
+LOGGER = StyleAdapter(get_logger(__name__))
+
+# pylint: disable=redefined-outer-name
+
+EXECUTORS = (
+    executors.SerialExecutor(),
+    executors.ThreadExecutor(3),
+    executors.ProcessExecutor(2),
+)
+
+
+def _square(value):
+    return value ** 2
+
+
+def _pid(_):
+    return os.getpid()
+
+
+class TagMolecule(Processor):
+    """
+    Set the 'tag' meta of the molecules; fail on molecules named 'unknown'.
+    """
+    def __init__(self, force_field):
+        super().__init__()
+        self.force_field = force_field
+
+    def run_molecule(self, molecule):
+        if molecule.meta.get('name') == 'unknown':
+            raise KeyError('unknown')
+        if molecule.meta.get('name') == 'invalid':
+            raise ValueError('invalid')
+        LOGGER.warning('Tagging a molecule.', type='tag')
+        new_molecule = vermouth.Molecule(force_field=self.force_field)
+        new_molecule.add_nodes_from(molecule.nodes(data=True))
+        new_molecule.meta['tag'] = (len(molecule), molecule.force_field.name)
+        return new_molecule
+
+
+@pytest.fixture
+def system():
+    """
+    A system with molecules of increasing size.
+    """
+    force_field = ForceField('dummy')
+    system = vermouth.System()
+    for size in range(1, 8):
+        molecule = vermouth.Molecule(force_field=force_field)
+        molecule.add_nodes_from(range(size))
+        system.add_molecule(molecule)
+    return system
+
+
+@pytest.mark.parametrize('executor', EXECUTORS)
+def test_map_order(executor):
+    """
+    Make sure the results are given in the order of the items.
+    """
+    assert list(executor.map(_square, range(50))) == [value ** 2 for value in range(50)]
+    assert list(executor.map(_square, [])) == []
+
+
+def test_shared_objects():
+    """
+    Make sure the shared objects are not copied to and from the workers.
+    """
+    shared = [ForceField('shared')]
+    items = [{'force_field': shared[0], 'value': idx} for idx in range(5)]
+    results = executors.ProcessExecutor(2).map(dict, items, shared=shared)
+    assert [result['value'] for result in results] == list(range(5))
+    assert all(result['force_field'] is shared[0] for result in results)
+
+
+@pytest.mark.parametrize('executor', EXECUTORS)
+def test_processor_executor(system, executor):
+    """
+    Make sure processors give the same result with all the executors.
+    """
+    target = ForceField('target')
+    processor = TagMolecule(target)
+    processor.executor = executor
+    processor.run_system(system)
+    assert [molecule.meta['tag'] for molecule in system.molecules] \
+        == [(size, 'dummy') for size in range(1, 8)]
+    assert all(molecule.force_field is target for molecule in system.molecules)
+
+
+@pytest.mark.parametrize('executor', EXECUTORS)
+def test_processor_error(system, executor):
+    """
+    Make sure errors raised in a worker reach the caller.
+    """
+    system.molecules[3].meta['name'] = 'unknown'
+    processor = TagMolecule(ForceField('target'))
+    processor.executor = executor
+    with pytest.raises(KeyError):
+        processor.run_system(system)
+
+
+@pytest.mark.parametrize('executor', EXECUTORS)
+def test_processor_handled_errors(system, executor):
+    """
+    Make sure only the handled errors are given back by run_molecules.
+    """
+    system.molecules[3].meta['name'] = 'unknown'
+    processor = TagMolecule(ForceField('target'))
+    processor.handled_errors = (KeyError,)
+    processor.executor = executor
+    results = list(processor.run_molecules(system.molecules))
+    assert [error is None for _, error in results] == [True] * 3 + [False] + [True] * 3
+    assert isinstance(results[3][1], KeyError)
+
+    system.molecules[3].meta['name'] = 'invalid'
+    with pytest.raises(ValueError):
+        list(processor.run_molecules(system.molecules))
+
+
+@pytest.mark.parametrize('executor', EXECUTORS)
+def test_worker_logs(system, executor):
+    """
+    Make sure the records logged by the workers reach the handlers of the
+    calling process.
+    """
+    counter = CountingHandler()
+    logger = logging.getLogger('vermouth')
+    logger.addHandler(counter)
+    try:
+        processor = TagMolecule(ForceField('target'))
+        processor.executor = executor
+        processor.run_system(system)
+    finally:
+        logger.removeHandler(counter)
+    assert counter.counts[logging.WARNING]['tag'] == len(system.molecules)
+
+
+def test_pool_reused():
+    """
+    Make sure a process executor keeps its pool until it is shut down.
+    """
+    with executors.ProcessExecutor(2) as executor:
+        first = set(executor.map(_pid, range(20)))
+        second = set(executor.map(_pid, range(20)))
+        assert len(first | second) <= 2
+        assert os.getpid() not in first
+        directory = executor._directory  # pylint: disable=protected-access
+        assert not os.listdir(directory)
+    assert executor._pool is None  # pylint: disable=protected-access
+    assert not os.path.exists(directory)
+
+
+def _system_with_residues(resnames):
+    """
+    Build a system with a single atom molecule per residue name.
+    """
+    force_field = vermouth.forcefield.FORCE_FIELDS['universal']
+    system = vermouth.System()
+    system.force_field = force_field
+    for resname in resnames:
+        molecule = vermouth.Molecule(force_field=force_field)
+        molecule.add_node(0, atomname='CA', resname=resname, resid=1,
+                          chain='A', element='C')
+        system.add_molecule(molecule)
+    return system
+
+
+@pytest.mark.parametrize('executor', EXECUTORS)
+def test_repair_graph_delete_unknown(executor):
+    """
+    Make sure molecules with unknown residues are deleted with all the
+    executors when `delete_unknown` is set, and fail the run otherwise.
+    """
+    system = _system_with_residues(('ALA', 'XXX', 'GLY'))
+    processor = vermouth.RepairGraph(delete_unknown=True)
+    processor.executor = executor
+    processor.run_system(system)
+    assert [molecule.nodes[0]['resname'] for molecule in system.molecules] \
+        == ['ALA', 'GLY']
+
+    system = _system_with_residues(('ALA', 'XXX', 'GLY'))
+    processor = vermouth.RepairGraph(delete_unknown=False)
+    processor.executor = executor
+    with pytest.raises(KeyError):
+        processor.run_system(system)
+
+
+@pytest.mark.parametrize('processes, expected', (
+    (1, executors.SerialExecutor),
+    (2, executors.ProcessExecutor),
+    (0, executors.ProcessExecutor),
+))
+def test_make_executor(processes, expected):
+    """
+    Make sure the right executor is built.
+    """
+    assert isinstance(executors.make_executor(processes), expected)
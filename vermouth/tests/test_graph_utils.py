@@ -778,3 +778,39 @@ def test_make_residue_graph(nodes1, edges1, nodes2, edges2):
         assert expected.has_edge(idx, jdx) and expected.edges[idx, jdx] == data
         edges_seen.add(frozenset((idx, jdx)))
     assert set(frozenset(edge) for edge in expected.edges) == edges_seen
+
+
+@pytest.mark.parametrize('max_depth', (0, 1, 2, 4))
+def test_k_hop_connectivity(max_depth):
+    """
+    Make sure ``KHopConnectivity`` agrees with the shortest path lengths.
+    """
+    graph = nx.lollipop_graph(5, 6)
+    graph.add_edge(20, 21)
+    connectivity = vermouth.graph_utils.KHopConnectivity(graph, max_depth)
+    lengths = dict(nx.all_pairs_shortest_path_length(graph))
+
+    nodes_a = []
+    nodes_b = []
+    for node_a in graph:
+        for node_b in graph:
+            expected = lengths[node_a].get(node_b)
+            if expected is not None and expected > max_depth:
+                expected = None
+            assert connectivity.distance(node_a, node_b) == expected
+            assert connectivity.are_connected(node_a, node_b) == (expected is not None)
+            nodes_a.append(node_a)
+            nodes_b.append(node_b)
+    mask = connectivity.pair_mask(nodes_a, nodes_b)
+    assert mask.tolist() == [
+        connectivity.are_connected(node_a, node_b)
+        for node_a, node_b in zip(nodes_a, nodes_b)
+    ]
+
+
+def test_k_hop_connectivity_negative():
+    """
+    Make sure a negative depth is refused.
+    """
+    with pytest.raises(ValueError):
+        vermouth.graph_utils.KHopConnectivity(nx.path_graph(3), -1)
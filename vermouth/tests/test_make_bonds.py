@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the guessing of bonds from distances.
+"""
+
+import numpy as np
+import pytest
+
+import vermouth
+from vermouth.processors.make_bonds import bonds_from_distance
+
+
+def _make_system(positions, elements, box=None):
+    system = vermouth.System()
+    molecule = vermouth.Molecule()
+    for idx, (position, element) in enumerate(zip(positions, elements)):
+        molecule.add_node(idx, position=np.array(position, dtype=float),
+                          element=element)
+    system.add_molecule(molecule)
+    system.box = box
+    return system
+
+
+@pytest.mark.parametrize('box, pbc, expected', (
+    (None, False, [(0, 1)]),
+    (None, True, [(0, 1)]),
+    (np.diag([3.0, 3.0, 3.0]), False, [(0, 1)]),
+    (np.diag([3.0, 3.0, 3.0]), True, [(0, 1), (0, 2)]),
+))
+def test_bonds_from_distance(box, pbc, expected):
+    """
+    Make sure bonds are guessed, and guessed across the periodic boundaries
+    only when asked and when the system has a box.
+    """
+    system = _make_system(
+        positions=[[0.05, 1.0, 1.0], [0.19, 1.0, 1.0], [2.95, 1.0, 1.0],
+                   [1.5, 1.5, 1.5]],
+        elements=['C', 'C', 'C', 'Xx'],
+        box=box,
+    )
+    graph = bonds_from_distance(system, pbc=pbc)
+    assert sorted(tuple(sorted(edge)) for edge in graph.edges) == expected
+
+
+@pytest.mark.parametrize('pbc, expected', (
+    (False, [2, 1]),
+    (True, [3]),
+))
+def test_make_bonds_split_molecule(pbc, expected):
+    """
+    Make sure a molecule split across the box is only joined by MakeBonds
+    when the periodic boundaries are asked for.
+    """
+    system = _make_system(
+        positions=[[0.05, 1.0, 1.0], [0.19, 1.0, 1.0], [2.95, 1.0, 1.0]],
+        elements=['C', 'C', 'C'],
+        box=np.diag([3.0, 3.0, 3.0]),
+    )
+    vermouth.MakeBonds(pbc=pbc).run_system(system)
+    assert [len(molecule) for molecule in system.molecules] == expected
+
+
+def test_make_bonds_keeps_input():
+    """
+    Make sure MakeBonds builds new molecules instead of modifying the ones of
+    the system, so a caller can keep the system as it was read.
+    """
+    system = _make_system(
+        positions=[[0.05, 1.0, 1.0], [0.19, 1.0, 1.0], [2.95, 1.0, 1.0]],
+        elements=['C', 'C', 'C'],
+    )
+    molecule = system.molecules[0]
+    nodes = {key: dict(node) for key, node in molecule.nodes.items()}
+    vermouth.MakeBonds().run_system(system)
+    assert molecule not in system.molecules
+    assert not molecule.edges
+    assert dict(molecule.nodes.items()) == nodes
+    for key, node in molecule.nodes.items():
+        assert all(node is not new_molecule.nodes.get(key)
+                   for new_molecule in system.molecules)
+
+
+def test_bonds_from_distance_chunks():
+    """
+    Make sure the chunk size does not change the guessed bonds.
+    """
+    random = np.random.RandomState(42)
+    positions = random.uniform(0, 1.5, size=(300, 3))
+    elements = random.choice(['C', 'N', 'O', 'H', 'Xx'], size=300)
+    system = _make_system(positions, elements)
+
+    reference = bonds_from_distance(system)
+    chunked = bonds_from_distance(system, chunk_size=7)
+
+    assert list(reference.nodes) == list(chunked.nodes)
+    assert set(reference.edges) == set(chunked.edges)
+    for edge in reference.edges:
+        assert reference.edges[edge]['distance'] == chunked.edges[edge]['distance']
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the counters of the graph matching searches.
+"""
+
+import networkx as nx
+import pytest
+
+import vermouth
+from vermouth import matching_stats
+from vermouth.graph_utils import isomorphism, maximum_common_subgraph
+from vermouth.processors.do_links import match_link
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def stats():
+    """
+    Counters enabled during the test.
+    """
+    stats = matching_stats.enable()
+    yield stats
+    matching_stats.disable()
+
+
+def _chain(length, resname='ALK'):
+    graph = vermouth.Molecule()
+    for idx in range(length):
+        graph.add_node(idx, element='C', atomname='C{}'.format(idx),
+                       resname=resname, resid=1)
+    nx.add_path(graph, range(length))
+    return graph
+
+
+def test_isomorphism(stats):
+    """
+    Make sure the searches of an isomorphism are counted under the residue
+    name.
+    """
+    matches = isomorphism(_chain(4), _chain(3))
+    assert len(matches) == 2
+    assert list(stats.records) == [('isomorphism', 'ALK')]
+    record = stats.records[('isomorphism', 'ALK')]
+    # The atoms of degree 1 are the hydrogens: one search matches the middle
+    # atom on the 4 atoms of the reference, and one search per position
+    # extends it to the whole residue.
+    assert record['searches'] == 1 + 4
+    assert record['matches'] == 4 + 2
+    assert record['feasibility'] > 0
+    assert record['time'] >= 0
+
+
+def test_mcs(stats):
+    """
+    Make sure the maximum common subgraph searches are counted.
+    """
+    matches = maximum_common_subgraph(_chain(3), _chain(4), ['element'])
+    assert stats.records[('mcs', 'ALK')]['searches'] == 1
+    assert stats.records[('mcs', 'ALK')]['matches'] == len(matches)
+
+
+def test_link(stats):
+    """
+    Make sure the link searches are counted, also when not all matches are
+    used.
+    """
+    link = vermouth.molecule.Link()
+    link.add_node(0, atomname='C0')
+    link.add_node(1, atomname='C1')
+    link.add_edge(0, 1)
+    matches = match_link(_chain(4), link)
+    assert next(matches)
+    matches.close()
+    assert stats.records[('link', 'C0-C1')]['searches'] == 1
+    assert stats.records[('link', 'C0-C1')]['matches'] == 1
+
+
+def test_table(stats):
+    """
+    Make sure the table lists the most expensive searches first.
+    """
+    stats.records[('link', 'cheap')] = {
+        'searches': 1, 'feasibility': 2, 'matches': 3, 'time': 0.5,
+    }
+    stats.records[('mapping', 'ALA')] = {
+        'searches': 10, 'feasibility': 200, 'matches': 3, 'time': 1.25,
+    }
+    assert stats.table().splitlines() == [
+        'kind     name   searches  feasibility  matches  time (s)',
+        'mapping  ALA          10          200        3     1.250',
+        'link     cheap         1            2        3     0.500',
+    ]
+
+
+def test_disabled():
+    """
+    Make sure nothing is counted when counting is not enabled.
+    """
+    assert matching_stats.ACTIVE is None
+    assert len(isomorphism(_chain(4), _chain(3))) == 2
+    assert len(maximum_common_subgraph(_chain(3), _chain(4), ['element'])) > 0
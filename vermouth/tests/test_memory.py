@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the accounting of the memory held by the molecules.
+"""
+
+import numpy as np
+import pytest
+
+import vermouth
+from vermouth.forcefield import ForceField
+from vermouth.memory import CATEGORIES, deep_size, molecule_footprint, system_footprint
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def molecule():
+    """
+    A molecule of 3 atoms, with positions, a subgraph, edges, and an
+    interaction.
+    """
+    molecule = vermouth.Molecule(force_field=ForceField(name='dummy'))
+    for idx in range(3):
+        molecule.add_node(idx, atomname='A{}'.format(idx), position=np.zeros(3))
+    molecule.add_edges_from(((0, 1), (1, 2)))
+    molecule.add_interaction('angles', (0, 1, 2), ['1', '120', '50'])
+    molecule.nodes[0]['graph'] = molecule.subgraph([0, 1])
+    molecule.meta['moltype'] = 'TEST'
+    return molecule
+
+
+def test_deep_size_shared():
+    """
+    Make sure a shared object is counted once.
+    """
+    array = np.zeros(1000)
+    seen = set()
+    first = deep_size([array], seen)
+    second = deep_size([array], seen)
+    assert first >= array.nbytes
+    assert second < array.nbytes
+
+
+def test_deep_size_view():
+    """
+    Make sure the data of a view is counted.
+    """
+    array = np.zeros((1000, 3))
+    assert deep_size(array[0]) >= array.nbytes
+
+
+def test_molecule_footprint(molecule):
+    """
+    Make sure every category is counted.
+    """
+    sizes = molecule_footprint(molecule)
+    assert set(sizes) == set(CATEGORIES)
+    assert all(sizes[category] > 0 for category in CATEGORIES)
+    # The positions of the subgraph are the ones of the molecule.
+    assert sizes['subgraphs'] < deep_size(molecule.nodes[0]['graph'])
+
+
+def test_force_field_not_counted(molecule):
+    """
+    Make sure the force field is not counted.
+    """
+    before = molecule_footprint(molecule)
+    for name in 'ABCDEFGHIJ':
+        molecule.force_field.blocks[name] = vermouth.molecule.Block(name=name)
+    assert molecule_footprint(molecule) == before
+
+
+def test_system_footprint(molecule):
+    """
+    Make sure the molecules of a system are summed, and the shared objects
+    counted once.
+    """
+    system = vermouth.System()
+    system.add_molecule(molecule)
+    single = system_footprint(system)
+    other = molecule.copy()
+    system.add_molecule(other)
+    double = system_footprint(system)
+    assert single['atoms'] == 3
+    assert double['atoms'] == 6
+    assert single['total'] == sum(single[category] for category in CATEGORIES)
+    # The copy has its own node dicts, but shares the positions.
+    assert double['node_dicts'] > single['node_dicts']
+    assert double['positions'] == single['positions']
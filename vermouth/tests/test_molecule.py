@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import pickle
+
 import pytest
 import vermouth
 
@@ -192,6 +194,36 @@ def test_copy_interactions_mod(molecule, molecule_copy):
     assert n_bonds_copy > n_bonds
 
 
+@pytest.mark.parametrize('modified', ('original', 'copy'))
+def test_copy_remove(molecule, molecule_copy, modified):
+    """
+    Make sure removing nodes and edges from the molecule or from its copy
+    leaves the other one untouched.
+    """
+    edges = set(molecule.edges)
+    interactions = {name: list(values) for name, values in molecule.interactions.items()}
+    if modified == 'original':
+        target, other = molecule, molecule_copy
+    else:
+        target, other = molecule_copy, molecule
+    target.remove_edge(0, 1)
+    target.remove_node(2)
+    assert list(target.edges) == []
+    assert set(other.edges) == edges
+    assert list(other.nodes) == [2, 0, 1]
+    assert other.interactions == interactions
+
+
+def test_copy_edges_data(molecule, molecule_copy):
+    """
+    Make sure both directions of an edge of a copy see the same attributes.
+    """
+    molecule_copy.edges[0, 1]['order'] = 2
+    assert molecule_copy.edges[1, 0]['order'] == 2
+    assert 'order' not in molecule.edges[0, 1]
+    assert list(molecule_copy.edges(data='order')) == [(2, 0, None), (0, 1, 2)]
+
+
 def test_subgraph_base(molecule_subgraph):
     assert tuple(molecule_subgraph) == (2, 0)  # order matters!
     assert (0, 2) in molecule_subgraph.edges
@@ -204,6 +236,39 @@ def test_subgraph_interactions(molecule_subgraph):
     assert (0, 1) not in bond_atoms
 
 
+@pytest.fixture
+def molecule_lazy_subgraph(molecule):
+    return molecule.lazy_subgraph([2, 0])
+
+
+def test_lazy_subgraph_nodes(molecule, molecule_lazy_subgraph):
+    assert tuple(molecule_lazy_subgraph) == (2, 0)  # order matters!
+    assert len(molecule_lazy_subgraph) == 2
+    assert 1 not in molecule_lazy_subgraph
+    assert list(molecule_lazy_subgraph.nodes(data='atomname')) == [(2, 'CC'), (0, 'AA')]
+    # The nodes are the ones of the molecule, not copies.
+    assert molecule_lazy_subgraph.nodes[0] is molecule.nodes[0]
+    with pytest.raises(KeyError):
+        molecule_lazy_subgraph.nodes[1]  # pylint: disable=pointless-statement
+
+
+def test_lazy_subgraph_materialize(molecule_subgraph, molecule_lazy_subgraph):
+    materialized = molecule_lazy_subgraph.materialize()
+    assert isinstance(materialized, vermouth.molecule.Molecule)
+    assert list(materialized.nodes(data=True)) == list(molecule_subgraph.nodes(data=True))
+    assert set(materialized.edges) == set(molecule_subgraph.edges)
+    assert materialized.interactions == molecule_subgraph.interactions
+    # Only the nodes are available without materializing the subgraph.
+    with pytest.raises(AttributeError):
+        molecule_lazy_subgraph.edges  # pylint: disable=pointless-statement
+
+
+def test_lazy_subgraph_pickle(molecule_lazy_subgraph):
+    pickled = pickle.loads(pickle.dumps(molecule_lazy_subgraph))
+    assert pickled.keys == molecule_lazy_subgraph.keys
+    assert dict(pickled.nodes) == dict(molecule_lazy_subgraph.nodes)
+
+
 def test_link_predicate_match():
     lp = vermouth.molecule.LinkPredicate(None)
     with pytest.raises(NotImplementedError):
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the cell list neighbor search.
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from vermouth import neighbor_search
+from vermouth import geometry
+from vermouth.gmx.gro import parse_box_line
+
+BOXES = (
+    None,
+    [3.0, 3.5, 4.0],
+    # Triclinic box in the GRO format
+    [3.0, 3.0, 3.0, 0.0, 0.0, 1.0, 0.0, 1.0, 1.0],
+    # Box with less than 3 cells per dimension
+    [1.5, 1.5, 1.5],
+)
+
+
+def _brute_force(coordinates_a, coordinates_b, cutoff, box):
+    """
+    Find the pairs under the cutoff by looking at all the images.
+    """
+    box = neighbor_search.box_matrix(box)
+    if box is None:
+        shifts = np.zeros((1, 3))
+    else:
+        shifts = np.array([
+            np.dot(shift, box)
+            for shift in itertools.product((-2, -1, 0, 1, 2), repeat=3)
+        ])
+    pairs = {}
+    for shift in shifts:
+        distances = geometry.distance_matrix(coordinates_a, coordinates_b + shift)
+        for idx, jdx in zip(*np.where(distances <= cutoff)):
+            distance = distances[idx, jdx]
+            pairs[(idx, jdx)] = min(distance, pairs.get((idx, jdx), np.inf))
+    return pairs
+
+
+def _as_dict(pairs):
+    return {(idx, jdx): distance for idx, jdx, distance in zip(*pairs)}
+
+
+@pytest.mark.parametrize('box', BOXES)
+@pytest.mark.parametrize('cutoff', (0.2, 0.7))
+def test_pairs_between(box, cutoff):
+    """
+    Make sure all the pairs between two sets of points are found.
+    """
+    random = np.random.RandomState(42)
+    coordinates_a = random.uniform(-0.5, 3, size=(50, 3))
+    coordinates_b = random.uniform(-0.5, 3, size=(40, 3))
+
+    found = _as_dict(neighbor_search.pairs_between(
+        coordinates_a, coordinates_b, cutoff, box=box
+    ))
+    expected = _brute_force(coordinates_a, coordinates_b, cutoff, box)
+
+    assert found.keys() == expected.keys()
+    for key, distance in found.items():
+        assert np.isclose(distance, expected[key])
+
+
+@pytest.mark.parametrize('box', BOXES)
+def test_pairs_within(box):
+    """
+    Make sure pairs within a set of points are reported only once.
+    """
+    random = np.random.RandomState(42)
+    coordinates = random.uniform(0, 3, size=(60, 3))
+
+    index_a, index_b, _ = neighbor_search.pairs_within(coordinates, 0.5, box=box)
+    expected = {
+        key for key in _brute_force(coordinates, coordinates, 0.5, box)
+        if key[0] < key[1]
+    }
+
+    assert np.all(index_a < index_b)
+    assert set(zip(index_a, index_b)) == expected
+
+
+@pytest.mark.parametrize('chunk_size', (1, 7, 1000))
+def test_chunks(chunk_size):
+    """
+    Make sure chunking does not change the result.
+    """
+    random = np.random.RandomState(42)
+    coordinates = random.uniform(0, 3, size=(60, 3))
+
+    reference = _as_dict(neighbor_search.pairs_within(coordinates, 0.5))
+    chunks = list(neighbor_search.iter_pairs_within(
+        coordinates, 0.5, chunk_size=chunk_size
+    ))
+    found = {}
+    for chunk in chunks:
+        found.update(_as_dict(chunk))
+    assert found == reference
+
+
+def test_empty():
+    """
+    Make sure an empty selection gives empty arrays.
+    """
+    index_a, index_b, distances = neighbor_search.pairs_between(
+        np.zeros((0, 3)), np.ones((5, 3)), 1.0
+    )
+    assert len(index_a) == len(index_b) == len(distances) == 0
+
+
+@pytest.mark.parametrize('cutoff, box', (
+    (0, None),
+    (-1, None),
+    (1.0, [1.5, 1.5, 1.5]),
+))
+def test_invalid_cutoff(cutoff, box):
+    """
+    Make sure invalid cutoffs are refused.
+    """
+    with pytest.raises(ValueError):
+        neighbor_search.pairs_within(np.zeros((3, 3)), cutoff, box=box)
+
+
+@pytest.mark.parametrize('box, expected', (
+    (None, None),
+    ([0, 0, 0], None),
+    ([1, 2, 3], np.diag([1, 2, 3])),
+    ([1, 2, 3, 0, 0, 4, 0, 5, 6], [[1, 0, 0], [4, 2, 0], [5, 6, 3]]),
+    (np.eye(3), np.eye(3)),
+))
+def test_box_matrix(box, expected):
+    """
+    Make sure the different box formats are understood.
+    """
+    matrix = neighbor_search.box_matrix(box)
+    if expected is None:
+        assert matrix is None
+    else:
+        assert np.allclose(matrix, expected)
+
+
+@pytest.mark.parametrize('line, expected', (
+    ('   1.00000   2.00000   3.00000\n', np.diag([1, 2, 3])),
+    ('1 2 3 0 0 4 0 5 6', [[1, 0, 0], [4, 2, 0], [5, 6, 3]]),
+    ('0 0 0', None),
+    ('not a box', None),
+))
+def test_parse_box_line(line, expected):
+    """
+    Make sure GRO box lines are parsed.
+    """
+    box = parse_box_line(line)
+    if expected is None:
+        assert box is None
+    else:
+        assert np.allclose(box, expected)
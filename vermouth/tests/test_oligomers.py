@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the replication of identical molecules with :mod:`vermouth.oligomers`.
+"""
+
+import numpy as np
+import pytest
+
+import vermouth
+from vermouth import oligomers
+from vermouth.processors import average_beads
+
+# pylint: disable=redefined-outer-name
+
+
+def _chain(chain, offset, shift, secstruct='H'):
+    """
+    Build a molecule with 4 atoms, numbered from `offset`.
+    """
+    molecule = vermouth.Molecule()
+    for idx in range(4):
+        molecule.add_node(offset + idx, atomname='A{}'.format(idx), resid=1,
+                          resname='RES', chain=chain, secstruct=secstruct,
+                          position=np.array([idx, idx ** 2, 0.0]) + shift)
+    molecule.add_edges_from(zip(range(offset, offset + 3), range(offset + 1, offset + 4)))
+    return molecule
+
+
+def _coarse_grain(system):
+    """
+    Map each molecule to 2 beads and a dummy, and delete molecules in chain
+    'X'.
+    """
+    molecules = []
+    for molecule in system.molecules:
+        if molecule.nodes[min(molecule)]['chain'] == 'X':
+            continue
+        keys = list(molecule)
+        cg_molecule = vermouth.Molecule(meta=molecule.meta)
+        for bead, atoms in enumerate((keys[:2], keys[2:])):
+            cg_molecule.add_node(bead, graph=molecule.subgraph(atoms),
+                                 atomname='B{}'.format(bead),
+                                 chain=molecule.nodes[atoms[0]]['chain'])
+        cg_molecule.add_node(2, atomname='D', chain=molecule.nodes[keys[0]]['chain'])
+        cg_molecule.add_edges_from([(0, 1), (1, 2)])
+        cg_molecule.add_interaction('bonds', (0, 1), ['1', '0.3'])
+        average_beads.do_average_bead(cg_molecule, ignore_missing_graphs=True,
+                                       weight=None)
+        cg_molecule.nodes[2]['position'] = cg_molecule.nodes[1]['position'] + 1
+        molecules.append(cg_molecule)
+    system.molecules = molecules
+    return system
+
+
+@pytest.fixture
+def system():
+    """
+    Three identical chains, one chain with a different secondary structure,
+    and one chain the pipeline deletes.
+    """
+    system = vermouth.System()
+    system.add_molecule(_chain('A', 0, 0))
+    system.add_molecule(_chain('B', 4, 10))
+    system.add_molecule(_chain('C', 8, 0, secstruct='E'))
+    system.add_molecule(_chain('X', 12, 0, secstruct='C'))
+    system.add_molecule(_chain('D', 16, -5))
+    return system
+
+
+def test_group_molecules(system):
+    """
+    Make sure only the per-copy attributes are ignored when grouping.
+    """
+    assert oligomers.group_molecules(system.molecules) == [[0, 1, 4], [2], [3]]
+    # The order of the atoms does not matter.
+    reordered = vermouth.Molecule()
+    reordered.add_nodes_from(reversed(list(system.molecules[4].nodes(data=True))))
+    reordered.add_edges_from(system.molecules[4].edges)
+    system.molecules[4] = reordered
+    assert oligomers.group_molecules(system.molecules) == [[0, 1, 4], [2], [3]]
+    system.molecules[1].nodes[5]['position'] = None
+    assert oligomers.group_molecules(system.molecules) == [[0, 4], [1], [2], [3]]
+
+
+def test_run_on_representatives(system):
+    """
+    Make sure replicating gives the same result as running the pipeline on
+    every molecule.
+    """
+    for idx, molecule in enumerate(system.molecules):
+        molecule.meta['input_hash'] = idx
+    expected = _coarse_grain(system.copy())
+    calls = []
+
+    def pipeline(representatives):
+        calls.append(len(representatives.molecules))
+        return _coarse_grain(representatives)
+
+    result = oligomers.run_on_representatives(system, pipeline, weight=False)
+    assert calls == [3]
+    assert len(result.molecules) == len(expected.molecules) == 4
+    for molecule, reference in zip(result.molecules, expected.molecules):
+        assert list(molecule.nodes) == list(reference.nodes)
+        assert molecule.interactions == reference.interactions
+        assert 'oligomer_group' not in molecule.meta
+        assert molecule.meta['input_hash'] == reference.meta['input_hash']
+        for key, node in molecule.nodes.items():
+            reference_node = reference.nodes[key]
+            assert node['chain'] == reference_node['chain']
+            assert np.allclose(node['position'], reference_node['position'])
+            if 'graph' in reference_node:
+                assert list(node['graph'].nodes(data='chain')) \
+                    == list(reference_node['graph'].nodes(data='chain'))
+
+
+def test_residue_fingerprint(system):
+    """
+    Make sure only single residue molecules get a fingerprint, and that it
+    depends on the atom names.
+    """
+    fingerprints = [oligomers.residue_fingerprint(molecule)
+                    for molecule in system.molecules]
+    assert fingerprints[0] == fingerprints[1] == fingerprints[4]
+    assert fingerprints[0] != fingerprints[2]
+    system.molecules[1].nodes[6]['atomname'] = 'Z'
+    assert oligomers.residue_fingerprint(system.molecules[1]) != fingerprints[0]
+    system.molecules[0].nodes[3]['resid'] = 2
+    assert oligomers.residue_fingerprint(system.molecules[0]) is None
+    assert oligomers.small_molecule_signature(system.molecules[0]) \
+        == oligomers.topology_signature(system.molecules[0])
+
+
+@pytest.mark.parametrize('reset', (True, False))
+def test_changed_per_copy_attributes(system, reset):
+    """
+    Make sure the per-copy attributes the pipeline changes are replicated,
+    and the others are kept.
+    """
+    for idx, molecule in enumerate(system.molecules):
+        for node in molecule.nodes.values():
+            node['resid'] = idx + 1
+
+    def pipeline(representatives):
+        for molecule in representatives.molecules:
+            for node in molecule.nodes.values():
+                if reset:
+                    node['resid'] = 42
+                node['mass'] = 12
+        return representatives
+
+    oligomers.run_on_representatives(system, pipeline, weight=False,
+                                     signature=oligomers.residue_fingerprint)
+    molecule = system.molecules[-1]
+    assert [node['chain'] for node in molecule.nodes.values()] == ['D'] * 4
+    assert [node['mass'] for node in molecule.nodes.values()] == [12] * 4
+    assert [node['resid'] for node in molecule.nodes.values()] \
+        == [42 if reset else 5] * 4
+    assert np.allclose(molecule.nodes[17]['position'], [-4, -4, -5])
+    assert all(oligomers.ATOM_INDEX not in node
+               for molecule in system.molecules
+               for node in molecule.nodes.values())
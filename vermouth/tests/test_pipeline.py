@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the pipelines and their checkpoints.
+"""
+
+import numpy as np
+import pytest
+
+import vermouth
+from vermouth import pipeline as pipeline_module
+from vermouth.forcefield import ForceField
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def force_field():
+    """
+    A force field the checkpoints refer to by name.
+    """
+    return ForceField('dummy')
+
+
+def _build_pipeline(tmpdir, force_field, calls, scale=2):
+    """
+    Build a pipeline that records the stages it runs in `calls`.
+    """
+    def read(_):
+        calls.append('read')
+        system = vermouth.System()
+        molecule = vermouth.Molecule(force_field=force_field)
+        molecule.add_node(0, position=np.array([1.0, 2.0, 3.0]))
+        system.add_molecule(molecule)
+        system.force_field = force_field
+        return system
+
+    def expensive(system):
+        calls.append('expensive')
+        pipeline.data['count'] = len(system.molecules)
+        return system
+
+    def cheap(system):
+        calls.append('cheap')
+        system.molecules[0].nodes[0]['position'] *= scale
+        return system
+
+    pipeline = pipeline_module.Pipeline(
+        key='input', checkpoint_dir=str(tmpdir),
+        force_fields={force_field.name: force_field},
+    )
+    pipeline.add_stage('read', read)
+    pipeline.add_stage('expensive', expensive, checkpoint=True)
+    pipeline.add_stage('cheap', cheap, options={'scale': scale})
+    return pipeline
+
+
+def test_resume(tmpdir, force_field):
+    """
+    Make sure a pipeline resumes after the last stage with a checkpoint.
+    """
+    calls = []
+    system = _build_pipeline(tmpdir, force_field, calls).run()
+    assert calls == ['read', 'expensive', 'cheap']
+    assert np.allclose(system.molecules[0].nodes[0]['position'], [2, 4, 6])
+
+    calls = []
+    pipeline = _build_pipeline(tmpdir, force_field, calls, scale=3)
+    system = pipeline.run()
+    assert calls == ['cheap']
+    assert list(pipeline.timings) == ['cheap']
+    assert pipeline.data == {'count': 1}
+    assert np.allclose(system.molecules[0].nodes[0]['position'], [3, 6, 9])
+    assert system.force_field is force_field
+    assert system.molecules[0].force_field is force_field
+
+
+def test_stage_keys(tmpdir, force_field):
+    """
+    Make sure the key of a stage depends on the options of the stages before.
+    """
+    keys_2 = _build_pipeline(tmpdir, force_field, [], scale=2).stage_keys()
+    keys_3 = _build_pipeline(tmpdir, force_field, [], scale=3).stage_keys()
+    assert keys_2[:2] == keys_3[:2]
+    assert keys_2[2] != keys_3[2]
+    pipeline = _build_pipeline(tmpdir, force_field, [])
+    pipeline.key = 'other input'
+    assert not set(pipeline.stage_keys()) & set(keys_2)
+
+
+def test_unknown_force_field(tmpdir, force_field):
+    """
+    Make sure loading a checkpoint fails if a force field is unknown.
+    """
+    system = vermouth.System()
+    system.add_molecule(vermouth.Molecule(force_field=force_field))
+    path = str(tmpdir / 'system.ckpt')
+    pipeline_module.save_checkpoint(path, system)
+    loaded, data = pipeline_module.load_checkpoint(path, {'dummy': force_field})
+    assert loaded.molecules[0].force_field is force_field
+    assert data is None
+    with pytest.raises(KeyError):
+        pipeline_module.load_checkpoint(path, {})
+
+
+def test_checkpoint_temporary_file(tmpdir, force_field):
+    """
+    Make sure a checkpoint is not written through a fixed temporary name,
+    which another process writing the same checkpoint would share.
+    """
+    system = vermouth.System()
+    system.add_molecule(vermouth.Molecule(force_field=force_field))
+    path = tmpdir / 'system.ckpt'
+    # The temporary file of another process.
+    (tmpdir / 'system.ckpt.tmp').write('partial')
+    pipeline_module.save_checkpoint(str(path), system)
+    assert sorted(tmpdir.listdir()) == [path, tmpdir / 'system.ckpt.tmp']
+    assert (tmpdir / 'system.ckpt.tmp').read() == 'partial'
+    loaded, _ = pipeline_module.load_checkpoint(str(path), {'dummy': force_field})
+    assert len(loaded.molecules) == 1
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the profiling of the stages and of the processors.
+"""
+
+import json
+import os
+import pstats
+import tracemalloc
+
+import pytest
+
+import vermouth
+from vermouth.pipeline import Pipeline
+from vermouth.processors.processor import Processor
+from vermouth.profiling import Profiler
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def system():
+    """
+    A system with molecules of 1, 2, and 3 atoms.
+    """
+    system = vermouth.System()
+    for size in (1, 2, 3):
+        molecule = vermouth.Molecule()
+        molecule.add_nodes_from(range(size))
+        system.add_molecule(molecule)
+    return system
+
+
+class _Grow(Processor):
+    """
+    Add an atom to each molecule.
+    """
+    def run_molecule(self, molecule):
+        molecule.add_node(len(molecule))
+        return molecule
+
+
+class _DropFirst(Processor):
+    """
+    Remove the first molecule, then grow the others with a nested processor.
+    """
+    def run_system(self, system):
+        system.molecules = system.molecules[1:]
+        _Grow().run_system(system)
+
+
+class _Parent(Processor):
+    def run_molecule(self, molecule):
+        return molecule
+
+
+class _Child(_Parent):
+    """
+    Override run_system and call the one of the parent.
+    """
+    def run_system(self, system):
+        super().run_system(system)
+
+
+@pytest.fixture
+def profiler():
+    """
+    A profiler set for all the processors during the test.
+    """
+    profiler = Profiler()
+    Processor.profiler = profiler
+    yield profiler
+    Processor.profiler = None
+
+
+def test_processor(system, profiler):
+    """
+    Make sure a processor call is recorded with its molecules.
+    """
+    _Grow().run_system(system)
+    assert len(profiler.processors) == 1
+    record = profiler.processors[0]
+    assert record['name'] == '_Grow'
+    assert record['stage'] is None
+    assert (record['molecules_in'], record['atoms_in']) == (3, 6)
+    assert (record['molecules_out'], record['atoms_out']) == (3, 9)
+    assert [(timing['index'], timing['atoms']) for timing in record['molecule_timings']] \
+        == [(0, 1), (1, 2), (2, 3)]
+    assert record['wall'] >= sum(timing['wall'] for timing in record['molecule_timings'])
+    assert record['cpu'] >= 0
+
+
+def test_nested(system, profiler):
+    """
+    Make sure nested processors are recorded with their depth, and are not
+    counted twice in the totals.
+    """
+    _DropFirst().run_system(system)
+    assert [(record['name'], record['depth']) for record in profiler.processors] \
+        == [('_DropFirst', 0), ('_Grow', 1)]
+    assert profiler.processors[1]['atoms_in'] == 5
+    assert set(profiler.report()['total']) == {'_DropFirst'}
+
+
+def test_super(system, profiler):
+    """
+    Make sure a run_system that calls the one of its parent is recorded once.
+    """
+    _Child().run_system(system)
+    assert [record['name'] for record in profiler.processors] == ['_Child']
+    assert len(profiler.processors[0]['molecule_timings']) == 3
+
+
+def test_no_profiler(system):
+    """
+    Make sure nothing breaks without a profiler.
+    """
+    _DropFirst().run_system(system)
+    assert [len(molecule) for molecule in system.molecules] == [3, 4]
+
+
+def test_pipeline(system, tmpdir):
+    """
+    Make sure the stages of a pipeline are recorded, and their profiles
+    written.
+    """
+    profiler = Profiler(cprofile_dir=str(tmpdir / 'cprofile'))
+    grow = _Grow()
+    grow.profiler = profiler
+    pipeline = Pipeline(profiler=profiler)
+    pipeline.add_stage('first', lambda _: system)
+    pipeline.add_stage('grow', lambda system: grow.run_system(system) or system)
+    pipeline.run()
+
+    assert [stage['name'] for stage in profiler.stages] == ['first', 'grow']
+    assert profiler.stages[0]['atoms_in'] is None
+    assert profiler.stages[0]['atoms_out'] == 6
+    assert profiler.stages[1]['atoms_out'] == 9
+    assert [(record['name'], record['stage']) for record in profiler.processors] \
+        == [('_Grow', 'grow')]
+    assert sorted(os.listdir(str(tmpdir / 'cprofile'))) == ['00-first.prof', '01-grow.prof']
+    stats = pstats.Stats(profiler.stages[1]['cprofile'])
+    assert any(function == 'run_molecule' for _, _, function in stats.stats)
+
+    path = str(tmpdir / 'profile.json')
+    profiler.write(path)
+    with open(path) as infile:
+        report = json.load(infile)
+    assert report['total']['_Grow']['calls'] == 1
+    assert [stage['name'] for stage in report['stages']] == ['first', 'grow']
+
+
+def test_trace_memory(system):
+    """
+    Make sure the allocations and the footprints are recorded with
+    trace_memory, and the tracing stopped when closing if the profiler started it.
+    """
+    tracing = tracemalloc.is_tracing()
+    profiler = Profiler(trace_memory=True, top_allocations=3)
+    grow = _Grow()
+    grow.profiler = profiler
+    pipeline = Pipeline(profiler=profiler)
+    pipeline.add_stage('first', lambda _: system)
+    pipeline.add_stage('grow', lambda system: grow.run_system(system) or system)
+    pipeline.run()
+    profiler.close()
+
+    assert tracemalloc.is_tracing() == tracing
+    for stage in profiler.stages:
+        assert stage['traced_peak'] >= 0
+        assert len(stage['allocations']) <= 3
+    assert profiler.stages[1]['footprint']['atoms'] == 9
+    record = profiler.processors[0]
+    assert record['footprint']['atoms'] == 9
+    assert record['footprint']['node_dicts'] > 0
+    assert 'traced_delta' in record
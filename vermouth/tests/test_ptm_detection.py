@@ -191,3 +191,51 @@ def test_identify_ptms(known_ptm_graphs, atoms, edges, expected):
     found = canmod.identify_ptms(molecule, ptms, known_ptms)
     found = [(ptm.name, match) for ptm, match in found]
     assert found == expected
+
+
+def _many_protons(num_protons, extra_atoms=()):
+    """
+    Build a nitrogen with `num_protons` unknown hydrogens, and `extra_atoms`
+    unknown atoms attached to it.
+    """
+    atoms = {0: {'atomname': 'N', 'PTM_atom': False, 'element': 'N', 'resid': 1}}
+    edges = []
+    for idx in range(1, num_protons + 1):
+        atoms[idx] = {'atomname': 'H', 'PTM_atom': True, 'element': 'H', 'resid': 1}
+        edges.append((0, idx))
+    for idx, element in enumerate(extra_atoms, start=num_protons + 1):
+        atoms[idx] = {'atomname': element, 'PTM_atom': True,
+                      'element': element, 'resid': 1}
+        edges.append((0, idx))
+    return make_molecule(atoms, edges)
+
+
+def test_identify_ptms_many_overlapping(known_ptm_graphs):
+    """
+    Make sure a residue carrying many modifications sharing an anchor is
+    covered with one PTM per modified atom.
+    """
+    molecule = _many_protons(12)
+    ptms = canmod.find_ptm_atoms(molecule)
+    known_ptms = [(ptm_graph, canmod.PTMGraphMatcher(molecule, ptm_graph))
+                  for ptm_graph in known_ptm_graphs]
+
+    found = canmod.identify_ptms(molecule, ptms, known_ptms)
+
+    assert [ptm.name for ptm, _ in found] == ['NH'] * 12
+    covered = [idx for _, match in found for idx in match if idx != 0]
+    assert sorted(covered) == list(range(1, 13))
+
+
+def test_identify_ptms_no_cover(known_ptm_graphs):
+    """
+    Make sure the absence of a cover is reported, without exploring every
+    combination of the modifications that do match.
+    """
+    molecule = _many_protons(12, extra_atoms=('O', ))
+    ptms = canmod.find_ptm_atoms(molecule)
+    known_ptms = [(ptm_graph, canmod.PTMGraphMatcher(molecule, ptm_graph))
+                  for ptm_graph in known_ptm_graphs]
+
+    with pytest.raises(KeyError):
+        canmod.identify_ptms(molecule, ptms, known_ptms)
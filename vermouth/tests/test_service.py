@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the local request service with a small client.
+"""
+
+import os
+import threading
+
+import pytest
+
+from vermouth import service
+
+# pylint: disable=redefined-outer-name
+
+
+def _handler(request):
+    """
+    Count the letters of the 'text' of a request, and report the process.
+    """
+    text = request['text']
+    if not text:
+        raise ValueError('nothing to count')
+    return {'length': len(text), 'pid': os.getpid()}
+
+
+@pytest.fixture(params=['unix', 'tcp'])
+def address(request, tmpdir):
+    """
+    The address of a running server, on a Unix socket or a local TCP port.
+    """
+    if request.param == 'unix':
+        requested = str(tmpdir / 'service.sock')
+    else:
+        requested = ('127.0.0.1', 0)
+    server = service.RequestServer(requested, _handler, max_workers=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server.address
+    server.shutdown()
+    thread.join()
+    server.close()
+    if request.param == 'unix':
+        assert not os.path.exists(requested)
+
+
+def test_request(address):
+    """
+    Make sure the requests of a connection are answered in order, with their
+    timings, and that the errors are reported.
+    """
+    with service.Client(address, timeout=30) as client:
+        response = client.request({'id': 'first', 'text': 'abc'})
+        assert response['id'] == 'first'
+        assert response['status'] == 'ok'
+        assert response['result']['length'] == 3
+        assert response['result']['pid'] != os.getpid()
+        assert set(response['timings']) == {'queued', 'processing', 'total'}
+        assert response['timings']['total'] >= response['timings']['processing']
+
+        response = client.request({'id': 2, 'text': ''})
+        assert response['status'] == 'error'
+        assert response['error'] == 'ValueError: nothing to count'
+        response = client.request({'id': 3})
+        assert response['error'] == "KeyError: 'text'"
+
+
+def test_invalid_request(address):
+    """
+    Make sure invalid JSON does not break the connection.
+    """
+    with service.Client(address, timeout=30) as client:
+        # pylint: disable=protected-access
+        client._socket.sendall(b'not json\n[1, 2]\n')
+        for _ in range(2):
+            line = client._file.readline()
+            assert b'"status": "error"' in line
+            assert b'Invalid request' in line
+        assert client.request({'text': 'ab'})['result']['length'] == 2
+
+
+def test_concurrent_clients(address):
+    """
+    Make sure several clients are answered at the same time.
+    """
+    responses = []
+
+    def send(text):
+        with service.Client(address, timeout=30) as client:
+            responses.append(client.request({'id': text, 'text': text}))
+
+    threads = [threading.Thread(target=send, args=('x' * size, ))
+               for size in range(1, 7)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(response['result']['length'] for response in responses) \
+        == list(range(1, 7))
+
+
+@pytest.mark.parametrize('address, expected', (
+    ('localhost:8080', ('localhost', 8080)),
+    ('127.0.0.1:0', ('127.0.0.1', 0)),
+    ('/tmp/martinize.sock', '/tmp/martinize.sock'),
+    ('relative:name', 'relative:name'),
+    (':80', ':80'),
+))
+def test_parse_address(address, expected):
+    """
+    Make sure host:port addresses are told apart from socket paths.
+    """
+    assert service.parse_address(address) == expected
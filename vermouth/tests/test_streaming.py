@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test streaming molecules through steps.
+"""
+
+import os
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+import vermouth
+from vermouth.processors.processor import Processor
+from vermouth.streaming import Barrier, stream_molecules
+from vermouth.tests.datafiles import PDB_PROTEIN
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def system():
+    """
+    A system with 5 molecules of one node, each named after its index.
+    """
+    system = vermouth.System()
+    for idx in range(5):
+        molecule = vermouth.Molecule()
+        molecule.add_node(0, name=str(idx))
+        system.add_molecule(molecule)
+    return system
+
+
+def _names(molecules):
+    return [molecule.nodes[0]['name'] for molecule in molecules]
+
+
+class _Recorder(Processor):
+    """
+    Record the molecules of the systems the processor runs on.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def run_system(self, system):
+        self.calls.append(_names(system.molecules))
+
+
+@pytest.mark.parametrize('batch_size', (1, 2, 5, 7))
+def test_batches(system, batch_size):
+    """
+    Make sure steps see batches of molecules, barriers see all the
+    molecules, and the order is kept.
+    """
+    before = _Recorder()
+    barrier = _Recorder()
+    after = _Recorder()
+    _, molecules = stream_molecules(
+        system, [before, Barrier(barrier), after], batch_size=batch_size,
+    )
+    assert not before.calls
+    assert _names(molecules) == ['0', '1', '2', '3', '4']
+    expected = [['0', '1', '2', '3', '4'][start:start + batch_size]
+                for start in range(0, 5, batch_size)]
+    assert before.calls == expected
+    assert after.calls == expected
+    assert barrier.calls == [['0', '1', '2', '3', '4']]
+    assert not system.molecules
+
+
+def test_callables(system):
+    """
+    Make sure callables can remove molecules, and replace the system.
+    """
+    def drop_odd(system):
+        system.molecules = [
+            molecule for molecule in system.molecules
+            if int(molecule.nodes[0]['name']) % 2 == 0
+        ]
+
+    def reverse(system):
+        new_system = vermouth.System()
+        for molecule in reversed(system.molecules):
+            new_system.add_molecule(molecule)
+        return new_system
+
+    _, molecules = stream_molecules(system, [drop_odd, Barrier(reverse)])
+    assert _names(molecules) == ['4', '2', '0']
+
+
+def test_context(system):
+    """
+    Make sure the changes a step makes to the force field are kept, and
+    given to the next batches.
+    """
+    force_field = vermouth.forcefield.ForceField('dummy')
+    seen = []
+
+    def set_force_field(system):
+        system.force_field = force_field
+
+    def record(system):
+        seen.append(system.force_field)
+
+    context, molecules = stream_molecules(
+        system, [record, set_force_field, record], batch_size=2,
+    )
+    assert context.force_field is None
+    list(molecules)
+    assert context.force_field is force_field
+    assert seen == [None] + [force_field] * 5
+    assert system.force_field is None
+
+
+def test_batch_size(system):
+    """
+    Make sure a batch size below 1 is refused.
+    """
+    with pytest.raises(ValueError):
+        stream_molecules(system, [], batch_size=0)
+
+
+MARTINIZE2 = Path(vermouth.__file__).parent.parent / 'bin' / 'martinize2'
+
+
+@pytest.mark.skipif(not MARTINIZE2.exists(), reason='martinize2 is not available')
+@pytest.mark.parametrize('options', (
+    ['-nproc', '2'],
+    ['-cache', 'cache'],
+))
+def test_martinize2_stream_ss(tmpdir, options):
+    """
+    Make sure the secondary structure sequence reaches the ITP header when
+    streaming, also through a process pool and a cache.
+    """
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        [str(MARTINIZE2.parent.parent)] + environment.get('PYTHONPATH', '').split(os.pathsep)
+    )
+    # The version cannot be found from the git repository outside of it.
+    environment.setdefault('PBR_VERSION', vermouth.__version__)
+    command = [sys.executable, str(MARTINIZE2), '-f', str(PDB_PROTEIN),
+               '-x', 'cg.pdb', '-o', 'topol.top', '-ss', 'H', '-stream', '10']
+    # With a cache, the second run reads the molecule back.
+    for _ in range(2 if '-cache' in options else 1):
+        subprocess.check_call(command + options, cwd=str(tmpdir), env=environment,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        header = (tmpdir / 'molecule_0.itp').read().splitlines()
+        idx = header.index('; was used for this molecule:')
+        assert set(header[idx + 1][2:]) == {'H'}
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the mapping of trajectories with :mod:`vermouth.trajectory`.
+"""
+
+import numpy as np
+import pytest
+
+import vermouth
+from vermouth import trajectory
+from vermouth.processors import average_beads
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def atomistic():
+    """
+    An atomistic molecule as read from a file.
+    """
+    molecule = vermouth.Molecule()
+    random = np.random.RandomState(3)
+    for key in range(6):
+        molecule.add_node(key, atomname='A{}'.format(key), mass=key + 1.0,
+                          position=random.uniform(0, 3, size=3))
+    molecule.add_edges_from(zip(range(5), range(1, 6)))
+    trajectory.set_frame_indices(molecule)
+    # An atom added when repairing the graph; it is not in the frames.
+    molecule.add_node(10, atomname='X', mass=1.0)
+    molecule.add_edge(4, 10)
+    return molecule
+
+
+@pytest.fixture
+def system(atomistic):
+    """
+    A system at the target resolution built from :func:`atomistic`.
+
+    Bead 0 is built directly from atoms, bead 1 from an intermediate particle,
+    bead 2 is a dummy attached to bead 1, and bead 3 is not attached to
+    anything.
+    """
+    intermediate = vermouth.Molecule()
+    intermediate.add_node('i', graph=atomistic.subgraph([3, 4, 10]),
+                          mapping_weights={3: 2})
+    average_beads.do_average_bead(intermediate, weight='mass')
+    molecule = vermouth.Molecule()
+    molecule.add_node(0, graph=atomistic.subgraph([0, 1, 2]),
+                      mapping_weights={0: 1, 1: 2, 2: 3})
+    molecule.add_node(1, graph=intermediate.subgraph(['i']),
+                      position=intermediate.nodes['i']['position'])
+    molecule.add_node(2, position=np.array([5.0, 5.0, 5.0]))
+    molecule.add_node(3, position=np.array([-1.0, 0.0, 1.0]))
+    molecule.add_edge(0, 1)
+    molecule.add_edge(1, 2)
+    molecule.nodes[0]['position'] = average_beads.do_average_bead(
+        molecule.subgraph([0]), weight='mass'
+    ).nodes[0]['position']
+
+    system = vermouth.System()
+    system.add_molecule(molecule)
+    return system
+
+
+def _first_frame(atomistic):
+    return np.stack([atomistic.nodes[key]['position'] for key in range(6)])
+
+
+def test_first_frame(atomistic, system):
+    """
+    Make sure mapping the frame the topology was built from reproduces the
+    positions of the system.
+    """
+    mapper = trajectory.TrajectoryMapper(system, weight='mass')
+    positions = mapper.map_frame(_first_frame(atomistic))
+    expected = np.stack([node['position'] for node in system.molecules[0].nodes.values()])
+    assert mapper.n_particles == 4
+    assert np.allclose(positions, expected)
+
+
+def test_frames(atomistic, system):
+    """
+    Make sure the particles follow the atoms.
+    """
+    mapper = trajectory.TrajectoryMapper(system, weight=False)
+    first = _first_frame(atomistic)
+    shift = np.array([0.5, -1.0, 2.0])
+    frames = np.stack([first, first + shift, first * 2])
+    positions = mapper.map_frame(frames)
+    assert positions.shape == (3, 4, 3)
+
+    assert np.allclose(positions[0, 0], np.average(first[:3], axis=0, weights=[1, 2, 3]))
+    assert np.allclose(positions[0, 1], np.average(first[3:5], axis=0, weights=[2, 1]))
+    # Translating the atoms translates the particles, but the lonely one.
+    assert np.allclose(positions[1, :3], positions[0, :3] + shift)
+    assert np.allclose(positions[:, 3], [-1.0, 0.0, 1.0])
+    # The dummy keeps its offset to its anchor.
+    offset = system.molecules[0].nodes[2]['position'] - system.molecules[0].nodes[1]['position']
+    assert np.allclose(positions[:, 2] - positions[:, 1], offset)
+
+    streamed = list(mapper.map_frames((frame, 'box') for frame in frames))
+    assert [box for _, box in streamed] == ['box'] * 3
+    assert np.allclose(np.stack([frame for frame, _ in streamed]), positions)
+
+
+def test_missing_weight(system):
+    """
+    Make sure the weight is required on the atoms.
+    """
+    del system.molecules[0].nodes[0]['graph'].nodes[1]['mass']
+    with pytest.raises(KeyError):
+        trajectory.TrajectoryMapper(system, weight='mass')
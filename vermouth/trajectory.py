@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 University of Groningen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Map the frames of an atomistic trajectory to the resolution of a system that
+went through the mapping.
+
+The topology is built once, from a single structure. The other frames are
+then mapped as coordinate arrays, without building graphs.
+"""
+
+import numpy as np
+
+from .processors.average_beads import MappingMatrix, resolve_weight
+
+#: Node attribute that stores the row of an atom in the frames.
+FRAME_INDEX = 'frame_index'
+
+
+def set_frame_indices(molecule, attribute=FRAME_INDEX):
+    """
+    Record, for each atom, its row in the frames of the file it was read from.
+
+    The PDB and GRO readers number the atoms in the order of the file, so the
+    row of an atom is its node key. This must be called on the molecule as it
+    is read, before the keys get shuffled or atoms get added.
+
+    Parameters
+    ----------
+    molecule: vermouth.molecule.Molecule
+        The molecule as read from the file.
+    attribute: collections.abc.Hashable
+        The node attribute to set.
+    """
+    for key, node in molecule.nodes.items():
+        node[attribute] = key
+
+
+def _underlying_atoms(node, attribute, weight):
+    """
+    Find the atoms a particle is built from.
+
+    The 'graph' of a particle can contain atoms, or particles at an
+    intermediate resolution that have their own 'graph'. The atoms are the
+    nodes that have the `attribute` node attribute.
+
+    Yields
+    ------
+    tuple[int, float]
+        The row of each atom in the frames and its weight.
+    """
+    graph = node.get('graph')
+    if not graph:
+        return
+    mapping_weights = node.get('mapping_weights', {})
+    for subnode_key, subnode in graph.nodes.items():
+        if subnode.get(attribute) is not None:
+            if weight is not None and weight not in subnode:
+                raise KeyError('Not all underlying atoms have an attribute {}.'
+                               .format(weight))
+            yield (subnode[attribute],
+                   mapping_weights.get(subnode_key, 1) * subnode.get(weight, 1))
+        else:
+            yield from _underlying_atoms(subnode, attribute, weight)
+
+
+class TrajectoryMapper:
+    """
+    Compute the positions of the particles of a system from atomistic frames.
+
+    The particles that have a 'graph' attribute are placed at the weighted
+    average of their underlying atoms, the same way
+    :class:`~vermouth.processors.average_beads.DoAverageBead` does. Underlying
+    atoms that are not in the frames, such as the atoms added when repairing
+    the graph, are left out of the average.
+
+    The other particles, such as charge dummies, keep the offset they have in
+    the system to their first neighbor that is placed from atoms. Particles
+    without such a neighbor keep the position they have in the system.
+
+    The positions are given for the particles of each molecule in turn, in
+    the order of the nodes in the molecules.
+
+    Parameters
+    ----------
+    system: vermouth.system.System
+        The system at the target resolution. The underlying atoms must have
+        the `attribute` node attribute set by :func:`set_frame_indices`.
+    weight: collections.abc.Hashable or bool or None
+        The attribute used to weight the average. See
+        :func:`~vermouth.processors.average_beads.resolve_weight`.
+    attribute: collections.abc.Hashable
+        The node attribute that stores the row of the atoms in the frames.
+
+    Attributes
+    ----------
+    matrix: vermouth.processors.average_beads.MappingMatrix
+        The weights of the atoms for each particle. The atom keys are the rows
+        of the atoms in the frames.
+    n_particles: int
+        The number of particles in the system.
+    """
+    def __init__(self, system, weight=None, attribute=FRAME_INDEX):
+        particle_keys = []
+        frame_indices = []
+        rows = []
+        weights = []
+        reference = []
+        offset = 0
+        for molecule in system.molecules:
+            molecule_weight = resolve_weight(molecule, weight)
+            for row, (key, node) in enumerate(molecule.nodes.items(), start=offset):
+                particle_keys.append(key)
+                reference.append(node.get('position', np.full(3, np.nan)))
+                for frame_index, atom_weight in _underlying_atoms(
+                        node, attribute, molecule_weight):
+                    frame_indices.append(frame_index)
+                    rows.append(row)
+                    weights.append(atom_weight)
+            offset += len(molecule)
+        self.n_particles = offset
+        self.matrix = MappingMatrix(particle_keys, frame_indices, rows, weights)
+        self._columns = np.asarray(frame_indices, dtype=int)
+
+        reference = np.array(reference, dtype=float).reshape((-1, 3))
+        mapped = np.zeros(self.n_particles, dtype=bool)
+        mapped[self.matrix.rows] = True
+        free_rows = []
+        anchor_rows = []
+        fixed_rows = []
+        offset = 0
+        for molecule in system.molecules:
+            row_of = {key: offset + idx for idx, key in enumerate(molecule)}
+            for key in molecule:
+                if mapped[row_of[key]]:
+                    continue
+                anchors = [row_of[neighbor] for neighbor in molecule[key]
+                           if mapped[row_of[neighbor]]]
+                if anchors:
+                    free_rows.append(row_of[key])
+                    anchor_rows.append(anchors[0])
+                else:
+                    fixed_rows.append(row_of[key])
+            offset += len(molecule)
+        self._free_rows = np.asarray(free_rows, dtype=int)
+        self._anchor_rows = np.asarray(anchor_rows, dtype=int)
+        self._offsets = reference[self._free_rows] - reference[self._anchor_rows]
+        self._fixed_rows = np.asarray(fixed_rows, dtype=int)
+        self._fixed_positions = reference[self._fixed_rows]
+
+    def map_frame(self, frame):
+        """
+        Compute the positions of the particles for one or many frames.
+
+        Parameters
+        ----------
+        frame: numpy.ndarray
+            The coordinates of the atoms as an (n_atoms, 3) array, or as an
+            (n_frames, n_atoms, 3) array.
+
+        Returns
+        -------
+        numpy.ndarray
+            The positions of the particles as an (n_particles, 3) array, or as
+            an (n_frames, n_particles, 3) array. Particles that cannot be
+            placed get 'nan' coordinates.
+        """
+        frame = np.asarray(frame, dtype=float)
+        positions = self.matrix.apply(frame[..., self._columns, :])
+        positions[..., self._free_rows, :] = (
+            positions[..., self._anchor_rows, :] + self._offsets
+        )
+        positions[..., self._fixed_rows, :] = self._fixed_positions
+        return positions
+
+    def map_frames(self, frames):
+        """
+        Map a stream of frames.
+
+        Parameters
+        ----------
+        frames: collections.abc.Iterable[tuple[numpy.ndarray, numpy.ndarray]]
+            The coordinates and the box of each frame, as yielded by
+            :func:`vermouth.pdb.pdb.iter_pdb_frames` or
+            :func:`vermouth.gmx.gro.iter_gro_frames`.
+
+        Yields
+        ------
+        tuple[numpy.ndarray, numpy.ndarray]
+            The positions of the particles and the box for each frame, as
+            expected by :func:`vermouth.pdb.pdb.write_pdb_frames` and
+            :func:`vermouth.gmx.gro.write_gro_frames`.
+        """
+        for coordinates, box in frames:
+            yield self.map_frame(coordinates), box